@@ -1,9 +1,37 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
-from datetime import datetime, timedelta
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, Response
+from datetime import date, datetime, timedelta
 import uuid
 import json
 import os
+import threading
+import time
+import atexit
+import heapq
+import click
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
+from itertools import islice
+from operator import itemgetter
+
+import numpy as np
+from sortedcontainers import SortedList
+
+from blood_rules import (BLOOD_COMPATIBILITY, BLOOD_GROUPS, COMPONENT_COMPATIBILITY, DEFAULT_COMPONENT, can_donate,
+                         codes_in, compatible_donor_mask, group_code, groups_in, groups_mask, is_compatible,
+                         recipient_mask, set_last_donation, today_ordinal)
+from bulk_import import FORMATS, blank_required_error, detect_format, iter_rows, run_import
+from exports import EXPORT_FORMATS, MIMETYPES, parquet_available, stream_export
+from forecast import InventoryForecaster
+from geo import GeoGrid, PincodeGeocoder, haversine_km
+from location_index import SubstringIndex
+from matching import CONTACT_TIME_CODES, DonorColumns
+from notify import LogBackend, Outbox
+from persistence import WriteAheadLog, collect_stores
+from queries import MATCH_LIMIT, dashboard_pages, match_blood_request as match_request, match_result
+from request_queue import PriorityQueue, RequestFeed
+from shared_state import SharedStateClient
+from storage import STORES, Repository
+from transaction_log import TransactionLog
 
 app = Flask(__name__)
 app.secret_key = 'hemalink-secret-key-2026'
@@ -25,9 +53,6 @@ donations_db = {}
 # Donation Fulfillments - tracks donor to requestor donations: {fulfillment_id: fulfillment_data}
 donation_fulfillments_db = {}
 
-# Inventory transactions - tracks all inventory changes
-inventory_transactions_db = []
-
 # Blood inventory by blood group
 blood_inventory = {
     'A+': {'units': 50, 'donors': []},
@@ -40,19 +65,232 @@ blood_inventory = {
     'O-': {'units': 40, 'donors': []}
 }
 
-# ============== BLOOD COMPATIBILITY MATRIX ==============
-# Who can receive from whom
-BLOOD_COMPATIBILITY = {
-    'A+': ['A+', 'A-', 'O+', 'O-'],
-    'A-': ['A-', 'O-'],
-    'B+': ['B+', 'B-', 'O+', 'O-'],
-    'B-': ['B-', 'O-'],
-    'AB+': ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-'],  # Universal recipient
-    'AB-': ['A-', 'B-', 'AB-', 'O-'],
-    'O+': ['O+', 'O-'],
-    'O-': ['O-']  # Universal donor
+# Inventory transactions - tracks all inventory changes, partitioned by day with daily/hourly rollups
+# Raw transactions are kept for HEMALINK_TRANSACTION_RAW_DAYS days, hourly rollups for
+# HEMALINK_TRANSACTION_HOURLY_DAYS days, and daily rollups for good
+TRANSACTION_TYPES = ['add', 'remove', 'donated', 'withdrawn']
+inventory_transactions_db = TransactionLog(blood_inventory, TRANSACTION_TYPES,
+                                           raw_days=int(os.getenv('HEMALINK_TRANSACTION_RAW_DAYS', '90')),
+                                           hourly_days=int(os.getenv('HEMALINK_TRANSACTION_HOURLY_DAYS', '400')))
+
+# ============== PERSISTENCE ==============
+# Set HEMALINK_DATA_DIR to keep the stores above in a write-ahead log with snapshots;
+# without it data lives only in process memory and sample data is seeded on start
+# Set HEMALINK_SHARED_STATE to the socket of a shared_state.py store process to share the
+# stores between worker processes; the store process then owns the data directory
+
+DATA_DIR = os.getenv('HEMALINK_DATA_DIR')
+SHARED_STATE_SOCKET = os.getenv('HEMALINK_SHARED_STATE')
+wal = WriteAheadLog(DATA_DIR,
+                    fsync_interval=float(os.getenv('HEMALINK_WAL_FSYNC_INTERVAL', '0.05')),
+                    snapshot_every=int(os.getenv('HEMALINK_SNAPSHOT_EVERY', '100000'))
+                    ) if DATA_DIR and not SHARED_STATE_SOCKET else None
+shared_state = SharedStateClient(SHARED_STATE_SOCKET,
+                                 follow_interval=float(os.getenv('HEMALINK_SHARED_FOLLOW_INTERVAL', '0.05'))
+                                 ) if SHARED_STATE_SOCKET else None
+
+# Stores covered by the write-ahead log, by log name
+PERSISTED_STORES = {
+    'donors': donors_db,
+    'requestors': requestors_db,
+    'blood_requests': blood_requests_db,
+    'donations': donations_db,
+    'donation_fulfillments': donation_fulfillments_db,
+    'transaction_log': inventory_transactions_db,
+    'inventory': blood_inventory
 }
 
+# ============== DONOR INDEXES ==============
+# Secondary indexes over donors_db, kept in sync by index_donor()
+
+# Donors by blood group: {blood_group: set(donor_ids)}
+donors_by_group = {bg: set() for bg in BLOOD_COMPATIBILITY}
+
+# Donors that are available and active: set(donor_ids)
+active_donor_ids = set()
+
+# Available, active donors by blood group code (blood_rules.GROUP_CODES): [set(donor_ids)]
+# A compatible-donor lookup unions the buckets set in the recipient's group mask
+active_donors_by_code = [set() for _ in BLOOD_GROUPS]
+
+# Donors by normalized city: {city: set(donor_ids)}
+donors_by_city = {}
+
+# Keys each donor is currently indexed under: {donor_id: (blood_group, active, city, point)}
+donor_index_keys = {}
+
+# Available, active donors placed at their pincode centroid: {blood_group: GeoGrid}
+pincode_geocoder = PincodeGeocoder()
+donor_geo_by_group = {bg: GeoGrid() for bg in BLOOD_COMPATIBILITY}
+
+# Default search radius when a request can be placed on the map
+MATCH_RADIUS_KM = 50
+
+# Substring indexes for location search: lowercased city and state, pincode as entered
+donor_city_search = SubstringIndex()
+donor_state_search = SubstringIndex()
+donor_pincode_search = SubstringIndex()
+
+# Registration order of donors, so indexed searches list results like donors_db does
+donor_order = {}
+
+# Checking one candidate donor against location matches costs about as much as
+# merging this many IDs from the index
+LOCATION_FILTER_COST = 8
+
+# Columnar donor attributes for vectorized matching
+donor_columns = DonorColumns()
+
+# Donor and request IDs in sorted order, for cursor pagination
+donor_ids_sorted = SortedList()
+request_ids_sorted = SortedList()
+
+# ============== DASHBOARD INDEXES ==============
+# Pre-sorted keys so the admin dashboard can slice out one page without sorting
+
+# Donor IDs by blood group: {blood_group: SortedList(donor_ids)}
+donor_ids_by_group = {bg: SortedList() for bg in BLOOD_COMPATIBILITY}
+
+# Requests by creation time: SortedList((created_at, request_id)), also split by status
+requests_by_created = SortedList()
+requests_by_status_created = {}
+
+# Donations by date: SortedList((donation_date, donation_id)), also split by blood group
+donations_by_date = SortedList()
+donations_by_group_date = {bg: SortedList() for bg in BLOOD_COMPATIBILITY}
+
+DASHBOARD_PAGE_SIZE = 50
+
+# ============== EXPORTS ==============
+
+# Index keys read at a time while streaming an export
+EXPORT_PAGE_SIZE = 1000
+
+# Export schemas: (field, type) columns of each exportable dataset
+EXPORT_SCHEMAS = {
+    'donations': [
+        ('donation_id', str), ('donor_id', str), ('donor_name', str), ('blood_group', str), ('units', int),
+        ('donation_date', str), ('donation_time', str), ('donation_center', str), ('donation_type', str),
+        ('request_id', str), ('requestor_id', str), ('status', str)
+    ],
+    'inventory-transactions': [
+        ('timestamp', str), ('blood_group', str), ('units', int), ('type', str), ('details', str)
+    ]
+}
+
+# ============== REQUEST PRIORITY QUEUE ==============
+# Open requests ordered by how critical they are, kept in sync by reprioritize_request()
+
+OPEN_REQUEST_STATUSES = ('pending', 'partial')
+URGENCY_RANK = {'critical': 0, 'high': 1, 'normal': 2}
+
+open_requests_queue = PriorityQueue()
+
+# Donor dashboard feed: open requests filed under (component, blood group code) and
+# (component, blood group code, city), each bucket ordered by feed_priority()
+request_feed = RequestFeed()
+
+# Number of critical requests shown on the admin dashboard
+DASHBOARD_CRITICAL_COUNT = 10
+
+# Number of open requests a donor is shown on their dashboard
+DONOR_HELP_COUNT = 10
+
+# ============== API SETTINGS ==============
+
+API_DEFAULT_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+
+# Fields /api/donors can return, and the default projection (no medical or emergency contact data)
+DONOR_API_FIELDS = [
+    'donor_id', 'name', 'email', 'phone', 'age', 'gender', 'blood_group', 'weight',
+    'address', 'city', 'state', 'pincode', 'medical_history', 'available', 'status',
+    'total_donations', 'last_donation', 'registered_at', 'emergency_contact', 'preferred_contact_time'
+]
+DONOR_API_DEFAULT_FIELDS = [
+    'donor_id', 'name', 'age', 'gender', 'blood_group', 'city', 'state', 'pincode',
+    'available', 'status', 'total_donations', 'last_donation', 'registered_at', 'preferred_contact_time'
+]
+
+# Fields /api/requests can return, and the default projection (no per-donor lists)
+REQUEST_API_FIELDS = [
+    'request_id', 'requestor_id', 'patient_name', 'patient_age', 'patient_gender', 'blood_group',
+    'units_needed', 'hospital_name', 'hospital_address', 'hospital_pincode', 'location', 'city', 'state',
+    'contact_name', 'contact_phone', 'contact_email', 'urgency', 'required_date', 'reason',
+    'status', 'created_at', 'fulfilled_units', 'matched_donors', 'accepted_donors', 'donor_donations'
+]
+REQUEST_API_DEFAULT_FIELDS = [
+    'request_id', 'requestor_id', 'patient_name', 'patient_age', 'patient_gender', 'blood_group',
+    'units_needed', 'hospital_name', 'hospital_address', 'hospital_pincode', 'location', 'city', 'state',
+    'contact_name', 'contact_phone', 'contact_email', 'urgency', 'required_date', 'reason',
+    'status', 'created_at', 'fulfilled_units'
+]
+
+# ============== STATISTICS COUNTERS ==============
+# Running counters behind get_statistics(), updated on every write
+
+# Blood requests by status: {status: count}
+request_status_counts = {}
+
+# Total units across all blood groups
+inventory_totals = {'units': sum(inv['units'] for inv in blood_inventory.values())}
+
+# ============== INVENTORY LEDGER ==============
+# Every change to blood_inventory units happens under that blood group's lock
+
+inventory_locks = {bg: threading.Lock() for bg in blood_inventory}
+inventory_totals_lock = threading.Lock()
+
+# Held while a transaction takes its sequence number and is logged, so the log
+# holds transactions in sequence order (replay skips any that arrive out of order)
+inventory_transactions_lock = threading.Lock()
+
+# Units taken out of stock but not yet committed: {reservation_id: reservation}
+inventory_reservations = {}
+
+# ============== INVENTORY FORECAST ==============
+# Daily demand and supply per blood group, fitted from the transaction log, and the
+# projected days until each group runs out
+
+inventory_forecaster = InventoryForecaster(inventory_transactions_db,
+                                           half_life_days=float(os.getenv('HEMALINK_FORECAST_HALF_LIFE_DAYS', '14')))
+
+# A group is critical when it is projected to run out within this many days (and warned about earlier)
+STOCKOUT_CRITICAL_DAYS = 3
+STOCKOUT_WARNING_DAYS = 7
+
+# Hard floor: fewer units than this is critical whatever the forecast
+CRITICAL_UNITS = 20
+
+# ============== DONOR RECALL CAMPAIGNS ==============
+# When a blood group runs short, eligible donors of that group and the groups it can
+# receive from are notified through a rate-limited background sender
+
+campaigns_db = {}
+
+# Day each donor was last sent a recall: {donor_id: day number}; donors are not recalled again within
+# RECALL_COOLDOWN_DAYS, and a group gets at most one automatic campaign per RECALL_CAMPAIGN_INTERVAL_HOURS
+recalled_on = {}
+RECALL_COOLDOWN_DAYS = 14
+RECALL_CAMPAIGN_INTERVAL_HOURS = 24
+last_auto_campaign = {}
+campaigns_lock = threading.Lock()
+
+# Local hours of each preferred contact time (Anytime has no window)
+CONTACT_WINDOWS = {'Morning': (8, 12), 'Afternoon': (12, 17), 'Evening': (17, 21)}
+
+# Campaigns select donors on this thread, so neither admin requests nor inventory writes wait for them
+campaign_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='recall-campaign')
+
+# ============== LIVE STATISTICS STREAM ==============
+# Dashboard streams block on this condition until a write bumps the version
+
+stats_changed = threading.Condition()
+stats_version = {'value': 0}
+
+# Seconds between keep-alive comments on an idle statistics stream
+STATS_STREAM_KEEPALIVE = 15
+
 # ============== HELPER FUNCTIONS ==============
 
 def generate_donor_id():
@@ -71,109 +309,484 @@ def generate_donation_id():
     """Generate unique donation ID"""
     return f"DN-{uuid.uuid4().hex[:8].upper()}"
 
-def get_compatible_donors(blood_group, location=None):
+def persist(*op):
+    """Append a mutation to the write-ahead log or the shared-state log (no-op when both are off)"""
+    if wal:
+        wal.append(*op)
+    elif shared_state:
+        shared_state.record(op)
+
+def persist_record(store, record_id, record):
+    """Log the current state of a record in a dict store"""
+    persist('put', store, record_id, record)
+
+def normalize_location(value):
+    """Normalize a city/state/pincode value for indexing"""
+    return (value or '').strip().lower()
+
+def _discard_from_bucket(buckets, key, donor_id):
+    """Remove a donor ID from an index bucket, dropping empty buckets"""
+    bucket = buckets.get(key)
+    if bucket is not None:
+        bucket.discard(donor_id)
+        if not bucket:
+            del buckets[key]
+
+def unindex_donor(donor_id):
+    """Remove a donor from all secondary indexes"""
+    keys = donor_index_keys.pop(donor_id, None)
+    if not keys:
+        return
+    blood_group, active, city, point = keys
+    donors_by_group.get(blood_group, set()).discard(donor_id)
+    if active:
+        active_donor_ids.discard(donor_id)
+        if group_code(blood_group) >= 0:
+            active_donors_by_code[group_code(blood_group)].discard(donor_id)
+        if point and blood_group in donor_geo_by_group:
+            donor_geo_by_group[blood_group].remove(donor_id)
+    _discard_from_bucket(donors_by_city, city, donor_id)
+
+def index_donor(donor):
     """
-    Find compatible donors for a blood group
-    Returns list of compatible donor IDs
+    Add or refresh a donor in the secondary indexes
+    Call after every write to a donor record
+    """
+    donor_id = donor['donor_id']
+    persist_record('donors', donor_id, donor)
+    if donor_id not in donor_index_keys:
+        donor_ids_sorted.add(donor_id)
+        donor_ids_by_group.setdefault(donor['blood_group'], SortedList()).add(donor_id)
+        donor_order.setdefault(donor_id, len(donor_order))
+    donor_columns.upsert(donor)
+    donor_city_search.add(donor_id, (donor.get('city') or '').lower())
+    donor_state_search.add(donor_id, (donor.get('state') or '').lower())
+    donor_pincode_search.add(donor_id, donor.get('pincode') or '')
+    keys = (
+        donor['blood_group'],
+        bool(donor['available'] and donor['status'] == 'active'),
+        normalize_location(donor.get('city')),
+        pincode_geocoder.locate(donor.get('pincode'))
+    )
+    if donor_index_keys.get(donor_id) == keys:
+        return
+    
+    unindex_donor(donor_id)
+    blood_group, active, city, point = keys
+    donors_by_group.setdefault(blood_group, set()).add(donor_id)
+    if active:
+        active_donor_ids.add(donor_id)
+        if group_code(blood_group) >= 0:
+            active_donors_by_code[group_code(blood_group)].add(donor_id)
+        if point and blood_group in donor_geo_by_group:
+            donor_geo_by_group[blood_group].add(donor_id, point)
+    donors_by_city.setdefault(city, set()).add(donor_id)
+    donor_index_keys[donor_id] = keys
+
+def find_donor_ids_by_location(location, include_pincode=False, within=None):
+    """
+    Find donor IDs whose city or state (optionally pincode) contains the location text
+    Case-insensitive for city/state; uses the substring indexes, not a scan of every donor
+    With `within`, only those IDs are returned. The cheapest plan is picked from index
+    counts: merge the matching IDs, check each candidate, or (when nearly every donor
+    matches) take away the few donors that match in no field
     """
-    compatible_groups = BLOOD_COMPATIBILITY.get(blood_group, [])
-    compatible_donors = []
+    location = location.lower()
+    indexes = [donor_city_search, donor_state_search]
+    if include_pincode:
+        indexes.append(donor_pincode_search)
+    matches = sorted(((index, index.matching_values(location)) for index in indexes),
+                     key=lambda m: len(m[0]) - m[0].count(m[1]))
+    candidates = within if within is not None else donor_order.keys()
+    
+    def matches_any(donor_id, fields):
+        return any(index.value_of[donor_id] in values for index, values in fields)
+    
+    merge_cost = sum(index.count(values) for index, values in matches)
+    check_cost = len(within) * LOCATION_FILTER_COST if within is not None else float('inf')
+    narrowest, narrowest_values = matches[0]
+    exclude_cost = (len(narrowest) - narrowest.count(narrowest_values)) * LOCATION_FILTER_COST + len(candidates)
+    
+    if check_cost < min(merge_cost, exclude_cost):
+        return {donor_id for donor_id in within if matches_any(donor_id, matches)}
+    if exclude_cost < merge_cost:
+        unmatched = {donor_id for donor_id in narrowest.ids_without(narrowest_values)
+                     if not matches_any(donor_id, matches[1:])}
+        return candidates - unmatched
+    
+    donor_ids = set()
+    for index, values in matches:
+        donor_ids |= index.ids_for(values)
+    return donor_ids if within is None else donor_ids & within
+
+def in_registration_order(donor_ids):
+    """Sort donor IDs into the order donors_db lists them"""
+    if len(donor_ids) > len(donor_order) // 8:
+        return [donor_id for donor_id in donors_db if donor_id in donor_ids]
+    return sorted(donor_ids, key=donor_order.__getitem__)
+
+def get_compatible_donor_ids(blood_group, location=None, component=DEFAULT_COMPONENT):
+    """
+    Find IDs of available, active donors compatible with a blood group
+    Only touches the active-donor buckets of the groups in the recipient's compatibility mask
+    """
+    donor_ids = set()
+    for code in codes_in(compatible_donor_mask(blood_group, component)):
+        donor_ids |= active_donors_by_code[code]
     
-    for donor_id, donor in donors_db.items():
-        if donor['blood_group'] in compatible_groups:
-            if donor['available'] and donor['status'] == 'active':
-                # Check location if specified
-                if location:
-                    if location.lower() in donor['city'].lower() or location.lower() in donor['state'].lower():
-                        compatible_donors.append(donor)
-                else:
-                    compatible_donors.append(donor)
+    # Check location if specified
+    if location and donor_ids:
+        donor_ids = find_donor_ids_by_location(location, within=donor_ids)
+    
+    return donor_ids
+
+def get_compatible_donors(blood_group, location=None, component=DEFAULT_COMPONENT):
+    """
+    Find compatible donors for a blood group
+    Returns list of compatible donor records
+    """
+    compatible_donors = [donors_db[donor_id]
+                         for donor_id in sorted(get_compatible_donor_ids(blood_group, location, component))]
     
     # Sort by last donation date (most recent first)
     compatible_donors.sort(key=lambda x: x.get('last_donation') or '1900-01-01', reverse=True)
     return compatible_donors
 
-def can_donate(last_donation_date):
-    """Check if donor can donate (56 days gap required)"""
-    if not last_donation_date:
-        return True
-    last = datetime.strptime(last_donation_date, '%Y-%m-%d')
-    return (datetime.now() - last).days >= 56
-
-def calculate_donor_eligibility(donor):
-    """Calculate donor eligibility score"""
-    score = 100
-    
-    # Age factor
-    age = donor.get('age', 0)
-    if 25 <= age <= 45:
-        score += 10
-    elif age < 18 or age > 65:
-        score -= 50
-    
-    # Availability
-    if not donor.get('available', True):
-        score -= 100
-    
-    # Last donation recency
-    last_donation = donor.get('last_donation')
-    if last_donation:
-        days_since = (datetime.now() - datetime.strptime(last_donation, '%Y-%m-%d')).days
-        if days_since > 90:
-            score += 5
-    else:
-        score += 10  # New donor bonus
+def get_compatible_donor_rows(blood_group, location=None, component=DEFAULT_COMPONENT):
+    """
+    Find donor_columns rows of available, active donors compatible with a blood group
+    Same donors as get_compatible_donor_ids(), selected with a vectorized group mask
+    """
+    mask = donor_columns.group_mask(compatible_donor_mask(blood_group, component))
     
-    # Donation history
-    total_donations = donor.get('total_donations', 0)
-    score += min(total_donations * 2, 20)
+    # Check location if specified
+    if location:
+        location_mask = np.zeros(len(mask), dtype=bool)
+        location_mask[donor_columns.rows_for(find_donor_ids_by_location(location))] = True
+        mask &= location_mask
     
-    return max(0, min(score, 150))
+    return np.flatnonzero(mask)
+
+def locate_request(request_data):
+    """Get a request's (latitude, longitude) from the hospital pincode, else the requestor's"""
+    point = pincode_geocoder.locate(request_data.get('hospital_pincode'))
+    if point is None:
+        requestor = requestors_db.get(request_data.get('requestor_id'))
+        if requestor:
+            point = pincode_geocoder.locate(requestor.get('pincode'))
+    return point
 
-def match_blood_request(request_data):
+def find_donors_near(blood_group, point, radius_km=None, k=None, accept=None, component=DEFAULT_COMPONENT):
     """
-    Blood matching algorithm
-    Finds best matching donors for a blood request
+    Find available, active donors compatible with a blood group around a point
+    Returns {donor_id: distance_km}: everyone within radius_km, or with k the k nearest
+    (within radius_km if given), nearest first. `accept` can further filter donor IDs
+    """
+    grids = [donor_geo_by_group[group] for group in groups_in(compatible_donor_mask(blood_group, component))
+             if group in donor_geo_by_group]
+    if k is None:
+        found = {}
+        for grid in grids:
+            for distance, ids in grid.within(point[0], point[1], radius_km):
+                for donor_id in ids:
+                    if accept is None or accept(donor_id):
+                        found[donor_id] = distance
+        return dict(sorted(found.items(), key=lambda item: (item[1], item[0])))
+    
+    nearest = {}
+    if k <= 0:
+        return nearest
+    streams = [grid.nearest(point[0], point[1], max_km=radius_km) for grid in grids]
+    for distance, ids in heapq.merge(*streams, key=itemgetter(0)):
+        for donor_id in sorted(ids):
+            if accept is None or accept(donor_id):
+                nearest[donor_id] = distance
+                if len(nearest) == k:
+                    return nearest
+    return nearest
+
+def get_match_candidate_rows(request_data, point=None, radius_km=None, k=None):
+    """
+    Find donor_columns rows to match against a request, and their distances
+    Requests placed at `point` (see locate_request) search around it; donors who cannot be
+    placed are still matched by city/state text. Other requests use the text match alone
+    Returns (rows, {donor_id: distance_km} or None)
     """
     blood_group = request_data['blood_group']
-    units_needed = request_data['units_needed']
+    component = request_data.get('component', DEFAULT_COMPONENT)
     location = request_data.get('location', '')
-    urgency = request_data.get('urgency', 'normal')
-    
-    # Get compatible donors
-    compatible_donors = get_compatible_donors(blood_group, location)
-    
-    # Calculate eligibility scores
-    scored_donors = []
-    for donor in compatible_donors:
-        score = calculate_donor_eligibility(donor)
-        scored_donors.append({
-            **donor,
-            'match_score': score,
-            'can_donate_now': can_donate(donor.get('last_donation'))
-        })
-    
-    # Sort by match score
-    scored_donors.sort(key=lambda x: x['match_score'], reverse=True)
-    
-    # Check inventory first for exact match
-    inventory_available = blood_inventory.get(blood_group, {}).get('units', 0)
-    
+    if point is None:
+        return get_compatible_donor_rows(blood_group, location, component), None
+    
+    if k is None:
+        distances = find_donors_near(blood_group, point, radius_km, component=component)
+        if location:
+            for donor_id in in_registration_order(get_compatible_donor_ids(blood_group, location, component)):
+                if donor_index_keys[donor_id][3] is None:
+                    distances[donor_id] = None
+    else:
+        distances = find_donors_near(blood_group, point, radius_km, k, component=component)
+    return donor_columns.rows_for(distances), distances
+
+def rank_candidate_rows(rows, distances, today, k=None, limit=MATCH_LIMIT):
+    """
+    Score candidate rows (see get_match_candidate_rows) in one vectorized pass
+    Returns (donor_id, score, can_donate_now) tuples: the `limit` best scores, or with k the candidates
+    in distance order
+    """
+    if k is None:
+        return donor_columns.rank(rows, today, limit=limit)
+    scored = {donor_id: (score, now) for donor_id, score, now in donor_columns.rank(rows, today, limit=len(rows))}
+    return [(donor_id, *scored[donor_id]) for donor_id in (distances or {}) if donor_id in scored]
+
+def ranked_donor_records(ranked, distances=None):
+    """Donor records for ranked (donor_id, score, can_donate_now) tuples, with their distance when placed"""
+    scored_donors = [
+        {**donors_db[donor_id], 'match_score': score, 'can_donate_now': can_donate_now}
+        for donor_id, score, can_donate_now in ranked
+    ]
+    if distances is not None:
+        for donor in scored_donors:
+            distance = distances.get(donor['donor_id'])
+            donor['distance_km'] = None if distance is None else round(distance, 1)
+    return scored_donors
+
+def match_blood_request(request_data, radius_km=None, k=None):
+    """
+    Blood matching algorithm
+    Finds best matching donors for a blood request
+    Scores all compatible donors at once (see blood_rules.calculate_donor_eligibility) and keeps the top 10
+    When the hospital can be placed from its pincode, considers donors within radius_km
+    (default MATCH_RADIUS_KM); with k, returns the k nearest donors, nearest first
+    Shared with aws_app.py through queries.match_blood_request and AppRepository.rank_donors
+    """
+    return match_request(repository, request_data, locate_request(request_data), radius_km, k, MATCH_RADIUS_KM)
+
+def match_blood_requests(request_list):
+    """
+    Batch blood matching for many requests in one pass (e.g. mass-casualty intake)
+    Returns {request_id: match result}, identical to match_blood_request per request
+    """
+    today = today_ordinal()
+    candidates = [get_match_candidate_rows(r, locate_request(r), MATCH_RADIUS_KM) for r in request_list]
+    ranked_sets = donor_columns.rank_many([rows for rows, _ in candidates], today, limit=MATCH_LIMIT)
     return {
-        'exact_match_inventory': inventory_available,
-        'compatible_donors': scored_donors[:10],  # Top 10 matches
-        'total_compatible': len(scored_donors),
-        'fulfillable': inventory_available >= units_needed or len(scored_donors) > 0,
-        'inventory': blood_inventory
+        r['request_id']: match_result(repository, r, ranked_donor_records(ranked, distances), len(rows))
+        for r, (rows, distances), ranked in zip(request_list, candidates, ranked_sets)
     }
 
+def _set_inventory_units(blood_group, units):
+    """Set a blood group's units; caller must hold inventory_locks[blood_group]"""
+    previous = blood_inventory[blood_group]['units']
+    blood_inventory[blood_group]['units'] = units
+    with inventory_totals_lock:
+        inventory_totals['units'] += units - previous
+    persist('inventory_units', blood_group, units)
+    notify_statistics_changed()
+    if units < CRITICAL_UNITS <= previous:
+        start_recall_campaign(blood_group, reason=f'{blood_group} fell below {CRITICAL_UNITS} units', automatic=True)
+
 def update_inventory(blood_group, units, operation='add'):
     """Update blood inventory"""
     if blood_group in blood_inventory:
-        if operation == 'add':
-            blood_inventory[blood_group]['units'] += units
-        elif operation == 'remove':
-            blood_inventory[blood_group]['units'] = max(0, blood_inventory[blood_group]['units'] - units)
+        with inventory_locks[blood_group]:
+            current = blood_inventory[blood_group]['units']
+            if operation == 'add':
+                _set_inventory_units(blood_group, current + units)
+            elif operation == 'remove':
+                _set_inventory_units(blood_group, max(0, current - units))
+
+def reserve_inventory(blood_group, units):
+    """
+    Atomically take units out of stock, pending commit_reservation or release_reservation
+    Returns the reservation, or None if not enough units are available
+    """
+    if blood_group not in blood_inventory or units <= 0:
+        return None
+    
+    with inventory_locks[blood_group]:
+        current = blood_inventory[blood_group]['units']
+        if current < units:
+            return None
+        _set_inventory_units(blood_group, current - units)
+    
+    reservation = {
+        'reservation_id': f"RSV-{uuid.uuid4().hex[:8].upper()}",
+        'blood_group': blood_group,
+        'units': units,
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+    inventory_reservations[reservation['reservation_id']] = reservation
+    return reservation
+
+def commit_reservation(reservation, details=''):
+    """Finalize a reservation as a withdrawal; returns False if it was already committed or released"""
+    if inventory_reservations.pop(reservation['reservation_id'], None) is None:
+        return False
+    record_inventory_transaction(reservation['blood_group'], reservation['units'], 'withdrawn', details)
+    return True
+
+def release_reservation(reservation):
+    """Return a reservation's units to stock; returns False if it was already committed or released"""
+    if inventory_reservations.pop(reservation['reservation_id'], None) is None:
+        return False
+    update_inventory(reservation['blood_group'], reservation['units'], 'add')
+    return True
+
+def _count_request_status(status, delta):
+    """Adjust the counter for a request status"""
+    request_status_counts[status] = request_status_counts.get(status, 0) + delta
+    notify_statistics_changed()
+
+def add_blood_request(request_data):
+    """Store a new blood request and count its status"""
+    blood_requests_db[request_data['request_id']] = request_data
+    persist_record('blood_requests', request_data['request_id'], request_data)
+    request_ids_sorted.add(request_data['request_id'])
+    
+    key = (request_data['created_at'], request_data['request_id'])
+    requests_by_created.add(key)
+    requests_by_status_created.setdefault(request_data['status'], SortedList()).add(key)
+    _count_request_status(request_data['status'], 1)
+    reprioritize_request(request_data)
+
+def set_request_status(request_data, status):
+    """Change a blood request's status, keeping the status counters in sync"""
+    if request_data['status'] == status:
+        return
+    
+    key = (request_data['created_at'], request_data['request_id'])
+    requests_by_status_created[request_data['status']].discard(key)
+    requests_by_status_created.setdefault(status, SortedList()).add(key)
+    
+    _count_request_status(request_data['status'], -1)
+    _count_request_status(status, 1)
+    request_data['status'] = status
+    reprioritize_request(request_data)
+
+def request_priority(request_data):
+    """
+    Priority key of an open request (smaller is more critical)
+    Urgency class, then required date, then most units still needed, then oldest
+    """
+    return (
+        URGENCY_RANK.get(request_data.get('urgency'), len(URGENCY_RANK)),
+        request_data.get('required_date') or '9999-12-31',
+        -get_request_remaining_units(request_data['request_id']),
+        request_data['created_at'],
+        request_data['request_id']
+    )
+
+def feed_priority(request_data):
+    """
+    Donor feed key of an open request (smaller first)
+    Urgency class, then most units still needed, then required date, then oldest
+    """
+    return (
+        URGENCY_RANK.get(request_data.get('urgency'), len(URGENCY_RANK)),
+        -get_request_remaining_units(request_data['request_id']),
+        request_data.get('required_date') or '9999-12-31',
+        request_data['created_at'],
+        request_data['request_id']
+    )
+
+def feed_buckets(request_data):
+    """Donor feed buckets of a request: its component and blood group, and those plus its city"""
+    code = group_code(request_data['blood_group'])
+    if code < 0:
+        return ()
+    component = request_data.get('component', DEFAULT_COMPONENT)
+    city = normalize_location(request_data.get('location'))
+    return ((component, code), (component, code, city)) if city else ((component, code),)
+
+def reprioritize_request(request_data):
+    """
+    Add, move or drop a request in the open-request queue and the donor feed
+    Call after a request's status or fulfilled units change
+    """
+    request_id = request_data['request_id']
+    if request_data['status'] in OPEN_REQUEST_STATUSES and get_request_remaining_units(request_id) > 0:
+        open_requests_queue.update(request_id, request_priority(request_data))
+        request_feed.update(request_id, feed_priority(request_data), feed_buckets(request_data))
+    else:
+        open_requests_queue.remove(request_id)
+        request_feed.remove(request_id)
+
+def get_next_critical_request():
+    """Get the most critical open request, or None"""
+    entry = open_requests_queue.peek()
+    return blood_requests_db[entry[1]] if entry else None
+
+def get_critical_requests(k):
+    """Get the k most critical open requests, most critical first"""
+    return [blood_requests_db[request_id] for _, request_id in open_requests_queue.top(k)]
+
+def get_requests_donor_can_help(donor, k=DONOR_HELP_COUNT):
+    """
+    Get the k open requests a donor's blood group can serve, best first: by urgency, then
+    requests in the donor's city, then most units still needed (see feed_priority)
+    Merges the top k of each feed bucket in the donor group's recipient masks, so the cost
+    depends on k and the number of blood groups, not on the number of open requests.
+    Every result is within the top k of either its city bucket or its group bucket, so the
+    merge is exact. Returns [(request, distance_km or None)]
+    """
+    city = normalize_location(donor.get('city'))
+    ranked = {}
+    for component in COMPONENT_COMPATIBILITY:
+        for code in codes_in(recipient_mask(donor['blood_group'], component)):
+            if city:
+                for key, request_id in request_feed.top((component, code, city), k):
+                    ranked[request_id] = (key[0], 0) + key[1:]
+            for key, request_id in request_feed.top((component, code), k):
+                ranked.setdefault(request_id, (key[0], 1) + key[1:])
+    
+    point = pincode_geocoder.locate(donor.get('pincode'))
+    feed = []
+    for _, request_id in heapq.nsmallest(k, ((key, request_id) for request_id, key in ranked.items())):
+        request_data = blood_requests_db[request_id]
+        request_point = locate_request(request_data) if point else None
+        distance = haversine_km(point[0], point[1], *request_point) if request_point else None
+        feed.append((request_data, None if distance is None else round(distance, 1)))
+    return feed
+
+def add_donation(donation_data):
+    """Store a donation and index it by date"""
+    donations_db[donation_data['donation_id']] = donation_data
+    persist_record('donations', donation_data['donation_id'], donation_data)
+    
+    key = (donation_data['donation_date'], donation_data['donation_id'])
+    donations_by_date.add(key)
+    donations_by_group_date.setdefault(donation_data['blood_group'], SortedList()).add(key)
+
+def put_record(store, key, record):
+    """
+    Insert or replace a record in a dict store, keeping its indexes and counters in sync, and log it
+    An existing record is updated in place, so references to it stay current
+    """
+    if store == 'donors':
+        donor = donors_db.setdefault(key, record)
+        if donor is not record:
+            donor.clear()
+            donor.update(record)
+        index_donor(donor)
+    elif store == 'blood_requests':
+        request_data = blood_requests_db.get(key)
+        if request_data is None:
+            add_blood_request(record)
+        else:
+            request_data.update({**record, 'status': request_data['status']})
+            set_request_status(request_data, record['status'])
+            reprioritize_request(request_data)
+            persist_record(store, key, request_data)
+    elif store == 'donations':
+        if key in donations_db:
+            donations_db[key].update(record)
+            persist_record(store, key, donations_db[key])
+        else:
+            add_donation(record)
+    else:
+        PERSISTED_STORES[store][key] = record
+        persist_record(store, key, record)
 
 def get_statistics():
     """Get dashboard statistics"""
@@ -181,13 +794,15 @@ def get_statistics():
     total_requestors = len(requestors_db)
     total_requests = len(blood_requests_db)
     
-    active_requests = sum(1 for r in blood_requests_db.values() if r['status'] == 'pending')
-    fulfilled_requests = sum(1 for r in blood_requests_db.values() if r['status'] == 'fulfilled')
+    active_requests = request_status_counts.get('pending', 0)
+    fulfilled_requests = request_status_counts.get('fulfilled', 0)
     
-    total_units_available = sum(inv['units'] for inv in blood_inventory.values())
+    total_units_available = inventory_totals['units']
     
-    # Critical blood groups (less than 20 units)
-    critical_groups = [bg for bg, inv in blood_inventory.items() if inv['units'] < 20]
+    # Critical blood groups (below the floor, or projected to run out soon)
+    forecast = get_inventory_forecast()
+    critical_groups = [bg for bg, inv in blood_inventory.items()
+                       if inv['units'] < CRITICAL_UNITS or forecast.get(bg, {}).get('status') == 'critical']
     
     return {
         'total_donors': total_donors,
@@ -200,6 +815,80 @@ def get_statistics():
         'inventory': blood_inventory
     }
 
+def get_inventory_forecast():
+    """
+    Projected days until stock-out per blood group, with a status of ok, warning or critical
+    The model only folds in days it hasn't seen, so this is cheap to call on every page
+    """
+    groups = inventory_transactions_db.blood_groups
+    forecast = inventory_forecaster.forecast([blood_inventory.get(bg, {}).get('units', 0) for bg in groups],
+                                             date.today().toordinal())
+    for bg, projection in forecast.items():
+        days = projection['days_until_stockout_pessimistic']
+        if projection['units'] < CRITICAL_UNITS or (days is not None and days < STOCKOUT_CRITICAL_DAYS):
+            projection['status'] = 'critical'
+        elif days is not None and days < STOCKOUT_WARNING_DAYS:
+            projection['status'] = 'warning'
+        else:
+            projection['status'] = 'ok'
+    return forecast
+
+def notify_statistics_changed():
+    """Wake up any open statistics streams"""
+    with stats_changed:
+        stats_version['value'] += 1
+        stats_changed.notify_all()
+
+def wait_for_statistics_change(version, timeout):
+    """Block until the statistics version moves past `version` or the timeout expires"""
+    with stats_changed:
+        stats_changed.wait_for(lambda: stats_version['value'] != version, timeout)
+        return stats_version['value']
+
+def get_statistics_snapshot():
+    """Get statistics as plain JSON-ready values, with inventory reduced to units"""
+    stats = get_statistics()
+    stats['inventory'] = {bg: inv['units'] for bg, inv in stats['inventory'].items()}
+    return stats
+
+def diff_statistics(old, new):
+    """Get the fields of `new` that differ from `old` (inventory diffed per blood group)"""
+    delta = {}
+    for key, value in new.items():
+        if key == 'inventory':
+            changed = {bg: units for bg, units in value.items() if old['inventory'].get(bg) != units}
+            if changed:
+                delta['inventory'] = changed
+        elif old.get(key) != value:
+            delta[key] = value
+    return delta
+
+def check_statistics_consistency(repair=False):
+    """
+    Recompute the statistics counters from scratch and report any drift
+    Returns {counter: {'counter': value, 'actual': value}} for each mismatch
+    """
+    actual_status_counts = {}
+    for r in blood_requests_db.values():
+        actual_status_counts[r['status']] = actual_status_counts.get(r['status'], 0) + 1
+    actual_units = sum(inv['units'] for inv in blood_inventory.values())
+    
+    drift = {}
+    for status in set(actual_status_counts) | set(request_status_counts):
+        counted = request_status_counts.get(status, 0)
+        actual = actual_status_counts.get(status, 0)
+        if counted != actual:
+            drift[f'requests_{status}'] = {'counter': counted, 'actual': actual}
+    if inventory_totals['units'] != actual_units:
+        drift['total_units'] = {'counter': inventory_totals['units'], 'actual': actual_units}
+    
+    if repair and drift:
+        request_status_counts.clear()
+        request_status_counts.update(actual_status_counts)
+        inventory_totals['units'] = actual_units
+    
+    return drift
+
 def generate_fulfillment_id():
     """Generate unique fulfillment ID"""
     return f"FUL-{uuid.uuid4().hex[:8].upper()}"
@@ -209,15 +898,15 @@ def get_matching_donors_for_request(request_data):
     Get matching donors for a blood request
     Returns list of donors who accepted or can donate
     """
-    blood_group = request_data['blood_group']
-    compatible_groups = BLOOD_COMPATIBILITY.get(blood_group, [])
     matching_donors = []
+    today = today_ordinal()
     
-    for donor_id, donor in donors_db.items():
-        if donor['blood_group'] in compatible_groups:
-            if donor['available'] and donor['status'] == 'active':
-                if can_donate(donor.get('last_donation')):
-                    matching_donors.append(donor)
+    donor_ids = get_compatible_donor_ids(request_data['blood_group'],
+                                         component=request_data.get('component', DEFAULT_COMPONENT))
+    for donor_id in in_registration_order(donor_ids):
+        donor = donors_db[donor_id]
+        if can_donate(donor, today):
+            matching_donors.append(donor)
     
     return matching_donors
 
@@ -237,16 +926,641 @@ def get_donor_request_donations(donor_id, request_id):
                    if f['donor_id'] == donor_id and f['request_id'] == request_id]
     return fulfillments
 
+def parse_page_args(allowed_fields, default_fields):
+    """
+    Parse cursor, limit and fields query parameters for a paginated API
+    Returns (cursor, limit, fields, error_message)
+    """
+    cursor = request.args.get('cursor') or None
+    
+    try:
+        limit = int(request.args.get('limit', API_DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return None, None, None, 'limit must be an integer'
+    limit = max(1, min(limit, API_MAX_PAGE_SIZE))
+    
+    fields = default_fields
+    if request.args.get('fields'):
+        fields = [f.strip() for f in request.args['fields'].split(',') if f.strip()]
+        unknown = [f for f in fields if f not in allowed_fields]
+        if unknown:
+            return None, None, None, f"Unknown fields: {', '.join(unknown)}"
+    
+    return cursor, limit, fields, None
+
+def paginate_ids(sorted_ids, cursor, limit, predicate):
+    """
+    Get one page of IDs after `cursor` that satisfy `predicate`
+    Returns (page_ids, next_cursor); next_cursor is None on the last page
+    """
+    ids = sorted_ids.irange(minimum=cursor, inclusive=(False, True)) if cursor else iter(sorted_ids)
+    page = []
+    for record_id in ids:
+        if predicate(record_id):
+            page.append(record_id)
+            if len(page) > limit:
+                break
+    
+    if len(page) > limit:
+        return page[:limit], page[limit - 1]
+    return page, None
+
+def get_page(sorted_index, page, page_size=DASHBOARD_PAGE_SIZE, newest_first=False):
+    """
+    Slice one page of keys out of a sorted index without sorting
+    Returns (keys, page_info) where page_info has page, pages, total, prev and next
+    """
+    total = len(sorted_index)
+    pages = max(1, -(-total // page_size))
+    page = max(1, min(page, pages))
+    start = (page - 1) * page_size
+    
+    if newest_first:
+        keys = list(reversed(sorted_index[max(0, total - start - page_size):total - start]))
+    else:
+        keys = sorted_index[start:start + page_size]
+    
+    return keys, {
+        'page': page,
+        'pages': pages,
+        'total': total,
+        'prev': page - 1 if page > 1 else None,
+        'next': page + 1 if page < pages else None
+    }
+
+def stream_json_page(records, fields, next_cursor):
+    """Stream records as a JSON array, one projected record at a time"""
+    def generate():
+        yield '['
+        for i, record in enumerate(records):
+            yield (',' if i else '') + json.dumps({f: record.get(f) for f in fields})
+        yield ']'
+    
+    headers = {}
+    if next_cursor:
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        headers['X-Next-Cursor'] = next_cursor
+        headers['Link'] = f'<{url_for(request.endpoint, **args)}>; rel="next"'
+    
+    return Response(generate(), mimetype='application/json', headers=headers)
+
 def record_inventory_transaction(blood_group, units, transaction_type, details=''):
-    """Record an inventory transaction"""
-    transaction = {
-        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'blood_group': blood_group,
-        'units': units,
-        'type': transaction_type,  # 'add', 'remove', 'donated', 'withdrawn'
-        'details': details
+    """Record an inventory transaction ('add', 'remove', 'donated' or 'withdrawn')"""
+    timestamp = int(time.time())
+    with inventory_transactions_lock:
+        sequence = inventory_transactions_db.append(timestamp, blood_group, transaction_type, units, details)
+        persist('transaction', sequence, timestamp, blood_group, transaction_type, units, details)
+
+def day_ordinal(day):
+    """Date ordinal of a YYYY-MM-DD string, or None"""
+    return date.fromisoformat(day).toordinal() if day else None
+
+def iter_inventory_transactions(start=None, end=None, blood_group=None):
+    """Yield retained inventory transactions from `start` to `end` (YYYY-MM-DD, inclusive), oldest first"""
+    return inventory_transactions_db.records(day_ordinal(start), day_ordinal(end), blood_group)
+
+def get_transaction_totals(blood_group=None, transaction_type=None, days=7):
+    """
+    (count, units) of transactions over the last `days` days including today, from the daily rollups
+    e.g. get_transaction_totals('O-', 'withdrawn', 7) for units of O- withdrawn this week
+    """
+    today = date.today().toordinal()
+    return inventory_transactions_db.totals(today - days + 1, today, blood_group, transaction_type)
+
+def iter_donations(start=None, end=None, blood_group=None):
+    """Yield donations from `start` to `end` (YYYY-MM-DD, inclusive), oldest first"""
+    index = donations_by_group_date.get(blood_group, SortedList()) if blood_group else donations_by_date
+    minimum, maximum = (start,) if start else None, (end, '\uffff') if end else None
+    inclusive = (True, True)
+    # Walk the index a page at a time, resuming after the last key, so donations
+    # recorded while an export is streaming don't invalidate the iteration
+    while True:
+        keys = list(islice(index.irange(minimum, maximum, inclusive), EXPORT_PAGE_SIZE))
+        for _, donation_id in keys:
+            yield donations_db[donation_id]
+        if len(keys) < EXPORT_PAGE_SIZE:
+            return
+        minimum, inclusive = keys[-1], (False, True)
+
+# Record iterators of each exportable dataset
+EXPORT_SOURCES = {
+    'donations': iter_donations,
+    'inventory-transactions': iter_inventory_transactions
+}
+
+def parse_date_range(args):
+    """
+    Read an inclusive (start, end) date range from `from` / `to` (YYYY-MM-DD) or `month` (YYYY-MM)
+    Returns (start, end, error)
+    """
+    start, end = args.get('from') or None, args.get('to') or None
+    month = args.get('month')
+    try:
+        if month:
+            first = datetime.strptime(month, '%Y-%m').date()
+            last = (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+            start, end = first.isoformat(), last.isoformat()
+        for value in (start, end):
+            if value:
+                datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return None, None, 'from/to must be YYYY-MM-DD and month YYYY-MM'
+    return start, end, None
+
+def monthly_report(start, end):
+    """Units donated and withdrawn per blood group between two dates"""
+    report = {bg: {'donations': 0, 'donated_units': 0, 'withdrawals': 0, 'withdrawn_units': 0}
+              for bg in BLOOD_COMPATIBILITY}
+    for donation in iter_donations(start, end):
+        group = report[donation['blood_group']]
+        group['donations'] += 1
+        group['donated_units'] += donation['units']
+    withdrawn = inventory_transactions_db.totals_by_group(day_ordinal(start), day_ordinal(end), 'withdrawn')
+    for bg, (count, units) in withdrawn.items():
+        report[bg]['withdrawals'] = count
+        report[bg]['withdrawn_units'] = units
+    return report
+
+def next_contact_time(contact_time, now):
+    """Epoch seconds of the next moment inside a preferred contact window (now if inside it)"""
+    window = CONTACT_WINDOWS.get(contact_time)
+    if not window or window[0] <= now.hour < window[1]:
+        return now.timestamp()
+    start = now.replace(hour=window[0], minute=0, second=0, microsecond=0)
+    if now.hour >= window[1]:
+        start += timedelta(days=1)
+    return start.timestamp()
+
+def start_recall_campaign(blood_group, limit=None, reason='manual', automatic=False):
+    """
+    Start recalling donors for a short blood group; selection and sending happen in the background
+    Returns the campaign record, or None if an automatic campaign for the group ran recently
+    """
+    now = datetime.now()
+    with campaigns_lock:
+        if automatic:
+            last = last_auto_campaign.get(blood_group)
+            if last and now - last < timedelta(hours=RECALL_CAMPAIGN_INTERVAL_HOURS):
+                return None
+            last_auto_campaign[blood_group] = now
+        campaign = {
+            'campaign_id': f"RC-{uuid.uuid4().hex[:8].upper()}",
+            'blood_group': blood_group,
+            'donor_groups': list(BLOOD_COMPATIBILITY[blood_group]),
+            'reason': reason,
+            'status': 'selecting',
+            'created_at': now.strftime('%Y-%m-%d %H:%M:%S'),
+            'limit': limit,
+            'selected': 0,
+            'skipped_recently_recalled': 0,
+            'queued': 0,
+            'sent': 0,
+            'failed': 0,
+            'selection_seconds': None
+        }
+        campaigns_db[campaign['campaign_id']] = campaign
+    campaign_executor.submit(_run_recall_campaign, campaign)
+    return campaign
+
+def _run_recall_campaign(campaign):
+    """Select and rank eligible donors, then queue one notification per donor"""
+    started = time.perf_counter()
+    now = datetime.now()
+    today = now.date().toordinal()
+    blood_group = campaign['blood_group']
+    try:
+        rows, _ = donor_columns.recall_candidates(groups_mask(campaign['donor_groups']), blood_group, today)
+        with campaigns_lock:
+            recent = [donor_id for donor_id, day in recalled_on.items() if today - day < RECALL_COOLDOWN_DAYS]
+        keep = ~np.isin(rows, donor_columns.rows_for(recent))
+        skipped = len(rows) - int(keep.sum())
+        rows = rows[keep][:campaign['limit']]
+        
+        send_after = {code: next_contact_time(name, now) for name, code in CONTACT_TIME_CODES.items()}
+        contact_codes = donor_columns.contact_time[rows].tolist()
+        messages = []
+        for row, code in zip(rows.tolist(), contact_codes):
+            donor = donors_db.get(donor_columns.donor_ids[row])
+            if donor is None:
+                continue
+            messages.append({
+                'channel': 'sms',
+                'dedup_key': f"recall:{campaign['campaign_id']}:{donor['donor_id']}",
+                'to': donor['phone'],
+                'donor_id': donor['donor_id'],
+                'campaign_id': campaign['campaign_id'],
+                'send_after': send_after[code],
+                'body': f"HemaLink: {blood_group} blood stocks are running low and your {donor['blood_group']} "
+                        f"donation can help. Please visit your nearest donation center, {donor['name']}."
+            })
+        with campaigns_lock:
+            for message in messages:
+                recalled_on[message['donor_id']] = today
+            campaign.update(selected=len(messages), skipped_recently_recalled=skipped, queued=len(messages),
+                            status='queued' if messages else 'completed',
+                            selection_seconds=round(time.perf_counter() - started, 3))
+        notification_outbox.enqueue_many(messages)
+    except Exception as e:
+        campaign.update(status='failed', error=str(e))
+        print(f"[campaign] {campaign['campaign_id']} failed: {e}")
+
+def _record_campaign_delivery(message, delivered):
+    """Count a campaign message's delivery result"""
+    campaign = campaigns_db.get(message.get('campaign_id'))
+    if campaign is None:
+        return
+    with campaigns_lock:
+        campaign['sent' if delivered else 'failed'] += 1
+        if campaign['sent'] + campaign['failed'] >= campaign['queued']:
+            campaign['status'] = 'completed'
+
+# Outgoing notifications; kept in HEMALINK_DATA_DIR with the stores so queued messages survive a restart
+# (memory-only per worker in shared-state mode, where workers cannot share one journal file)
+notification_outbox = Outbox({'sms': LogBackend('sms')},
+                             path=os.path.join(DATA_DIR, 'outbox.log') if wal else None,
+                             rates={'sms': float(os.getenv('HEMALINK_NOTIFY_RATE', '20'))},
+                             workers=int(os.getenv('HEMALINK_NOTIFY_WORKERS', '2')),
+                             batch_size=int(os.getenv('HEMALINK_NOTIFY_BATCH_SIZE', '100')),
+                             max_attempts=int(os.getenv('HEMALINK_NOTIFY_MAX_ATTEMPTS', '5')),
+                             on_result=_record_campaign_delivery)
+
+# ============== REGISTRATION AND BULK IMPORT ==============
+# Shared by the registration forms and the bulk importer, so both apply the same rules
+
+URGENCY_LEVELS = ['normal', 'high', 'critical']
+
+def parse_number(fields, name, kind=int):
+    """Read a required numeric field, with a readable error for bad values"""
+    value = fields[name]
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be a number, got {value!r}')
+
+def new_donor_record(fields):
+    """
+    Build a new donor record from registration fields (a form or an import row)
+    Raises KeyError for a missing required field and ValueError for a bad number
+    """
+    return {
+        'donor_id': generate_donor_id(),
+        'name': fields['name'],
+        'email': fields['email'],
+        'phone': fields['phone'],
+        'age': parse_number(fields, 'age'),
+        'gender': fields['gender'],
+        'blood_group': fields['blood_group'],
+        'weight': parse_number(fields, 'weight', float),
+        'address': fields['address'],
+        'city': fields['city'],
+        'state': fields['state'],
+        'pincode': fields['pincode'],
+        'medical_history': fields.get('medical_history') or 'None',
+        'available': True,
+        'status': 'active',
+        'total_donations': 0,
+        'last_donation': None,
+        'last_donation_day': None,
+        'registered_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'emergency_contact': fields.get('emergency_contact') or '',
+        'preferred_contact_time': fields.get('preferred_contact_time') or 'Anytime'
     }
-    inventory_transactions_db.append(transaction)
+
+def validate_donor(donor_data):
+    """Check a new donor against the registration rules; returns an error message or None"""
+    error = blank_required_error('donors', donor_data)
+    if error:
+        return error
+    if donor_data['age'] < 18 or donor_data['age'] > 65:
+        return 'Donor age must be between 18 and 65 years!'
+    if donor_data['weight'] < 50:
+        return 'Donor weight must be at least 50kg!'
+    if donor_data['blood_group'] not in BLOOD_COMPATIBILITY:
+        return f"Unknown blood group {donor_data['blood_group']!r}!"
+    return None
+
+def register_donors(donor_list):
+    """Store validated new donors, index them and add them to the inventory donor lists"""
+    for donor_data in donor_list:
+        # Short random IDs start to collide around a hundred thousand records
+        while donor_data['donor_id'] in donors_db:
+            donor_data['donor_id'] = generate_donor_id()
+        donor_id = donor_data['donor_id']
+        donors_db[donor_id] = donor_data
+        index_donor(donor_data)
+        
+        inventory_donors = blood_inventory[donor_data['blood_group']]['donors']
+        inventory_donors.append(donor_id)
+        persist('inventory_donor', donor_data['blood_group'], len(inventory_donors) - 1, donor_id)
+    notify_statistics_changed()
+
+def new_blood_request_record(fields):
+    """
+    Build a new blood request record from request fields (a form or an import row)
+    Raises KeyError for a missing required field and ValueError for a bad number
+    """
+    return {
+        'request_id': generate_request_id(),
+        'requestor_id': fields.get('requestor_id') or 'GUEST',
+        'patient_name': fields['patient_name'],
+        'patient_age': parse_number(fields, 'patient_age'),
+        'patient_gender': fields['patient_gender'],
+        'blood_group': fields['blood_group'],
+        'component': fields.get('component') or DEFAULT_COMPONENT,
+        'units_needed': parse_number(fields, 'units_needed'),
+        'hospital_name': fields['hospital_name'],
+        'hospital_address': fields['hospital_address'],
+        'hospital_pincode': (fields.get('hospital_pincode') or '').strip(),
+        'location': fields.get('city') or '',
+        'city': fields.get('city') or '',
+        'state': fields.get('state') or '',
+        'contact_name': fields['contact_name'],
+        'contact_phone': fields['contact_phone'],
+        'contact_email': fields.get('contact_email') or '',
+        'urgency': fields.get('urgency') or 'normal',
+        'required_date': fields['required_date'],
+        'reason': fields.get('reason') or '',
+        'status': 'pending',
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'matched_donors': [],
+        'fulfilled_units': 0,
+        'accepted_donors': [],
+        'donor_donations': []
+    }
+
+def validate_blood_request(request_data):
+    """Check a new blood request; returns an error message or None"""
+    error = blank_required_error('requests', request_data)
+    if error:
+        return error
+    if request_data['blood_group'] not in BLOOD_COMPATIBILITY:
+        return f"Unknown blood group {request_data['blood_group']!r}!"
+    if request_data['component'] not in COMPONENT_COMPATIBILITY:
+        return f"Component must be one of {', '.join(COMPONENT_COMPATIBILITY)}!"
+    if request_data['units_needed'] < 1:
+        return 'At least 1 unit must be requested!'
+    if request_data['urgency'] not in URGENCY_LEVELS:
+        return f"Urgency must be one of {', '.join(URGENCY_LEVELS)}!"
+    try:
+        datetime.strptime(request_data['required_date'], '%Y-%m-%d')
+    except ValueError:
+        return 'Required date must be YYYY-MM-DD!'
+    return None
+
+def create_blood_requests(request_list):
+    """Store validated new blood requests and match donors for all of them in one pass"""
+    for request_data in request_list:
+        while request_data['request_id'] in blood_requests_db:
+            request_data['request_id'] = generate_request_id()
+        add_blood_request(request_data)
+        
+        # Update requestor stats if registered
+        requestor_id = request_data['requestor_id']
+        if requestor_id in requestors_db:
+            requestors_db[requestor_id]['total_requests'] += 1
+            persist_record('requestors', requestor_id, requestors_db[requestor_id])
+    
+    # Run matching algorithm
+    for request_id, match_results in match_blood_requests(request_list).items():
+        request_data = blood_requests_db[request_id]
+        request_data['matched_donors'] = [d['donor_id'] for d in match_results['compatible_donors']]
+        persist_record('blood_requests', request_id, request_data)
+
+def _validated(build, validate):
+    """Turn a record builder and validator into an import row handler"""
+    def build_row(row):
+        record = build(row)
+        error = validate(record)
+        if error:
+            raise ValueError(error)
+        return record
+    return build_row
+
+# Bulk import handlers: {kind: (build and validate one row, store a batch)}
+IMPORTERS = {
+    'donors': (_validated(new_donor_record, validate_donor), register_donors),
+    'requests': (_validated(new_blood_request_record, validate_blood_request), create_blood_requests)
+}
+
+def import_records(kind, stream, fmt, dry_run=False):
+    """
+    Stream donors or blood requests from a CSV / JSON Lines stream into the stores
+    With shared state, each batch holds the write lease only while it is stored
+    """
+    build_row, write_batch = IMPORTERS[kind]
+    if shared_state:
+        store_batch = write_batch
+        
+        def write_batch(batch):
+            with shared_state.lease():
+                store_batch(batch)
+    return run_import(iter_rows(stream, fmt), build_row, write_batch, dry_run=dry_run)
+
+# ============== SHARED STATE ==============
+# With several worker processes, writes from other workers are applied before each request,
+# and routes marked with writes_shared_state hold the shared write lease while they write
+
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+def apply_shared_op(op):
+    """
+    Apply a mutation logged by another worker to this worker's stores and indexes
+    Takes the write-ahead log operations (see persistence.py) that persist() records
+    """
+    kind = op[0]
+    if kind == 'put':
+        _, store, key, record = op
+        put_record(store, key, record)
+    elif kind == 'inventory_units':
+        _, blood_group, units = op
+        inventory = blood_inventory.setdefault(blood_group, {'units': 0, 'donors': []})
+        inventory_locks.setdefault(blood_group, threading.Lock())
+        with inventory_locks[blood_group], inventory_totals_lock:
+            inventory_totals['units'] += units - inventory['units']
+            inventory['units'] = units
+        notify_statistics_changed()
+    elif kind == 'inventory_donor':
+        _, blood_group, index, donor_id = op
+        donors = blood_inventory.setdefault(blood_group, {'units': 0, 'donors': []})['donors']
+        if index == len(donors):
+            donors.append(donor_id)
+    elif kind == 'transaction':
+        sequence, timestamp, blood_group, transaction_type, units, details = op[1:]
+        inventory_transactions_db.append(timestamp, blood_group, transaction_type, units, details, sequence=sequence)
+
+def writes_shared_state(view):
+    """
+    Mark a route that writes: its POST/PUT/PATCH/DELETE requests hold the shared write lease,
+    so they see every other worker's writes and commit their own in one message
+    Read-only routes (logins, searches) stay unmarked and never wait for other workers
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if shared_state is None or request.method not in WRITE_METHODS:
+            return view(*args, **kwargs)
+        with shared_state.lease():
+            return view(*args, **kwargs)
+    return wrapper
+
+@app.before_request
+def sync_shared_state():
+    """Catch up with other workers' writes; a shared-memory read when there are none"""
+    if shared_state:
+        shared_state.catch_up()
+
+# ============== REPOSITORY ==============
+# The stores above behind the storage.Repository interface, so blood request matching and the
+# admin dashboard are the same code as aws_app.py's (queries.py). Writes go through the helpers
+# the routes use, which keep the indexes, counters and write-ahead log in step
+
+class AppRepository(Repository):
+    """
+    app.py's in-process stores as a storage backend
+    The hot paths are answered from the vectorized donor columns, geo grids and pre-sorted dashboard
+    indexes. Inventory transactions live in the transaction log, which has no IDs to get() them by,
+    and a blood group's donor list is append-only
+    """
+    
+    name = 'app'
+    
+    def __init__(self):
+        super().__init__()
+        self.indexes['donors'] = {'blood_group', 'city'}
+        self.stores = {'donors': donors_db, 'requestors': requestors_db, 'blood_requests': blood_requests_db,
+                       'donations': donations_db}
+        self.lock = threading.RLock()
+    
+    def get(self, store, key):
+        if store == 'inventory':
+            inventory = blood_inventory.get(key)
+            return None if inventory is None else {'blood_group': key, **inventory}
+        if store == 'inventory_transactions':
+            return None
+        return self.stores[store].get(key)
+    
+    def put(self, store, item):
+        key = item[STORES[store]]
+        if store == 'inventory':
+            if key not in blood_inventory:
+                return False
+            with inventory_locks[key]:
+                _set_inventory_units(key, item.get('units', 0))
+            self.append('inventory', key, 'donors', item.get('donors', [])[len(blood_inventory[key]['donors']):])
+        elif store == 'inventory_transactions':
+            record_inventory_transaction(item['blood_group'], item['units'], item['type'], item.get('details', ''))
+        else:
+            put_record(store, key, item)
+        return True
+    
+    def increment(self, store, key, field, delta, minimum=None):
+        if store == 'inventory' and field == 'units':
+            if key not in blood_inventory:
+                return False
+            with inventory_locks[key]:
+                current = blood_inventory[key]['units']
+                if minimum is not None and current < minimum:
+                    return False
+                _set_inventory_units(key, current + delta)
+            return True
+        with self.lock:
+            item = dict(self.get(store, key) or {STORES[store]: key})
+            if minimum is not None and item.get(field, 0) < minimum:
+                return False
+            item[field] = item.get(field, 0) + delta
+            return self.put(store, item)
+    
+    def append(self, store, key, field, values):
+        if store == 'inventory' and field == 'donors':
+            if key not in blood_inventory:
+                return
+            with inventory_locks[key]:
+                inventory_donors = blood_inventory[key]['donors']
+                for donor_id in values:
+                    inventory_donors.append(donor_id)
+                    persist('inventory_donor', key, len(inventory_donors) - 1, donor_id)
+            return
+        with self.lock:
+            item = dict(self.get(store, key) or {STORES[store]: key})
+            item[field] = list(item.get(field, [])) + list(values)
+            self.put(store, item)
+    
+    def scan(self, store):
+        if store == 'inventory':
+            return [self.get('inventory', blood_group) for blood_group in blood_inventory]
+        if store == 'inventory_transactions':
+            return list(iter_inventory_transactions())
+        return list(self.stores[store].values())
+    
+    def find(self, store, field, value):
+        if store == 'donors' and field == 'blood_group':
+            return [donors_db[donor_id] for donor_id in in_registration_order(donors_by_group.get(value, set()))]
+        if store == 'donors' and field == 'city':
+            donor_ids = in_registration_order(donors_by_city.get(normalize_location(value), set()))
+            return [donors_db[donor_id] for donor_id in donor_ids if donors_db[donor_id].get('city') == value]
+        return super().find(store, field, value)
+    
+    def find_donors(self, blood_groups, active_only=True):
+        if not active_only:
+            return super().find_donors(blood_groups, active_only)
+        donor_ids = set().union(*(active_donors_by_code[code] for code in codes_in(groups_mask(blood_groups))))
+        return [donors_db[donor_id] for donor_id in in_registration_order(donor_ids)]
+    
+    def count(self, store):
+        if store == 'inventory':
+            return len(blood_inventory)
+        if store == 'inventory_transactions':
+            return len(inventory_transactions_db)
+        return len(self.stores[store])
+    
+    def _sorted_index(self, store, field, value):
+        """(sorted keys, whether pages read them newest first) behind a page of `store`, or None"""
+        if store == 'donors' and field in (None, 'blood_group'):
+            return (donor_ids_by_group.get(value, SortedList()) if field else donor_ids_sorted), False
+        if store == 'blood_requests' and field in (None, 'status'):
+            return (requests_by_status_created.get(value, SortedList()) if field else requests_by_created), True
+        if store == 'donations' and field in (None, 'blood_group'):
+            return (donations_by_group_date.get(value, SortedList()) if field else donations_by_date), True
+        return None
+    
+    def _page_items(self, store, keys):
+        """Records for sorted index keys: donor IDs, or (sort value, ID) pairs"""
+        records = self.stores[store]
+        return [records[key] if store == 'donors' else records[key[1]] for key in keys]
+    
+    def page(self, store, cursor=None, limit=50, field=None, value=None):
+        """Pages sliced off the pre-sorted indexes; the cursor is the offset of the next page"""
+        index = self._sorted_index(store, field, value)
+        if index is None:
+            return super().page(store, cursor, limit, field, value)
+        sorted_keys, newest_first = index
+        start = int(cursor or 0)
+        total = len(sorted_keys)
+        if newest_first:
+            keys = list(reversed(sorted_keys[max(0, total - start - limit):max(0, total - start)]))
+        else:
+            keys = sorted_keys[start:start + limit]
+        next_cursor = str(start + limit) if start + limit < total else None
+        return self._page_items(store, keys), next_cursor
+    
+    def dashboard_page(self, store, cursor=None, limit=50, field=None, value=None):
+        """Numbered pages off the pre-sorted indexes (see get_page); the cursor is the page number"""
+        index = self._sorted_index(store, field, value)
+        if index is None:
+            return super().dashboard_page(store, cursor, limit, field, value)
+        try:
+            page = int(cursor or 1)
+        except ValueError:
+            page = 1
+        keys, page_info = get_page(index[0], page, limit, newest_first=index[1])
+        return self._page_items(store, keys), page_info
+    
+    def rank_donors(self, request_data, today, point=None, radius_km=None, k=None, limit=MATCH_LIMIT, locate=None):
+        """Candidates from the group masks and geo grids, all scored in one vectorized pass"""
+        rows, distances = get_match_candidate_rows(request_data, point, radius_km, k)
+        return ranked_donor_records(rank_candidate_rows(rows, distances, today, k, limit), distances), len(rows)
+
+repository = AppRepository()
 
 # ============== ROUTES ==============
 
@@ -254,11 +1568,7 @@ def record_inventory_transaction(blood_group, units, transaction_type, details='
 def home():
     """Home page"""
     stats = get_statistics()
-    recent_requests = sorted(
-        blood_requests_db.values(), 
-        key=lambda x: x['created_at'], 
-        reverse=True
-    )[:5]
+    recent_requests = [blood_requests_db[request_id] for _, request_id in reversed(requests_by_created[-5:])]
     return render_template('index.html', stats=stats, recent_requests=recent_requests)
 
 @app.route('/about')
@@ -269,48 +1579,24 @@ def about():
 # ============== DONOR ROUTES ==============
 
 @app.route('/donor/register', methods=['GET', 'POST'])
+@writes_shared_state
 def donor_register():
     """Donor registration"""
     if request.method == 'POST':
-        donor_id = generate_donor_id()
-        
-        donor_data = {
-            'donor_id': donor_id,
-            'name': request.form['name'],
-            'email': request.form['email'],
-            'phone': request.form['phone'],
-            'age': int(request.form['age']),
-            'gender': request.form['gender'],
-            'blood_group': request.form['blood_group'],
-            'weight': float(request.form['weight']),
-            'address': request.form['address'],
-            'city': request.form['city'],
-            'state': request.form['state'],
-            'pincode': request.form['pincode'],
-            'medical_history': request.form.get('medical_history', 'None'),
-            'available': True,
-            'status': 'active',
-            'total_donations': 0,
-            'last_donation': None,
-            'registered_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'emergency_contact': request.form.get('emergency_contact', ''),
-            'preferred_contact_time': request.form.get('preferred_contact_time', 'Anytime')
-        }
-        
-        # Validate age
-        if donor_data['age'] < 18 or donor_data['age'] > 65:
-            flash('Donor age must be between 18 and 65 years!', 'error')
+        try:
+            donor_data = new_donor_record(request.form)
+        except ValueError as e:
+            flash(f'{e}!', 'error')
             return redirect(url_for('donor_register'))
         
-        # Validate weight
-        if donor_data['weight'] < 50:
-            flash('Donor weight must be at least 50kg!', 'error')
+        # Validate age, weight and blood group
+        error = validate_donor(donor_data)
+        if error:
+            flash(error, 'error')
             return redirect(url_for('donor_register'))
         
-        donors_db[donor_id] = donor_data
-        
-        # Update inventory donor list
-        blood_inventory[donor_data['blood_group']]['donors'].append(donor_id)
+        register_donors([donor_data])
+        donor_id = donor_data['donor_id']
         
         flash(f'Registration successful! Your Donor ID is: {donor_id}', 'success')
         return redirect(url_for('donor_dashboard', donor_id=donor_id))
@@ -329,10 +1615,14 @@ def donor_dashboard(donor_id):
     donation_history = [d for d in donations_db.values() if d['donor_id'] == donor_id]
     
     # Check eligibility
-    can_donate_now = can_donate(donor.get('last_donation'))
+    can_donate_now = can_donate(donor)
+    
+    # Open requests this donor's blood group can serve, from the incrementally maintained feed
+    requests_to_help = get_requests_donor_can_help(donor)
     
     return render_template('donor_dashboard.html', donor=donor, 
-                          donation_history=donation_history, can_donate_now=can_donate_now)
+                          donation_history=donation_history, can_donate_now=can_donate_now,
+                          requests_to_help=requests_to_help)
 
 @app.route('/donor/login', methods=['GET', 'POST'])
 def donor_login():
@@ -352,6 +1642,7 @@ def donor_login():
     return render_template('donor_login.html')
 
 @app.route('/donor/update/<donor_id>', methods=['POST'])
+@writes_shared_state
 def donor_update(donor_id):
     """Update donor information"""
     donor = donors_db.get(donor_id)
@@ -364,11 +1655,13 @@ def donor_update(donor_id):
     donor['available'] = request.form.get('available') == 'on'
     donor['city'] = request.form.get('city', donor['city'])
     donor['state'] = request.form.get('state', donor['state'])
+    index_donor(donor)
     
     flash('Profile updated successfully!', 'success')
     return redirect(url_for('donor_dashboard', donor_id=donor_id))
 
 @app.route('/donor/donate/<donor_id>', methods=['POST'])
+@writes_shared_state
 def record_donation(donor_id):
     """Record a new donation"""
     donor = donors_db.get(donor_id)
@@ -376,7 +1669,7 @@ def record_donation(donor_id):
         flash('Donor not found!', 'error')
         return redirect(url_for('home'))
     
-    if not can_donate(donor.get('last_donation')):
+    if not can_donate(donor):
         flash('You must wait 56 days between donations!', 'error')
         return redirect(url_for('donor_dashboard', donor_id=donor_id))
     
@@ -394,19 +1687,22 @@ def record_donation(donor_id):
         'notes': request.form.get('notes', '')
     }
     
-    donations_db[donation_id] = donation_data
+    add_donation(donation_data)
     
     # Update donor record
-    donor['last_donation'] = donation_data['donation_date']
+    set_last_donation(donor, donation_data['donation_date'])
     donor['total_donations'] += 1
+    index_donor(donor)
     
     # Update inventory
     update_inventory(donor['blood_group'], units, 'add')
+    record_inventory_transaction(donor['blood_group'], units, 'donated', f'Donor {donor_id} donated {units} units')
     
     flash(f'Donation recorded successfully! Donation ID: {donation_id}', 'success')
     return redirect(url_for('donor_dashboard', donor_id=donor_id))
 
 @app.route('/donor/donate-to-inventory/<donor_id>', methods=['POST'])
+@writes_shared_state
 def donate_to_inventory(donor_id):
     """Donor donation to blood inventory"""
     donor = donors_db.get(donor_id)
@@ -414,7 +1710,7 @@ def donate_to_inventory(donor_id):
         flash('Donor not found!', 'error')
         return redirect(url_for('home'))
     
-    if not can_donate(donor.get('last_donation')):
+    if not can_donate(donor):
         flash('You must wait 56 days between donations!', 'error')
         return redirect(url_for('donor_dashboard', donor_id=donor_id))
     
@@ -442,11 +1738,12 @@ def donate_to_inventory(donor_id):
         'notes': request.form.get('notes', '')
     }
     
-    donations_db[donation_id] = donation_data
+    add_donation(donation_data)
     
     # Update donor record
-    donor['last_donation'] = donation_data['donation_date']
+    set_last_donation(donor, donation_data['donation_date'])
     donor['total_donations'] += 1
+    index_donor(donor)
     
     # Update inventory
     update_inventory(blood_group, units, 'add')
@@ -456,6 +1753,7 @@ def donate_to_inventory(donor_id):
     return redirect(url_for('donor_dashboard', donor_id=donor_id))
 
 @app.route('/donor/accept-request/<request_id>/<donor_id>', methods=['POST'])
+@writes_shared_state
 def donor_accept_request(request_id, donor_id):
     """Donor accepts a blood request"""
     donor = donors_db.get(donor_id)
@@ -465,10 +1763,15 @@ def donor_accept_request(request_id, donor_id):
         flash('Donor or request not found!', 'error')
         return redirect(url_for('home'))
     
-    if not can_donate(donor.get('last_donation')):
+    if not can_donate(donor):
         flash('You are not eligible to donate at this time!', 'error')
         return redirect(url_for('donor_dashboard', donor_id=donor_id))
     
+    if not is_compatible(request_data['blood_group'], donor['blood_group'],
+                         request_data.get('component', DEFAULT_COMPONENT)):
+        flash(f"{donor['blood_group']} cannot be given to a {request_data['blood_group']} patient!", 'error')
+        return redirect(url_for('donor_dashboard', donor_id=donor_id))
+    
     # Create a fulfillment record
     fulfillment_id = generate_fulfillment_id()
     units_to_donate = min(
@@ -513,12 +1816,16 @@ def donor_accept_request(request_id, donor_id):
     if request_data['status'] == 'pending':
         request_data['status'] = 'pending'  # Still waiting for confirmation
     
+    persist_record('donation_fulfillments', fulfillment_id, fulfillment_data)
+    persist_record('blood_requests', request_id, request_data)
+    
     flash(f'You have accepted to donate {units_to_donate} unit(s) for request {request_id}!', 'success')
     return redirect(url_for('donor_dashboard', donor_id=donor_id))
 
 # ============== REQUESTOR ROUTES ==============
 
 @app.route('/requestor/register', methods=['GET', 'POST'])
+@writes_shared_state
 def requestor_register():
     """Requestor registration"""
     if request.method == 'POST':
@@ -539,6 +1846,8 @@ def requestor_register():
         }
         
         requestors_db[requestor_id] = requestor_data
+        persist_record('requestors', requestor_id, requestor_data)
+        notify_statistics_changed()
         
         flash(f'Registration successful! Your Requestor ID is: {requestor_id}', 'success')
         return redirect(url_for('requestor_dashboard', requestor_id=requestor_id))
@@ -577,6 +1886,7 @@ def requestor_login():
     return render_template('requestor_login.html')
 
 @app.route('/requestor/confirm-donation/<fulfillment_id>', methods=['POST'])
+@writes_shared_state
 def requestor_confirm_donation(fulfillment_id):
     """Requestor confirms a donor's donation acceptance"""
     fulfillment = donation_fulfillments_db.get(fulfillment_id)
@@ -594,7 +1904,7 @@ def requestor_confirm_donation(fulfillment_id):
         return redirect(url_for('home'))
     
     # Check if donor can donate
-    if not can_donate(donor.get('last_donation')):
+    if not can_donate(donor):
         flash('Donor is not eligible to donate at this time!', 'error')
         return redirect(url_for('requestor_dashboard', requestor_id=fulfillment['requestor_id']))
     
@@ -619,29 +1929,35 @@ def requestor_confirm_donation(fulfillment_id):
         'notes': request.form.get('notes', '')
     }
     
-    donations_db[donation_id] = donation_data
+    add_donation(donation_data)
     fulfillment['donation_id'] = donation_id
     
     # Update donor record
-    donor['last_donation'] = donation_data['donation_date']
+    set_last_donation(donor, donation_data['donation_date'])
     donor['total_donations'] += 1
+    index_donor(donor)
     
     # Update request fulfillment
     request_data['fulfilled_units'] = request_data.get('fulfilled_units', 0) + fulfillment['units']
     
     # Check if request is now fully fulfilled
     remaining = get_request_remaining_units(request_id)
+    reprioritize_request(request_data)
     if remaining <= 0:
-        request_data['status'] = 'fulfilled'
+        set_request_status(request_data, 'fulfilled')
         fulfillment['status'] = 'completed'
         fulfillment['completed_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         # Remove from inventory (we assume confirmed donations are stored)
         # Note: In a real system, you might not remove from inventory if both are the same pool
     
+    persist_record('donation_fulfillments', fulfillment_id, fulfillment)
+    persist_record('blood_requests', request_id, request_data)
+    
     flash(f'Donation from {donor['name']} confirmed for {fulfillment['units']} unit(s)!', 'success')
     return redirect(url_for('requestor_dashboard', requestor_id=fulfillment['requestor_id']))
 
 @app.route('/requestor/take-from-inventory/<requestor_id>', methods=['POST'])
+@writes_shared_state
 def requestor_take_from_inventory(requestor_id):
     """Requestor withdraws blood from inventory"""
     requestor = requestors_db.get(requestor_id)
@@ -657,16 +1973,16 @@ def requestor_take_from_inventory(requestor_id):
         flash('Units must be greater than 0!', 'error')
         return redirect(url_for('requestor_dashboard', requestor_id=requestor_id))
     
-    current_inventory = blood_inventory.get(blood_group, {}).get('units', 0)
+    # Reserve the units atomically so concurrent withdrawals cannot oversell
+    reservation = reserve_inventory(blood_group, units_requested)
     
-    if current_inventory < units_requested:
+    if not reservation:
+        current_inventory = blood_inventory.get(blood_group, {}).get('units', 0)
         flash(f'Not enough {blood_group} blood available! Available: {current_inventory} units', 'warning')
         return redirect(url_for('requestor_dashboard', requestor_id=requestor_id))
     
     # Remove from inventory
-    update_inventory(blood_group, units_requested, 'remove')
-    record_inventory_transaction(blood_group, units_requested, 'withdrawn', 
-                                f'Requestor {requestor_id} withdrew {units_requested} units')
+    commit_reservation(reservation, f'Requestor {requestor_id} withdrew {units_requested} units')
     
     # Update request fulfillment if linked
     if request_id and request_id in blood_requests_db:
@@ -674,8 +1990,10 @@ def requestor_take_from_inventory(requestor_id):
         req_data['fulfilled_units'] = req_data.get('fulfilled_units', 0) + units_requested
         
         remaining = get_request_remaining_units(request_id)
+        reprioritize_request(req_data)
         if remaining <= 0:
-            req_data['status'] = 'fulfilled'
+            set_request_status(req_data, 'fulfilled')
+        persist_record('blood_requests', request_id, req_data)
     
     flash(f'Successfully withdrew {units_requested} unit(s) of {blood_group} blood from inventory!', 'success')
     if request_id and request_id in blood_requests_db:
@@ -684,24 +2002,48 @@ def requestor_take_from_inventory(requestor_id):
 
 @app.route('/api/matching-donors/<request_id>')
 def api_get_matching_donors(request_id):
-    """API endpoint to get matching donors for a blood request"""
+    """
+    API endpoint to get matching donors for a blood request
+    Optional ?radius_km= and/or ?k= search around the hospital, nearest first
+    """
     request_data = blood_requests_db.get(request_id)
     if not request_data:
         return jsonify({'status': 'error', 'message': 'Request not found'}), 404
     
-    matching_donors = get_matching_donors_for_request(request_data)
+    try:
+        radius_km = float(request.args['radius_km']) if request.args.get('radius_km') else None
+        k = int(request.args['k']) if request.args.get('k') else None
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'radius_km and k must be numbers'}), 400
+    if (radius_km is not None and radius_km <= 0) or (k is not None and k <= 0):
+        return jsonify({'status': 'error', 'message': 'radius_km and k must be positive'}), 400
+    
+    distances = None
+    if radius_km is None and k is None:
+        matching_donors = get_matching_donors_for_request(request_data)
+    else:
+        point = locate_request(request_data)
+        if point is None:
+            return jsonify({'status': 'error', 'message': 'Request location unknown: no hospital or requestor pincode'}), 400
+        today = today_ordinal()
+        distances = find_donors_near(request_data['blood_group'], point, radius_km, k,
+                                     accept=lambda donor_id: can_donate(donors_db[donor_id], today))
+        matching_donors = [donors_db[donor_id] for donor_id in distances]
     
     donors_list = []
     for donor in matching_donors:
-        donors_list.append({
+        entry = {
             'donor_id': donor['donor_id'],
             'name': donor['name'],
             'blood_group': donor['blood_group'],
             'city': donor['city'],
             'state': donor['state'],
             'total_donations': donor['total_donations'],
-            'can_donate_now': can_donate(donor.get('last_donation'))
-        })
+            'can_donate_now': can_donate(donor)
+        }
+        if distances is not None:
+            entry['distance_km'] = round(distances[donor['donor_id']], 1)
+        donors_list.append(entry)
     
     return jsonify({
         'status': 'success',
@@ -712,48 +2054,24 @@ def api_get_matching_donors(request_id):
 # ============== BLOOD REQUEST ROUTES ==============
 
 @app.route('/request-blood', methods=['GET', 'POST'])
+@writes_shared_state
 def request_blood():
     """Create blood request"""
     if request.method == 'POST':
-        request_id = generate_request_id()
-        
-        request_data = {
-            'request_id': request_id,
-            'requestor_id': request.form.get('requestor_id', 'GUEST'),
-            'patient_name': request.form['patient_name'],
-            'patient_age': int(request.form['patient_age']),
-            'patient_gender': request.form['patient_gender'],
-            'blood_group': request.form['blood_group'],
-            'units_needed': int(request.form['units_needed']),
-            'hospital_name': request.form['hospital_name'],
-            'hospital_address': request.form['hospital_address'],
-            'location': request.form.get('city', ''),
-            'city': request.form.get('city', ''),
-            'state': request.form.get('state', ''),
-            'contact_name': request.form['contact_name'],
-            'contact_phone': request.form['contact_phone'],
-            'contact_email': request.form.get('contact_email', ''),
-            'urgency': request.form.get('urgency', 'normal'),
-            'required_date': request.form['required_date'],
-            'reason': request.form.get('reason', ''),
-            'status': 'pending',
-            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'matched_donors': [],
-            'fulfilled_units': 0,
-            'accepted_donors': [],
-            'donor_donations': []
-        }
+        try:
+            request_data = new_blood_request_record(request.form)
+        except ValueError as e:
+            flash(f'{e}!', 'error')
+            return redirect(url_for('request_blood'))
         
-        blood_requests_db[request_id] = request_data
+        error = validate_blood_request(request_data)
+        if error:
+            flash(error, 'error')
+            return redirect(url_for('request_blood'))
         
-        # Update requestor stats if registered
-        requestor_id = request_data['requestor_id']
-        if requestor_id in requestors_db:
-            requestors_db[requestor_id]['total_requests'] += 1
-        
-        # Run matching algorithm
-        match_results = match_blood_request(request_data)
-        blood_requests_db[request_id]['matched_donors'] = [d['donor_id'] for d in match_results['compatible_donors']]
+        # Store the request and run the matching algorithm
+        create_blood_requests([request_data])
+        request_id = request_data['request_id']
         
         flash(f'Blood request created! Request ID: {request_id}', 'success')
         return redirect(url_for('request_details', request_id=request_id))
@@ -800,21 +2118,13 @@ def search_donors():
         
         search_performed = True
         
-        for donor in donors_db.values():
-            match = True
-            
-            if blood_group and donor['blood_group'] != blood_group:
-                match = False
-            
-            if location:
-                loc_match = (location.lower() in donor['city'].lower() or 
-                           location.lower() in donor['state'].lower() or
-                           location.lower() in donor['pincode'])
-                if not loc_match:
-                    match = False
-            
-            if match and donor['available'] and donor['status'] == 'active':
-                results.append(donor)
+        donor_ids = active_donor_ids
+        if blood_group:
+            donor_ids = donor_ids & donors_by_group.get(blood_group, set())
+        if location:
+            donor_ids = find_donor_ids_by_location(location, include_pincode=True, within=donor_ids)
+        
+        results = [donors_db[donor_id] for donor_id in in_registration_order(donor_ids)]
     
     return render_template('search_donors.html', results=results, 
                           search_performed=search_performed)
@@ -829,36 +2139,316 @@ def blood_inventory_view():
 
 @app.route('/dashboard')
 def admin_dashboard():
-    """Admin dashboard"""
-    stats = get_statistics()
-    
-    # Get all data for admin view
-    all_donors = list(donors_db.values())
-    all_requests = sorted(blood_requests_db.values(), 
-                         key=lambda x: x['created_at'], reverse=True)
-    all_donations = sorted(donations_db.values(),
-                          key=lambda x: x['donation_date'], reverse=True)
+    """
+    Admin dashboard
+    Donors, requests and donations are paged and filtered on the server from pre-sorted indexes
+    """
+    return render_template('admin_dashboard.html', stats=get_statistics(),
+                          critical_requests=get_critical_requests(DASHBOARD_CRITICAL_COUNT),
+                          forecast=get_inventory_forecast(),
+                          **dashboard_pages(repository, request.args, DASHBOARD_PAGE_SIZE))
+
+@app.route('/api/matching/pending')
+def api_match_pending_requests():
+    """API endpoint to match every pending blood request in one batch"""
+    pending = [r for r in blood_requests_db.values() if r['status'] == 'pending']
+    results = match_blood_requests(pending)
     
-    return render_template('admin_dashboard.html', stats=stats, 
-                          donors=all_donors, requests=all_requests,
-                          donations=all_donations)
+    return jsonify({
+        'status': 'success',
+        'matched_requests': len(results),
+        'requests': {
+            request_id: {
+                'exact_match_inventory': result['exact_match_inventory'],
+                'total_compatible': result['total_compatible'],
+                'fulfillable': result['fulfillable'],
+                'donors': [
+                    {'donor_id': d['donor_id'], 'match_score': d['match_score'], 'can_donate_now': d['can_donate_now']}
+                    for d in result['compatible_donors']
+                ]
+            }
+            for request_id, result in results.items()
+        }
+    })
+
+@app.route('/api/requests/next')
+def api_next_critical_request():
+    """API endpoint to get the most critical open request"""
+    request_data = get_next_critical_request()
+    if request_data is None:
+        return jsonify({'status': 'success', 'request': None})
+    return jsonify({
+        'status': 'success',
+        'request': {**{field: request_data.get(field) for field in REQUEST_API_DEFAULT_FIELDS},
+                    'remaining_units': get_request_remaining_units(request_data['request_id'])}
+    })
+
+@app.route('/api/requests/critical')
+def api_critical_requests():
+    """API endpoint to get the k most critical open requests (?k=, default 10)"""
+    try:
+        k = int(request.args.get('k', DASHBOARD_CRITICAL_COUNT))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'k must be a number'}), 400
+    k = max(1, min(k, API_MAX_PAGE_SIZE))
+    
+    requests_list = [
+        {**{field: request_data.get(field) for field in REQUEST_API_DEFAULT_FIELDS},
+         'remaining_units': get_request_remaining_units(request_data['request_id'])}
+        for request_data in get_critical_requests(k)
+    ]
+    return jsonify({'status': 'success', 'count': len(requests_list), 'requests': requests_list})
+
+@app.route('/api/import/<kind>', methods=['POST'])
+def api_bulk_import(kind):
+    """
+    API endpoint to bulk import donors or blood requests from CSV or JSON Lines
+    Send the file as multipart field `file` or as the raw request body
+    Optional ?format=csv|jsonl (guessed from the file name / content type) and ?dry_run=1
+    """
+    if kind not in IMPORTERS:
+        return jsonify({'status': 'error', 'message': f"Unknown import type: {kind}"}), 404
+    
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    fmt = request.args.get('format') or detect_format(
+        upload.filename if upload else None, upload.content_type if upload else request.content_type)
+    if fmt not in FORMATS:
+        return jsonify({'status': 'error', 'message': f"format must be one of {', '.join(FORMATS)}"}), 400
+    
+    report = import_records(kind, stream, fmt, dry_run=request.args.get('dry_run') == '1')
+    return jsonify({'status': 'success', 'kind': kind, 'format': fmt, **report.as_dict()})
+
+@app.route('/api/export/<dataset>')
+def api_export(dataset):
+    """
+    API endpoint to export donations or inventory transactions, streamed in chunks
+    ?format=csv|jsonl|parquet, a date range (from/to as YYYY-MM-DD, or month as YYYY-MM)
+    and an optional blood_group
+    """
+    if dataset not in EXPORT_SOURCES:
+        return jsonify({'status': 'error', 'message': f"Unknown dataset: {dataset}"}), 404
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'status': 'error', 'message': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    if fmt == 'parquet' and not parquet_available():
+        return jsonify({'status': 'error', 'message': 'Parquet export needs pyarrow on the server'}), 501
+    start, end, error = parse_date_range(request.args)
+    if error:
+        return jsonify({'status': 'error', 'message': error}), 400
+    
+    records = EXPORT_SOURCES[dataset](start, end, request.args.get('blood_group'))
+    filename = '_'.join(filter(None, [dataset, start, end])) + f'.{fmt}'
+    return Response(stream_export(records, EXPORT_SCHEMAS[dataset], fmt), mimetype=MIMETYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.route('/api/reports/monthly')
+def api_monthly_report():
+    """API endpoint for a month's donations and withdrawals per blood group (?month=YYYY-MM, default this month)"""
+    month = request.args.get('month') or date.today().strftime('%Y-%m')
+    start, end, error = parse_date_range({'month': month})
+    if error:
+        return jsonify({'status': 'error', 'message': error}), 400
+    return jsonify({'month': month, 'from': start, 'to': end, 'blood_groups': monthly_report(start, end)})
+
+@app.route('/api/campaigns', methods=['GET', 'POST'])
+def api_campaigns():
+    """
+    API endpoint for donor recall campaigns
+    GET lists campaigns, newest first; POST {"blood_group": ..., "limit": ...} starts one
+    """
+    if request.method == 'GET':
+        return jsonify(sorted(campaigns_db.values(), key=itemgetter('created_at'), reverse=True))
+    
+    data = request.get_json(silent=True) or request.form
+    blood_group = data.get('blood_group')
+    if blood_group not in BLOOD_COMPATIBILITY:
+        return jsonify({'status': 'error', 'message': f"Unknown blood group: {blood_group}"}), 400
+    try:
+        limit = int(data['limit']) if data.get('limit') else None
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'limit must be a number'}), 400
+    campaign = start_recall_campaign(blood_group, limit=limit, reason=data.get('reason') or 'manual')
+    return jsonify(campaign), 202
+
+@app.route('/api/campaigns/<campaign_id>')
+def api_campaign(campaign_id):
+    """API endpoint for one recall campaign's progress"""
+    campaign = campaigns_db.get(campaign_id)
+    if not campaign:
+        return jsonify({'status': 'error', 'message': 'Campaign not found'}), 404
+    return jsonify({**campaign, 'sender_queue': len(notification_outbox)})
+
+@app.route('/api/notifications/metrics')
+def api_notification_metrics():
+    """API endpoint for notification outbox queue depth, delivery lag and retry counters"""
+    return jsonify(notification_outbox.metrics())
+
+@app.route('/api/inventory/forecast')
+def api_inventory_forecast():
+    """API endpoint for projected days until stock-out per blood group"""
+    forecast = get_inventory_forecast()
+    return jsonify({
+        'as_of': date.today().isoformat(),
+        'days_fitted': inventory_forecaster.days_fitted,
+        'warning_days': STOCKOUT_WARNING_DAYS,
+        'critical_days': STOCKOUT_CRITICAL_DAYS,
+        'blood_groups': forecast
+    })
+
+@app.route('/api/inventory/transactions/summary')
+def api_transaction_summary():
+    """
+    API endpoint for inventory transaction totals from the rollups
+    ?days=N (default 7, including today), optional blood_group and type,
+    and granularity=day|hour for a per-day or per-hour series
+    """
+    blood_group = request.args.get('blood_group') or None
+    transaction_type = request.args.get('type') or None
+    granularity = request.args.get('granularity', 'day')
+    try:
+        days = int(request.args.get('days', 7))
+    except ValueError:
+        days = 0
+    if days < 1:
+        return jsonify({'status': 'error', 'message': 'days must be a positive integer'}), 400
+    if blood_group and blood_group not in BLOOD_COMPATIBILITY:
+        return jsonify({'status': 'error', 'message': f"Unknown blood group: {blood_group}"}), 400
+    if transaction_type and transaction_type not in TRANSACTION_TYPES:
+        return jsonify({'status': 'error', 'message': f"type must be one of {', '.join(TRANSACTION_TYPES)}"}), 400
+    if granularity not in ('day', 'hour'):
+        return jsonify({'status': 'error', 'message': 'granularity must be day or hour'}), 400
+    
+    today = date.today().toordinal()
+    start = today - days + 1
+    count, units = get_transaction_totals(blood_group, transaction_type, days)
+    if granularity == 'day':
+        rows = inventory_transactions_db.daily_series(start, today, blood_group, transaction_type)
+        series = [{'date': date.fromordinal(day).isoformat(), 'count': c, 'units': u} for day, c, u in rows]
+    else:
+        rows = inventory_transactions_db.hourly_series(start, today, blood_group, transaction_type)
+        series = [{'date': date.fromordinal(day).isoformat(), 'hour': hour, 'count': c, 'units': u}
+                  for day, hour, c, u in rows]
+    return jsonify({
+        'from': date.fromordinal(start).isoformat(), 'to': date.fromordinal(today).isoformat(),
+        'blood_group': blood_group, 'type': transaction_type, 'count': count, 'units': units, 'series': series
+    })
 
 @app.route('/api/statistics')
 def api_statistics():
     """API endpoint for statistics"""
     return jsonify(get_statistics())
 
+@app.route('/api/statistics/stream')
+def api_statistics_stream():
+    """
+    Server-Sent Events stream of statistics
+    Sends a full snapshot first, then only the changed fields after each write
+    """
+    def generate():
+        version = stats_version['value']
+        last = get_statistics_snapshot()
+        yield f"event: snapshot\ndata: {json.dumps(last)}\n\n"
+        
+        while True:
+            new_version = wait_for_statistics_change(version, STATS_STREAM_KEEPALIVE)
+            if new_version == version:
+                yield ": keepalive\n\n"
+                continue
+            
+            version = new_version
+            current = get_statistics_snapshot()
+            delta = diff_statistics(last, current)
+            if delta:
+                last = current
+                yield f"event: delta\ndata: {json.dumps(delta)}\n\n"
+    
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/statistics/consistency')
+def api_statistics_consistency():
+    """API endpoint to check the statistics counters against a full recount (read-only)"""
+    drift = check_statistics_consistency()
+    return jsonify({
+        'status': 'drift' if drift else 'consistent',
+        'drift': drift
+    })
+
+@app.route('/api/statistics/consistency/repair', methods=['POST'])
+def api_statistics_consistency_repair():
+    """API endpoint to reset drifted statistics counters to a full recount; reports the drift it repaired"""
+    drift = check_statistics_consistency(repair=True)
+    return jsonify({
+        'status': 'repaired' if drift else 'consistent',
+        'drift': drift
+    })
+
 @app.route('/api/donors')
 def api_donors():
-    """API endpoint for donors"""
-    return jsonify(list(donors_db.values()))
+    """
+    API endpoint for donors
+    Cursor-paginated (cursor, limit), filtered (blood_group, status, city, available)
+    and projected (fields); the next cursor is sent in the X-Next-Cursor header
+    """
+    cursor, limit, fields, error = parse_page_args(DONOR_API_FIELDS, DONOR_API_DEFAULT_FIELDS)
+    if error:
+        return jsonify({'status': 'error', 'message': error}), 400
+    
+    blood_group = request.args.get('blood_group')
+    status = request.args.get('status')
+    city = request.args.get('city')
+    available = request.args.get('available')
+    city_ids = donors_by_city.get(normalize_location(city), set()) if city else None
+    
+    def predicate(donor_id):
+        donor = donors_db[donor_id]
+        if blood_group and donor['blood_group'] != blood_group:
+            return False
+        if status and donor['status'] != status:
+            return False
+        if city_ids is not None and donor_id not in city_ids:
+            return False
+        if available is not None and donor['available'] != (available.lower() == 'true'):
+            return False
+        return True
+    
+    page, next_cursor = paginate_ids(donor_ids_sorted, cursor, limit, predicate)
+    return stream_json_page((donors_db[donor_id] for donor_id in page), fields, next_cursor)
 
 @app.route('/api/requests')
 def api_requests():
-    """API endpoint for blood requests"""
-    return jsonify(list(blood_requests_db.values()))
+    """
+    API endpoint for blood requests
+    Cursor-paginated (cursor, limit), filtered (blood_group, status, city, urgency)
+    and projected (fields); the next cursor is sent in the X-Next-Cursor header
+    """
+    cursor, limit, fields, error = parse_page_args(REQUEST_API_FIELDS, REQUEST_API_DEFAULT_FIELDS)
+    if error:
+        return jsonify({'status': 'error', 'message': error}), 400
+    
+    blood_group = request.args.get('blood_group')
+    status = request.args.get('status')
+    city = normalize_location(request.args.get('city'))
+    urgency = request.args.get('urgency')
+    
+    def predicate(request_id):
+        request_data = blood_requests_db[request_id]
+        if blood_group and request_data['blood_group'] != blood_group:
+            return False
+        if status and request_data['status'] != status:
+            return False
+        if city and normalize_location(request_data.get('city')) != city:
+            return False
+        if urgency and request_data.get('urgency') != urgency:
+            return False
+        return True
+    
+    page, next_cursor = paginate_ids(request_ids_sorted, cursor, limit, predicate)
+    return stream_json_page((blood_requests_db[request_id] for request_id in page), fields, next_cursor)
 
 @app.route('/request/<request_id>/fulfill', methods=['POST'])
+@writes_shared_state
 def fulfill_request(request_id):
     """Mark request as fulfilled"""
     request_data = blood_requests_db.get(request_id)
@@ -868,18 +2458,33 @@ def fulfill_request(request_id):
     
     units_fulfilled = int(request.form.get('units_fulfilled', 0))
     
+    if units_fulfilled <= 0:
+        flash('Units must be greater than 0!', 'error')
+        return redirect(url_for('request_details', request_id=request_id))
+    
+    # Reserve the units atomically so fulfilment cannot take more than is in stock
+    blood_group = request_data['blood_group']
+    reservation = reserve_inventory(blood_group, units_fulfilled)
+    
+    if not reservation:
+        current_inventory = blood_inventory.get(blood_group, {}).get('units', 0)
+        flash(f'Not enough {blood_group} blood available! Available: {current_inventory} units', 'warning')
+        return redirect(url_for('request_details', request_id=request_id))
+    
+    # Remove from inventory
+    commit_reservation(reservation, f'Request {request_id} fulfilled with {units_fulfilled} units')
+    
     request_data['fulfilled_units'] += units_fulfilled
+    reprioritize_request(request_data)
     
     if request_data['fulfilled_units'] >= request_data['units_needed']:
-        request_data['status'] = 'fulfilled'
+        set_request_status(request_data, 'fulfilled')
         flash('Request fully fulfilled!', 'success')
     else:
-        request_data['status'] = 'partial'
+        set_request_status(request_data, 'partial')
         remaining = request_data['units_needed'] - request_data['fulfilled_units']
         flash(f'Partially fulfilled! {remaining} units still needed.', 'info')
-    
-    # Update inventory
-    update_inventory(request_data['blood_group'], units_fulfilled, 'remove')
+    persist_record('blood_requests', request_id, request_data)
     
     return redirect(url_for('request_details', request_id=request_id))
 
@@ -890,6 +2495,40 @@ def logout():
     flash('Logged out successfully!', 'success')
     return redirect(url_for('home'))
 
+@app.cli.command('export')
+@click.argument('dataset', type=click.Choice(list(EXPORT_SOURCES)))
+@click.argument('output', type=click.File('wb'))
+@click.option('--format', 'fmt', type=click.Choice(EXPORT_FORMATS), default='csv')
+@click.option('--from', 'start', help='First date, YYYY-MM-DD')
+@click.option('--to', 'end', help='Last date, YYYY-MM-DD')
+@click.option('--month', help='A whole month, YYYY-MM')
+@click.option('--blood-group')
+def export_command(dataset, output, fmt, start, end, month, blood_group):
+    """Export donations or inventory transactions to a file ('-' for stdout)"""
+    start, end, error = parse_date_range({'from': start, 'to': end, 'month': month})
+    if error:
+        raise click.BadParameter(error)
+    if fmt == 'parquet' and not parquet_available():
+        raise click.UsageError('Parquet export needs pyarrow (pip install -r requirements-optional.txt)')
+    for chunk in stream_export(EXPORT_SOURCES[dataset](start, end, blood_group), EXPORT_SCHEMAS[dataset], fmt):
+        output.write(chunk.encode() if isinstance(chunk, str) else chunk)
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(list(IMPORTERS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults to the file extension')
+@click.option('--dry-run', is_flag=True, help='Validate rows without storing them')
+def import_command(kind, path, fmt, dry_run):
+    """Bulk import donors or blood requests from a CSV or JSON Lines file"""
+    if not wal and not shared_state and not dry_run:
+        click.echo('Warning: HEMALINK_DATA_DIR is not set, imported records will not outlive this command')
+    with open(path, 'rb') as f:
+        report = import_records(kind, f, fmt or detect_format(path), dry_run=dry_run)
+    for error in report.errors:
+        click.echo(f"line {error['line']}: {error['error']}")
+    click.echo(f"{'validated' if dry_run else 'imported'} {report.imported} {kind}, {report.failed} failed, "
+               f"{report.seconds:.2f} s ({report.rows_per_second:,} rows/s)")
+
 # ============== ERROR HANDLERS ==============
 
 @app.errorhandler(404)
@@ -1019,8 +2658,12 @@ def init_sample_data():
     ]
     
     for donor in sample_donors:
+        set_last_donation(donor, donor['last_donation'])
         donors_db[donor['donor_id']] = donor
-        blood_inventory[donor['blood_group']]['donors'].append(donor['donor_id'])
+        index_donor(donor)
+        inventory_donors = blood_inventory[donor['blood_group']]['donors']
+        inventory_donors.append(donor['donor_id'])
+        persist('inventory_donor', donor['blood_group'], len(inventory_donors) - 1, donor['donor_id'])
     
     # Sample requestors
     sample_requestors = [
@@ -1041,6 +2684,7 @@ def init_sample_data():
     
     for requestor in sample_requestors:
         requestors_db[requestor['requestor_id']] = requestor
+        persist_record('requestors', requestor['requestor_id'], requestor)
     
     # Sample blood requests
     sample_requests = [
@@ -1054,6 +2698,7 @@ def init_sample_data():
             'units_needed': 2,
             'hospital_name': 'City General Hospital',
             'hospital_address': 'Hospital Road, Hyderabad',
+            'hospital_pincode': '500001',
             'location': 'Hyderabad',
             'city': 'Hyderabad',
             'state': 'Telangana',
@@ -1071,10 +2716,62 @@ def init_sample_data():
     ]
     
     for req in sample_requests:
-        blood_requests_db[req['request_id']] = req
+        add_blood_request(req)
+
+def restore_state(state):
+    """Load recovered stores and rebuild every index and counter from them"""
+    for donor in state['donors'].values():
+        donors_db[donor['donor_id']] = donor
+        index_donor(donor)
+    requestors_db.update(state['requestors'])
+    for request_data in state['blood_requests'].values():
+        add_blood_request(request_data)
+    for donation_data in state['donations'].values():
+        add_donation(donation_data)
+    donation_fulfillments_db.update(state['donation_fulfillments'])
+    if state['transaction_log']:
+        inventory_transactions_db.load_state(state['transaction_log'])
+        inventory_forecaster.reset()
+    for transaction in state['inventory_transactions']:
+        if isinstance(transaction, dict):
+            # Logged before transactions carried sequence numbers
+            timestamp = datetime.strptime(transaction['timestamp'], '%Y-%m-%d %H:%M:%S').timestamp()
+            inventory_transactions_db.append(timestamp, transaction['blood_group'], transaction['type'],
+                                             transaction['units'], transaction['details'])
+        else:
+            sequence, timestamp, blood_group, transaction_type, units, details = transaction
+            inventory_transactions_db.append(timestamp, blood_group, transaction_type, units, details,
+                                             sequence=sequence)
+    blood_inventory.update(state['inventory'])
+    for blood_group in blood_inventory:
+        inventory_locks.setdefault(blood_group, threading.Lock())
+    inventory_totals['units'] = sum(inv['units'] for inv in blood_inventory.values())
+
+def init_data():
+    """Recover persisted data, or seed sample data on first start"""
+    if shared_state:
+        shared_state.join(restore_state, apply_shared_op, lambda: collect_stores(PERSISTED_STORES), init_sample_data)
+        print(f"[shared-state] Joined {SHARED_STATE_SOCKET} at log position {shared_state.sequence}")
+        return
+    if not wal:
+        init_sample_data()
+        return
+    
+    state, report = wal.recover()
+    if state is None:
+        init_sample_data()
+        wal.open(PERSISTED_STORES)
+        wal.snapshot()
+        print(f"[persistence] New data directory {DATA_DIR}: seeded sample data")
+    else:
+        restore_state(state)
+        wal.open(PERSISTED_STORES)
+        print(f"[persistence] Recovered {report['snapshot_records']} snapshot records and "
+              f"replayed {report['replayed_ops']} log ops in {report['total_seconds']} s")
+    atexit.register(wal.close)
 
-# Initialize sample data
-init_sample_data()
+# Initialize data
+init_data()
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -2,8 +2,18 @@ from flask import Flask, render_template, request, redirect, url_for, flash, ses
 from datetime import datetime
 import uuid
 import os
-import boto3
-from botocore.exceptions import ClientError, NoCredentialsError
+import threading
+import time
+import click
+
+from blood_rules import BLOOD_COMPATIBILITY, can_donate, set_last_donation
+from bulk_import import FORMATS, blank_required_error, detect_format, iter_rows, run_import
+from cache import ReadThroughCache, RedisCache, shared_cache_available
+from geo import PincodeGeocoder
+from location_index import SubstringIndex
+from notify import LogBackend, Outbox
+import queries
+from storage import CachedRepository, open_repository
 
 app = Flask(__name__)
 app.secret_key = os.getenv('HEMALINK_SECRET', 'hemalink-secret-key-2026')
@@ -15,59 +25,103 @@ REQUESTORS_TABLE = os.getenv('REQUESTORS_TABLE', 'Requestors')
 REQUESTS_TABLE = os.getenv('REQUESTS_TABLE', 'BloodRequests')
 DONATIONS_TABLE = os.getenv('DONATIONS_TABLE', 'Donations')
 INVENTORY_TABLE = os.getenv('INVENTORY_TABLE', 'BloodInventory')
+TRANSACTIONS_TABLE = os.getenv('TRANSACTIONS_TABLE', 'InventoryTransactions')
+# Point at DynamoDB Local (or another stand-in) for development
+DYNAMODB_ENDPOINT_URL = os.getenv('DYNAMODB_ENDPOINT_URL')
+
+# Global secondary indexes used for per-entity lookups
+DONATIONS_BY_DONOR_INDEX = os.getenv('DONATIONS_BY_DONOR_INDEX', 'donor_id-index')
+REQUESTS_BY_REQUESTOR_INDEX = os.getenv('REQUESTS_BY_REQUESTOR_INDEX', 'requestor_id-index')
+DONORS_BY_BLOOD_GROUP_INDEX = os.getenv('DONORS_BY_BLOOD_GROUP_INDEX', 'blood_group-index')
+# Sorted GSIs backing the paged admin dashboard (sort keys created_at / donation_date)
+REQUESTS_BY_STATUS_INDEX = os.getenv('REQUESTS_BY_STATUS_INDEX', 'status-created_at-index')
+DONATIONS_BY_BLOOD_GROUP_INDEX = os.getenv('DONATIONS_BY_BLOOD_GROUP_INDEX', 'blood_group-donation_date-index')
+# Sparse GSIs ordering the unfiltered dashboard pages newest first (partition key page_partition)
+REQUESTS_PAGE_INDEX = os.getenv('REQUESTS_PAGE_INDEX', 'page_partition-created_at-index')
+DONATIONS_PAGE_INDEX = os.getenv('DONATIONS_PAGE_INDEX', 'page_partition-donation_date-index')
+
+DASHBOARD_PAGE_SIZE = int(os.getenv('DASHBOARD_PAGE_SIZE', '50'))
+
+# Number of segments (and worker threads) used for parallel full-table scans
+SCAN_SEGMENTS = int(os.getenv('SCAN_SEGMENTS', '4'))
+
+# Default search radius when a request can be placed from a pincode
+MATCH_RADIUS_KM = float(os.getenv('MATCH_RADIUS_KM', '50'))
+
+# Rebuild the donor location search index this often, to pick up writes from other instances
+LOCATION_INDEX_REFRESH_SECONDS = int(os.getenv('LOCATION_INDEX_REFRESH_SECONDS', '300'))
+
+# Read-through cache in front of the storage backend (entries live CACHE_TTL_SECONDS, 0 disables).
+# Set CACHE_REDIS_URL to share it between instances through a Redis-compatible server
+# (needs redis, see requirements-optional.txt).
+CACHE_TTL_SECONDS = float(os.getenv('HEMALINK_CACHE_TTL', '30'))
+CACHE_MAX_ITEMS = int(os.getenv('HEMALINK_CACHE_MAX_ITEMS', '10000'))
+CACHE_REDIS_URL = os.getenv('HEMALINK_CACHE_REDIS_URL')
+
+# Journal file of the notification outbox; without it, queued notifications are lost on restart
+NOTIFY_OUTBOX_PATH = os.getenv('HEMALINK_OUTBOX_PATH')
+
+# Storage backend: 'dynamodb' (falls back to 'memory' when AWS is unreachable), 'sqlite' or 'memory'
+STORAGE_BACKEND = os.getenv('HEMALINK_STORAGE', 'dynamodb')
+
+# SQLite backend: database file and the size of its reader connection pool
+SQLITE_PATH = os.getenv('HEMALINK_SQLITE_PATH', 'hemalink.db')
+SQLITE_READERS = int(os.getenv('HEMALINK_SQLITE_READERS', '8'))
+
+
+def open_storage():
+    """Open the configured storage backend, falling back to process memory if DynamoDB is unavailable."""
+    if STORAGE_BACKEND == 'sqlite':
+        return open_repository('sqlite', path=SQLITE_PATH, readers=SQLITE_READERS)
+    if STORAGE_BACKEND != 'dynamodb':
+        return open_repository(STORAGE_BACKEND)
+    try:
+        backend = open_repository(
+            'dynamodb',
+            table_names={'donors': DONORS_TABLE, 'requestors': REQUESTORS_TABLE, 'blood_requests': REQUESTS_TABLE,
+                         'donations': DONATIONS_TABLE, 'inventory': INVENTORY_TABLE,
+                         'inventory_transactions': TRANSACTIONS_TABLE},
+            index_names={'donors': {'blood_group': DONORS_BY_BLOOD_GROUP_INDEX},
+                         'blood_requests': {'requestor_id': REQUESTS_BY_REQUESTOR_INDEX,
+                                            'status': REQUESTS_BY_STATUS_INDEX},
+                         'donations': {'donor_id': DONATIONS_BY_DONOR_INDEX,
+                                       'blood_group': DONATIONS_BY_BLOOD_GROUP_INDEX}},
+            page_index_names={'blood_requests': REQUESTS_PAGE_INDEX, 'donations': DONATIONS_PAGE_INDEX},
+            region=AWS_REGION, endpoint_url=DYNAMODB_ENDPOINT_URL, scan_segments=SCAN_SEGMENTS)
+        # Quick sanity check to surface credential issues
+        backend.check()
+        return backend
+    except Exception as e:
+        print(f"[aws_app] Warning: AWS not available or misconfigured - falling back to local storage. ({e})")
+        return open_repository('memory')
+
+
+shared_cache = None
+if CACHE_REDIS_URL:
+    if shared_cache_available():
+        shared_cache = RedisCache(CACHE_REDIS_URL)
+    else:
+        print("[aws_app] Warning: HEMALINK_CACHE_REDIS_URL is set but redis is not installed - using a local cache only.")
+read_cache = ReadThroughCache(max_items=CACHE_MAX_ITEMS, ttl=CACHE_TTL_SECONDS, shared=shared_cache)
+repository = CachedRepository(open_storage(), read_cache)
 
-# Compatibility matrix (copied from local app)
-BLOOD_COMPATIBILITY = {
-    'A+': ['A+', 'A-', 'O+', 'O-'],
-    'A-': ['A-', 'O-'],
-    'B+': ['B+', 'B-', 'O+', 'O-'],
-    'B-': ['B-', 'O-'],
-    'AB+': ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-'],
-    'AB-': ['A-', 'B-', 'AB-', 'O-'],
-    'O+': ['O+', 'O-'],
-    'O-': ['O-']
-}
+# ---------- Helpers ----------
 
-# Attempt to initialize AWS resources
-use_aws = True
-try:
-    session = boto3.Session(region_name=AWS_REGION)
-    dynamodb = session.resource('dynamodb')
-
-    # Table objects
-    donors_table = dynamodb.Table(DONORS_TABLE)
-    requestors_table = dynamodb.Table(REQUESTORS_TABLE)
-    requests_table = dynamodb.Table(REQUESTS_TABLE)
-    donations_table = dynamodb.Table(DONATIONS_TABLE)
-    inventory_table = dynamodb.Table(INVENTORY_TABLE)
-
-    # Quick sanity check: call list_tables or describe a table to surface credential issues
-    _ = session.client('dynamodb').list_tables(Limit=1)
-except (NoCredentialsError, ClientError, Exception) as e:
-    print(f"[aws_app] Warning: AWS not available or misconfigured - falling back to local storage. ({e})")
-    use_aws = False
-
-# Local in-memory stores as fallback
-local_donors = {}
-local_requestors = {}
-local_requests = {}
-local_donations = {}
-local_inventory = {
-    'A+': {'units': 0, 'donors': []},
-    'A-': {'units': 0, 'donors': []},
-    'B+': {'units': 0, 'donors': []},
-    'B-': {'units': 0, 'donors': []},
-    'AB+': {'units': 0, 'donors': []},
-    'AB-': {'units': 0, 'donors': []},
-    'O+': {'units': 0, 'donors': []},
-    'O-': {'units': 0, 'donors': []}
-}
+# Admin notifications are queued here and delivered by background workers, so handlers never wait on them.
+# Swap LogBackend for an SNS / SES backend with the same send_batch() interface to deliver for real.
+notification_outbox = Outbox({'admin': LogBackend('admin')},
+                             path=NOTIFY_OUTBOX_PATH,
+                             rates={'admin': float(os.getenv('HEMALINK_NOTIFY_RATE', '20'))},
+                             workers=int(os.getenv('HEMALINK_NOTIFY_WORKERS', '2')),
+                             batch_size=int(os.getenv('HEMALINK_NOTIFY_BATCH_SIZE', '100')),
+                             max_attempts=int(os.getenv('HEMALINK_NOTIFY_MAX_ATTEMPTS', '5')))
+if not NOTIFY_OUTBOX_PATH:
+    print("[aws_app] Warning: HEMALINK_OUTBOX_PATH is not set - queued notifications will not survive a restart.")
 
-# ---------- Helpers ----------
 
-def send_notification(subject, message):
-    """Log notification (SNS removed)."""
-    print(f"[notify] {subject}: {message}")
+def send_notification(subject, message, dedup_key=None):
+    """Queue an admin notification for background delivery; the same `dedup_key` is only sent once."""
+    notification_outbox.enqueue('admin', {'subject': subject, 'body': message}, dedup_key=dedup_key)
 
 
 def _gen_id(prefix):
@@ -78,180 +132,382 @@ def _now():
     return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
 
-# ---------- DynamoDB wrappers with fallback ----------
+# ---------- Storage helpers ----------
 
-def put_item(table, item):
-    if use_aws:
-        try:
-            table.put_item(Item=item)
-            return True
-        except ClientError as e:
-            print(f"DynamoDB put_item error: {e}")
-            return False
-    # fallback
-    if table is donors_table or (not use_aws and table == DONORS_TABLE):
-        local_donors[item['donor_id']] = item
-    elif table is requestors_table or (not use_aws and table == REQUESTORS_TABLE):
-        local_requestors[item['requestor_id']] = item
-    elif table is requests_table or (not use_aws and table == REQUESTS_TABLE):
-        local_requests[item['request_id']] = item
-    elif table is donations_table or (not use_aws and table == DONATIONS_TABLE):
-        local_donations[item['donation_id']] = item
-    elif table is inventory_table or (not use_aws and table == INVENTORY_TABLE):
-        local_inventory[item['blood_group']] = item
-    return True
+def save_donor(donor):
+    """Store a donor and, once stored, refresh it in the location search index."""
+    stored = repository.put('donors', donor)
+    if stored:
+        index_donor_location(donor)
+    return stored
 
 
-def get_item(table, key):
-    if use_aws:
-        try:
-            resp = table.get_item(Key=key)
-            return resp.get('Item')
-        except ClientError as e:
-            print(f"DynamoDB get_item error: {e}")
-            return None
-    # fallback
-    # Figure out which local dict
-    if table is donors_table or (not use_aws and table == DONORS_TABLE):
-        return local_donors.get(key.get('donor_id'))
-    if table is requestors_table or (not use_aws and table == REQUESTORS_TABLE):
-        return local_requestors.get(key.get('requestor_id'))
-    if table is requests_table or (not use_aws and table == REQUESTS_TABLE):
-        return local_requests.get(key.get('request_id'))
-    if table is inventory_table or (not use_aws and table == INVENTORY_TABLE):
-        inv = local_inventory.get(key.get('blood_group'))
-        if inv is None:
-            return None
-        return { 'blood_group': key.get('blood_group'), **inv }
-    return None
+def save_donors(donors):
+    """Store many donors in one batch and, once stored, add them to the location search index."""
+    stored = repository.put_many('donors', donors)
+    if stored:
+        for donor in donors:
+            index_donor_location(donor)
+    return stored
 
 
-def scan_table(table, filter_expression=None):
-    if use_aws:
-        try:
-            resp = table.scan()
-            return resp.get('Items', [])
-        except ClientError as e:
-            print(f"DynamoDB scan error: {e}")
-            return []
-    # fallback
-    if table is donors_table or (not use_aws and table == DONORS_TABLE):
-        return list(local_donors.values())
-    if table is requestors_table or (not use_aws and table == REQUESTORS_TABLE):
-        return list(local_requestors.values())
-    if table is requests_table or (not use_aws and table == REQUESTS_TABLE):
-        return list(local_requests.values())
-    if table is donations_table or (not use_aws and table == DONATIONS_TABLE):
-        return list(local_donations.values())
-    if table is inventory_table or (not use_aws and table == INVENTORY_TABLE):
-        return [ { 'blood_group': k, **v } for k, v in local_inventory.items() ]
-    return []
+def get_donations_by_donor(donor_id):
+    return repository.find('donations', 'donor_id', donor_id)
 
 
-# ---------- Re-usable Matching & Inventory logic ----------
+def get_requests_by_requestor(requestor_id):
+    return repository.find('blood_requests', 'requestor_id', requestor_id)
+
+
+def get_donors_by_blood_group(blood_group):
+    return repository.find('donors', 'blood_group', blood_group)
 
-def can_donate(last_donation_date):
-    if not last_donation_date:
-        return True
+
+def get_inventory():
+    """Every blood group's inventory item, with zero units for groups never stocked."""
+    stored = {item['blood_group']: item for item in repository.scan('inventory')}
+    return {bg: {'blood_group': bg, 'units': 0, 'donors': [], **stored.get(bg, {})} for bg in BLOOD_COMPATIBILITY}
+
+
+# ---------- Donor location search index ----------
+# Process-local substring index over each donor's city+state+pincode, so a
+# location search only fetches the donors that match. Writes through
+# save_donor() update it; a periodic rebuild picks up other instances' writes.
+# A rebuild scans into a fresh index on one background thread while searches
+# keep using the current one; donors saved during the scan are merged in
+# before the swap, so they are never lost to the scan's older copy.
+
+donor_location_index = SubstringIndex()
+donor_search_groups = {}
+donor_search_order = {}
+donor_search_built_at = {'value': None}
+# The running rebuild thread, and {donor_id: donor} saved while it scans
+donor_search_rebuild = {'thread': None, 'writes': None}
+donor_search_lock = threading.Lock()
+
+
+def donor_location_text(donor):
+    """The text a location search is matched against (same as the original scan)."""
+    return (donor.get('city', '') + donor.get('state', '') + donor.get('pincode', '')).lower()
+
+
+def _add_donor_location(index, groups, order, donor):
+    donor_id = donor['donor_id']
+    index.add(donor_id, donor_location_text(donor))
+    groups[donor_id] = donor.get('blood_group')
+    order.setdefault(donor_id, len(order))
+
+
+def index_donor_location(donor):
+    """Add or refresh a donor in the location index, and in the one being rebuilt."""
+    with donor_search_lock:
+        if donor_search_rebuild['writes'] is not None:
+            donor_search_rebuild['writes'][donor['donor_id']] = donor
+        if donor_search_built_at['value'] is not None:
+            _add_donor_location(donor_location_index, donor_search_groups, donor_search_order, donor)
+
+
+def rebuild_donor_location_index():
+    """Scan the donors table into a fresh index, merge the donors saved meanwhile and swap it in."""
+    global donor_location_index, donor_search_groups, donor_search_order
     try:
-        last = datetime.strptime(last_donation_date, '%Y-%m-%d')
-        return (datetime.now() - last).days >= 56
-    except Exception:
-        return True
-
-
-def calculate_donor_eligibility(donor):
-    score = 100
-    age = donor.get('age', 0)
-    if 25 <= age <= 45:
-        score += 10
-    elif age < 18 or age > 65:
-        score -= 50
-    if not donor.get('available', True):
-        score -= 100
-    last_donation = donor.get('last_donation')
-    if last_donation:
-        try:
-            days_since = (datetime.now() - datetime.strptime(last_donation, '%Y-%m-%d')).days
-            if days_since > 90:
-                score += 5
-        except Exception:
-            pass
-    else:
-        score += 10
-    score += min(donor.get('total_donations', 0) * 2, 20)
-    return max(0, min(score, 150))
+        index, groups, order = SubstringIndex(), {}, {}
+        for donor in repository.scan('donors'):
+            _add_donor_location(index, groups, order, donor)
+        with donor_search_lock:
+            for donor in donor_search_rebuild['writes'].values():
+                _add_donor_location(index, groups, order, donor)
+            donor_location_index, donor_search_groups, donor_search_order = index, groups, order
+            donor_search_built_at['value'] = time.monotonic()
+    finally:
+        with donor_search_lock:
+            donor_search_rebuild.update(thread=None, writes=None)
+
+
+def ensure_donor_location_index():
+    """
+    Build the location index on first use (waiting for it), and rebuild it in the background when stale;
+    concurrent callers share the one rebuild in flight.
+    """
+    built_at = donor_search_built_at['value']
+    if built_at is not None and time.monotonic() - built_at < LOCATION_INDEX_REFRESH_SECONDS:
+        return
+    with donor_search_lock:
+        rebuild = donor_search_rebuild['thread']
+        if rebuild is None:
+            donor_search_rebuild['writes'] = {}
+            rebuild = donor_search_rebuild['thread'] = threading.Thread(
+                target=rebuild_donor_location_index, name='donor-location-index', daemon=True)
+            rebuild.start()
+    if built_at is None:
+        rebuild.join()
+
+
+def find_donor_ids_by_location(location, blood_group=None):
+    """IDs of donors whose city+state+pincode contains `location` (case-insensitive)."""
+    ensure_donor_location_index()
+    with donor_search_lock:
+        donor_ids = donor_location_index.search(location.lower())
+        if blood_group:
+            donor_ids = {d for d in donor_ids if donor_search_groups.get(d) == blood_group}
+        return sorted(donor_ids, key=donor_search_order.__getitem__)
 
 
-def get_compatible_donors(blood_group, location=None):
-    donors = scan_table(donors_table)
-    compatible_groups = BLOOD_COMPATIBILITY.get(blood_group, [])
-    compatible = []
-    for donor in donors:
-        if donor.get('blood_group') in compatible_groups and donor.get('available') and donor.get('status') == 'active':
-            if location:
-                if location.lower() in (donor.get('city', '').lower() + donor.get('state', '').lower()):
-                    compatible.append(donor)
-            else:
-                compatible.append(donor)
-    compatible.sort(key=lambda x: x.get('last_donation') or '1900-01-01', reverse=True)
-    return compatible
+# ---------- Re-usable Matching & Inventory logic ----------
+
+pincode_geocoder = PincodeGeocoder()
+
+
+def locate_request(request_data):
+    """The request's (latitude, longitude) from the hospital pincode, else the requestor's."""
+    point = pincode_geocoder.locate(request_data.get('hospital_pincode'))
+    if point is None and request_data.get('requestor_id'):
+        requestor = repository.get('requestors', request_data['requestor_id'])
+        if requestor:
+            point = pincode_geocoder.locate(requestor.get('pincode'))
+    return point
 
 
 def get_inventory_units(blood_group):
-    inv = get_item(inventory_table, {'blood_group': blood_group})
-    if inv:
-        return int(inv.get('units', 0))
-    # fallback
-    return local_inventory.get(blood_group, {}).get('units', 0)
+    inv = repository.get('inventory', blood_group)
+    return int(inv.get('units', 0)) if inv else 0
+
+
+def _adjust_inventory_units(blood_group, delta, minimum=None):
+    """Atomically add `delta` to a blood group's units.
+
+    With `minimum`, the update only applies if units >= minimum beforehand;
+    returns False when that condition fails.
+    """
+    return repository.increment('inventory', blood_group, 'units', delta, minimum)
 
 
 def update_inventory(blood_group, units, operation='add'):
-    # Fetch or create record
-    inv = get_item(inventory_table, {'blood_group': blood_group})
-    if not inv:
-        inv = {'blood_group': blood_group, 'units': 0, 'donors': []}
+    units = int(units)
     if operation == 'add':
-        inv['units'] = int(inv.get('units', 0)) + int(units)
-    else:
-        inv['units'] = max(0, int(inv.get('units', 0)) - int(units))
-    put_item(inventory_table, inv)
-
-
-def match_blood_request(request_data):
-    blood_group = request_data['blood_group']
-    units_needed = int(request_data.get('units_needed', 1))
-    location = request_data.get('location', '')
-
-    compatible = get_compatible_donors(blood_group, location)
-    scored = []
-    for d in compatible:
-        score = calculate_donor_eligibility(d)
-        scored.append({**d, 'match_score': score, 'can_donate_now': can_donate(d.get('last_donation'))})
-    scored.sort(key=lambda x: x['match_score'], reverse=True)
-    inventory_available = get_inventory_units(blood_group)
+        _adjust_inventory_units(blood_group, units)
+        return
+    # remove, clamped at zero: take everything requested if it is there, otherwise what is left
+    if _adjust_inventory_units(blood_group, -units, minimum=units):
+        return
+    while True:
+        take = min(units, get_inventory_units(blood_group))
+        if take <= 0 or _adjust_inventory_units(blood_group, -take, minimum=take):
+            return
+
+
+def reserve_inventory(blood_group, units):
+    """Atomically take units out of stock; returns the reservation, or None if not enough units."""
+    units = int(units)
+    if units <= 0 or not _adjust_inventory_units(blood_group, -units, minimum=units):
+        return None
+    return {'reservation_id': _gen_id('RSV'), 'blood_group': blood_group, 'units': units, 'created_at': _now()}
+
+
+def commit_reservation(reservation, details=''):
+    """Finalize a reservation as a withdrawal; the units already left stock when it was reserved."""
+    record_inventory_transaction(reservation['blood_group'], reservation['units'], 'withdrawn', details)
+    return True
+
+
+def release_reservation(reservation):
+    """Return a reservation's units to stock."""
+    return _adjust_inventory_units(reservation['blood_group'], reservation['units'])
+
+
+def record_inventory_transaction(blood_group, units, transaction_type, details=''):
+    """Record an inventory transaction ('donated' or 'withdrawn')."""
+    repository.put('inventory_transactions', {
+        'transaction_id': _gen_id('TX'), 'blood_group': blood_group, 'units': int(units),
+        'type': transaction_type, 'details': details, 'created_at': _now()
+    })
+
+
+def add_inventory_donors(blood_group, donor_ids):
+    """Append donors to a blood group's donor list without rewriting the inventory item."""
+    repository.append('inventory', blood_group, 'donors', donor_ids)
+
+
+def add_inventory_donor(blood_group, donor_id):
+    """Append one donor to a blood group's donor list."""
+    add_inventory_donors(blood_group, [donor_id])
+
+
+def match_blood_request(request_data, radius_km=None, k=None):
+    """Score compatible donors for a request and keep the best 10 (see queries.match_blood_request).
+
+    Requests placed from a pincode search within `radius_km` (default
+    MATCH_RADIUS_KM); with `k`, the k nearest placed donors come back,
+    nearest first.
+    """
+    return queries.match_blood_request(repository, request_data, locate_request(request_data), radius_km, k,
+                                       MATCH_RADIUS_KM, pincode_geocoder.locate)
+
+
+# ---------- Registration & bulk import ----------
+# Shared by the registration forms and the bulk importer, so both apply the same rules
+
+URGENCY_LEVELS = ['normal', 'high', 'critical']
+
+
+def _number(fields, name, kind, default):
+    value = fields.get(name) or default
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be a number, got {value!r}')
+
+
+def new_donor_record(fields):
+    """Build a donor item from registration fields (a form or an import row)."""
     return {
-        'exact_match_inventory': inventory_available,
-        'compatible_donors': scored[:10],
-        'total_compatible': len(scored),
-        'fulfillable': inventory_available >= units_needed or len(scored) > 0
+        'donor_id': _gen_id('DON'),
+        'name': fields.get('name', '').strip(),
+        'email': fields.get('email', '').strip(),
+        'phone': fields.get('phone', '').strip(),
+        'age': _number(fields, 'age', int, 0),
+        'gender': fields.get('gender', '').strip(),
+        'blood_group': fields.get('blood_group', '').strip(),
+        'weight': _number(fields, 'weight', float, 0.0),
+        'address': fields.get('address', '').strip(),
+        'city': fields.get('city', '').strip(),
+        'state': fields.get('state', '').strip(),
+        'pincode': fields.get('pincode', '').strip(),
+        'medical_history': fields.get('medical_history', 'None'),
+        'available': True,
+        'status': 'active',
+        'total_donations': 0,
+        'last_donation': None,
+        'last_donation_day': None,
+        'registered_at': _now(),
+        'emergency_contact': fields.get('emergency_contact', ''),
+        'preferred_contact_time': fields.get('preferred_contact_time', 'Anytime')
     }
 
 
+def validate_donor(donor):
+    """Return why a new donor cannot register, or None."""
+    error = blank_required_error('donors', donor)
+    if error:
+        return error
+    if donor['age'] < 18 or donor['age'] > 65:
+        return 'Donor age must be between 18 and 65 years!'
+    if donor['weight'] < 50:
+        return 'Donor weight must be at least 50kg!'
+    if donor['blood_group'] not in BLOOD_COMPATIBILITY:
+        return f"Unknown blood group {donor['blood_group']!r}!"
+    return None
+
+
+def register_donors(donors):
+    """Store new donors and add them to the inventory donor lists, one update per blood group."""
+    save_donors(donors)
+    by_group = {}
+    for donor in donors:
+        by_group.setdefault(donor['blood_group'], []).append(donor['donor_id'])
+    for blood_group, donor_ids in by_group.items():
+        add_inventory_donors(blood_group, donor_ids)
+
+
+def new_blood_request_record(fields):
+    """Build a blood request item from request fields (a form or an import row)."""
+    return {
+        'request_id': _gen_id('BR'),
+        'requestor_id': fields.get('requestor_id') or 'GUEST',
+        'patient_name': fields.get('patient_name', '').strip(),
+        'patient_age': _number(fields, 'patient_age', int, 0),
+        'patient_gender': fields.get('patient_gender', '').strip(),
+        'blood_group': fields.get('blood_group', '').strip(),
+        'units_needed': _number(fields, 'units_needed', int, 1),
+        'hospital_name': fields.get('hospital_name', '').strip(),
+        'hospital_address': fields.get('hospital_address', '').strip(),
+        'hospital_pincode': fields.get('hospital_pincode', '').strip(),
+        'location': fields.get('city', ''),
+        'city': fields.get('city', ''),
+        'state': fields.get('state', ''),
+        'contact_name': fields.get('contact_name', '').strip(),
+        'contact_phone': fields.get('contact_phone', '').strip(),
+        'contact_email': fields.get('contact_email', ''),
+        'urgency': fields.get('urgency') or 'normal',
+        'required_date': fields.get('required_date', ''),
+        'reason': fields.get('reason', ''),
+        'status': 'pending',
+        'created_at': _now(),
+        'matched_donors': [],
+        'fulfilled_units': 0
+    }
+
+
+def validate_blood_request(request_data):
+    """Return why a blood request cannot be created, or None."""
+    error = blank_required_error('requests', request_data)
+    if error:
+        return error
+    if request_data['blood_group'] not in BLOOD_COMPATIBILITY:
+        return f"Unknown blood group {request_data['blood_group']!r}!"
+    if request_data['units_needed'] < 1:
+        return 'At least 1 unit must be requested!'
+    if request_data['urgency'] not in URGENCY_LEVELS:
+        return f"Urgency must be one of {', '.join(URGENCY_LEVELS)}!"
+    try:
+        datetime.strptime(request_data['required_date'], '%Y-%m-%d')
+    except ValueError:
+        return 'Required date must be YYYY-MM-DD!'
+    return None
+
+
+def create_blood_requests(requests_list):
+    """Match donors for new requests, store them in one batch and bump each requestor's count once."""
+    for request_data in requests_list:
+        matches = match_blood_request(request_data)
+        request_data['matched_donors'] = [d['donor_id'] for d in matches['compatible_donors']]
+    repository.put_many('blood_requests', requests_list)
+
+    counts = {}
+    for request_data in requests_list:
+        if request_data['requestor_id'] != 'GUEST':
+            counts[request_data['requestor_id']] = counts.get(request_data['requestor_id'], 0) + 1
+    for reqid, count in counts.items():
+        reqor = repository.get('requestors', reqid)
+        if reqor:
+            reqor = {**reqor, 'total_requests': reqor.get('total_requests', 0) + count}
+            repository.put('requestors', reqor)
+
+
+def _validated(build, validate):
+    def build_row(row):
+        record = build(row)
+        error = validate(record)
+        if error:
+            raise ValueError(error)
+        return record
+    return build_row
+
+
+# Bulk import handlers: {kind: (build and validate one row, store a batch)}
+IMPORTERS = {
+    'donors': (_validated(new_donor_record, validate_donor), register_donors),
+    'requests': (_validated(new_blood_request_record, validate_blood_request), create_blood_requests),
+}
+
+
+def import_records(kind, stream, fmt, dry_run=False):
+    """Stream donors or blood requests from a CSV / JSON Lines stream into the tables."""
+    build_row, write_batch = IMPORTERS[kind]
+    return run_import(iter_rows(stream, fmt), build_row, write_batch, dry_run=dry_run)
+
+
 # ---------- Routes (minimal parity with `app.py`) ----------
 
 @app.route('/')
 def index():
     # show top level stats
-    donors = scan_table(donors_table)
-    requests = scan_table(requests_table)
-    donations = scan_table(donations_table)
-    inventory = {item['blood_group']: item for item in scan_table(inventory_table)}
+    requests = repository.scan('blood_requests')
     stats = {
-        'total_donors': len(donors),
+        'total_donors': repository.count('donors'),
         'total_requests': len(requests),
-        'total_donations': len(donations),
-        'inventory': inventory
+        'total_donations': repository.count('donations'),
+        'inventory': get_inventory()
     }
     recent_requests = sorted(requests, key=lambda x: x.get('created_at', ''), reverse=True)[:5]
     return render_template('index.html', stats=stats, recent_requests=recent_requests)
@@ -260,44 +516,23 @@ def index():
 @app.route('/donor/register', methods=['GET', 'POST'])
 def donor_register():
     if request.method == 'POST':
-        donor_id = _gen_id('DON')
-        donor = {
-            'donor_id': donor_id,
-            'name': request.form.get('name', '').strip(),
-            'email': request.form.get('email', '').strip(),
-            'phone': request.form.get('phone', '').strip(),
-            'age': int(request.form.get('age') or 0),
-            'gender': request.form.get('gender', '').strip(),
-            'blood_group': request.form.get('blood_group', '').strip(),
-            'weight': float(request.form.get('weight') or 0.0),
-            'address': request.form.get('address', '').strip(),
-            'city': request.form.get('city', '').strip(),
-            'state': request.form.get('state', '').strip(),
-            'pincode': request.form.get('pincode', '').strip(),
-            'medical_history': request.form.get('medical_history', 'None'),
-            'available': True,
-            'status': 'active',
-            'total_donations': 0,
-            'last_donation': None,
-            'registered_at': _now(),
-            'emergency_contact': request.form.get('emergency_contact', ''),
-            'preferred_contact_time': request.form.get('preferred_contact_time', 'Anytime')
-        }
-        # basic validations
-        if donor['age'] < 18 or donor['age'] > 65:
-            flash('Donor age must be between 18 and 65 years!', 'error')
+        try:
+            donor = new_donor_record(request.form)
+        except ValueError as e:
+            flash(f'{e}!', 'error')
             return redirect(url_for('donor_register'))
-        if donor['weight'] < 50:
-            flash('Donor weight must be at least 50kg!', 'error')
+        donor_id = donor['donor_id']
+        # basic validations
+        error = validate_donor(donor)
+        if error:
+            flash(error, 'error')
             return redirect(url_for('donor_register'))
 
-        put_item(donors_table, donor)
-        # update inventory donor list
-        inv = get_item(inventory_table, {'blood_group': donor['blood_group']}) or {'blood_group': donor['blood_group'], 'units': 0, 'donors': []}
-        inv['donors'] = list(set(inv.get('donors', []) + [donor_id]))
-        put_item(inventory_table, inv)
+        # store the donor and update the inventory donor list
+        register_donors([donor])
 
-        send_notification('New Donor Registered', f"Donor {donor['name']} ({donor_id}) registered.")
+        send_notification('New Donor Registered', f"Donor {donor['name']} ({donor_id}) registered.",
+                          dedup_key=f"donor-registered:{donor_id}")
         flash(f'Registration successful! Your Donor ID is: {donor_id}', 'success')
         return redirect(url_for('donor_dashboard', donor_id=donor_id))
 
@@ -309,7 +544,7 @@ def donor_login():
     if request.method == 'POST':
         donor_id = request.form.get('donor_id', '').strip()
         email = request.form.get('email', '').strip()
-        donor = get_item(donors_table, {'donor_id': donor_id})
+        donor = repository.get('donors', donor_id)
         if donor and donor.get('email') == email:
             session['donor_id'] = donor_id
             flash('Login successful!', 'success')
@@ -321,23 +556,23 @@ def donor_login():
 
 @app.route('/donor/dashboard/<donor_id>')
 def donor_dashboard(donor_id):
-    donor = get_item(donors_table, {'donor_id': donor_id})
+    donor = repository.get('donors', donor_id)
     if not donor:
         flash('Donor not found!', 'error')
         return redirect(url_for('index'))
     # donations
-    donations = [d for d in scan_table(donations_table) if d.get('donor_id') == donor_id]
-    can_d = can_donate(donor.get('last_donation'))
+    donations = get_donations_by_donor(donor_id)
+    can_d = can_donate(donor)
     return render_template('donor_dashboard.html', donor=donor, donation_history=donations, can_donate_now=can_d)
 
 
 @app.route('/donor/donate/<donor_id>', methods=['POST'])
 def donor_donate(donor_id):
-    donor = get_item(donors_table, {'donor_id': donor_id})
+    donor = repository.get('donors', donor_id)
     if not donor:
         flash('Donor not found!', 'error')
         return redirect(url_for('index'))
-    if not can_donate(donor.get('last_donation')):
+    if not can_donate(donor):
         flash('You must wait 56 days between donations!', 'error')
         return redirect(url_for('donor_dashboard', donor_id=donor_id))
     donation_id = _gen_id('DN')
@@ -352,13 +587,15 @@ def donor_donate(donor_id):
         'donation_center': request.form.get('donation_center', 'Main Center'),
         'notes': request.form.get('notes', '')
     }
-    put_item(donations_table, donation)
+    repository.put('donations', donation)
     # update donor
-    donor['last_donation'] = donation['donation_date']
+    donor = dict(donor)
+    set_last_donation(donor, donation['donation_date'])
     donor['total_donations'] = donor.get('total_donations', 0) + 1
-    put_item(donors_table, donor)
+    save_donor(donor)
     # update inventory
     update_inventory(donor['blood_group'], units, 'add')
+    record_inventory_transaction(donor['blood_group'], units, 'donated', f'Donor {donor_id} donated {units} units')
 
     flash(f'Donation recorded successfully! Donation ID: {donation_id}', 'success')
     return redirect(url_for('donor_dashboard', donor_id=donor_id))
@@ -381,7 +618,7 @@ def requestor_register():
             'registered_at': _now(),
             'total_requests': 0
         }
-        put_item(requestors_table, requestor)
+        repository.put('requestors', requestor)
         flash(f'Registration successful! Your Requestor ID is: {requestor_id}', 'success')
         return redirect(url_for('requestor_dashboard', requestor_id=requestor_id))
     return render_template('requestor_register.html')
@@ -389,55 +626,33 @@ def requestor_register():
 
 @app.route('/requestor/dashboard/<requestor_id>')
 def requestor_dashboard(requestor_id):
-    requestor = get_item(requestors_table, {'requestor_id': requestor_id})
+    requestor = repository.get('requestors', requestor_id)
     if not requestor:
         flash('Requestor not found!', 'error')
         return redirect(url_for('index'))
-    history = [r for r in scan_table(requests_table) if r.get('requestor_id') == requestor_id]
+    history = get_requests_by_requestor(requestor_id)
     return render_template('requestor_dashboard.html', requestor=requestor, request_history=history)
 
 
 @app.route('/request-blood', methods=['GET', 'POST'])
 def request_blood():
     if request.method == 'POST':
-        request_id = _gen_id('BR')
-        request_data = {
-            'request_id': request_id,
-            'requestor_id': request.form.get('requestor_id', 'GUEST'),
-            'patient_name': request.form.get('patient_name', '').strip(),
-            'patient_age': int(request.form.get('patient_age') or 0),
-            'patient_gender': request.form.get('patient_gender', '').strip(),
-            'blood_group': request.form.get('blood_group', '').strip(),
-            'units_needed': int(request.form.get('units_needed') or 1),
-            'hospital_name': request.form.get('hospital_name', '').strip(),
-            'hospital_address': request.form.get('hospital_address', '').strip(),
-            'location': request.form.get('city', ''),
-            'city': request.form.get('city', ''),
-            'state': request.form.get('state', ''),
-            'contact_name': request.form.get('contact_name', '').strip(),
-            'contact_phone': request.form.get('contact_phone', '').strip(),
-            'contact_email': request.form.get('contact_email', ''),
-            'urgency': request.form.get('urgency', 'normal'),
-            'required_date': request.form.get('required_date', ''),
-            'reason': request.form.get('reason', ''),
-            'status': 'pending',
-            'created_at': _now(),
-            'matched_donors': [],
-            'fulfilled_units': 0
-        }
-        put_item(requests_table, request_data)
-        # update requestor stats
-        reqid = request_data['requestor_id']
-        reqor = get_item(requestors_table, {'requestor_id': reqid}) if reqid != 'GUEST' else None
-        if reqor:
-            reqor['total_requests'] = reqor.get('total_requests', 0) + 1
-            put_item(requestors_table, reqor)
-
-        matches = match_blood_request(request_data)
-        request_data['matched_donors'] = [d['donor_id'] for d in matches['compatible_donors']]
-        put_item(requests_table, request_data)
-
-        send_notification('New Blood Request', f"Request {request_id} for {request_data['blood_group']} registered.")
+        try:
+            request_data = new_blood_request_record(request.form)
+        except ValueError as e:
+            flash(f'{e}!', 'error')
+            return redirect(url_for('request_blood'))
+        request_id = request_data['request_id']
+        error = validate_blood_request(request_data)
+        if error:
+            flash(error, 'error')
+            return redirect(url_for('request_blood'))
+
+        # match donors, store the request and update requestor stats
+        create_blood_requests([request_data])
+
+        send_notification('New Blood Request', f"Request {request_id} for {request_data['blood_group']} registered.",
+                          dedup_key=f"request-created:{request_id}")
         flash(f'Blood request created! Request ID: {request_id}', 'success')
         return redirect(url_for('request_details', request_id=request_id))
     return render_template('request_blood.html')
@@ -445,7 +660,7 @@ def request_blood():
 
 @app.route('/request/<request_id>')
 def request_details(request_id):
-    req = get_item(requests_table, {'request_id': request_id})
+    req = repository.get('blood_requests', request_id)
     if not req:
         flash('Request not found!', 'error')
         return redirect(url_for('index'))
@@ -461,7 +676,13 @@ def search_donors():
         blood_group = request.form.get('blood_group', '')
         location = request.form.get('location', '')
         search_performed = True
-        donors = scan_table(donors_table)
+        if location:
+            donors = repository.get_many('donors', find_donor_ids_by_location(location, blood_group))
+        elif blood_group:
+            donors = get_donors_by_blood_group(blood_group)
+        else:
+            donors = repository.scan('donors')
+        # Re-check every condition on the fetched items, so a stale index can't return a non-match
         for d in donors:
             match = True
             if blood_group and d.get('blood_group') != blood_group:
@@ -477,18 +698,16 @@ def search_donors():
 
 @app.route('/blood-inventory')
 def blood_inventory_view():
-    inv_items = scan_table(inventory_table)
-    inv = {item['blood_group']: item for item in inv_items}
+    inv = get_inventory()
     stats = {'inventory': inv}
     return render_template('blood_inventory.html', inventory=inv, stats=stats)
 
 
 @app.route('/dashboard')
 def admin_dashboard():
-    donors = scan_table(donors_table)
-    requests = sorted(scan_table(requests_table), key=lambda x: x.get('created_at', ''), reverse=True)
-    donations = sorted(scan_table(donations_table), key=lambda x: x.get('donation_date', ''), reverse=True)
-    return render_template('admin_dashboard.html', stats=getattr(__import__('builtins'), 'dict')(), donors=donors, requests=requests, donations=donations)
+    # one page per section, newest first off sorted GSIs; donors have no order and page through a scan
+    return render_template('admin_dashboard.html', stats={'inventory': get_inventory()},
+                           **queries.dashboard_pages(repository, request.args, DASHBOARD_PAGE_SIZE))
 
 
 @app.route('/logout')
@@ -498,6 +717,48 @@ def logout():
     return redirect(url_for('index'))
 
 
+@app.route('/api/import/<kind>', methods=['POST'])
+def api_bulk_import(kind):
+    """Bulk import donors or blood requests from CSV or JSON Lines (multipart `file` or raw body)."""
+    if kind not in IMPORTERS:
+        return jsonify({'status': 'error', 'message': f"Unknown import type: {kind}"}), 404
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    fmt = request.args.get('format') or detect_format(
+        upload.filename if upload else None, upload.content_type if upload else request.content_type)
+    if fmt not in FORMATS:
+        return jsonify({'status': 'error', 'message': f"format must be one of {', '.join(FORMATS)}"}), 400
+    report = import_records(kind, stream, fmt, dry_run=request.args.get('dry_run') == '1')
+    return jsonify({'status': 'success', 'kind': kind, 'format': fmt, **report.as_dict()})
+
+
+@app.route('/api/cache/metrics')
+def api_cache_metrics():
+    """Read-through cache hit/miss counters and p50/p99 lookup latency."""
+    return jsonify(read_cache.metrics())
+
+
+@app.route('/api/notifications/metrics')
+def api_notification_metrics():
+    """Notification outbox queue depth, delivery lag and retry counters."""
+    return jsonify(notification_outbox.metrics())
+
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(list(IMPORTERS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults to the file extension')
+@click.option('--dry-run', is_flag=True, help='Validate rows without storing them')
+def import_command(kind, path, fmt, dry_run):
+    """Bulk import donors or blood requests from a CSV or JSON Lines file."""
+    with open(path, 'rb') as f:
+        report = import_records(kind, f, fmt or detect_format(path), dry_run=dry_run)
+    for error in report.errors:
+        click.echo(f"line {error['line']}: {error['error']}")
+    click.echo(f"{'validated' if dry_run else 'imported'} {report.imported} {kind}, {report.failed} failed, "
+               f"{report.seconds:.2f} s ({report.rows_per_second:,} rows/s)")
+
+
 # ---------- Error handlers ----------
 @app.errorhandler(404)
 def not_found(e):
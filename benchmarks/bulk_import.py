@@ -0,0 +1,83 @@
+"""
+HemaLink - Bulk import benchmark
+
+Writes a synthetic donor file (CSV or JSON Lines, with a share of invalid
+rows) to a temporary file, streams it through app.py's importer and
+reports throughput. A validation-only pass reports the reader's peak
+memory, which stays flat as --rows grows because only one batch is held
+at a time.
+
+    python benchmarks/bulk_import.py --rows 200000 --format csv
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+FIELDS = ['name', 'email', 'phone', 'age', 'gender', 'blood_group', 'weight', 'address', 'city', 'state', 'pincode']
+CITIES = [('Mumbai', 'Maharashtra', '400001'), ('Delhi', 'Delhi', '110001'), ('Chennai', 'Tamil Nadu', '600001'),
+          ('Kolkata', 'West Bengal', '700001'), ('Bengaluru', 'Karnataka', '560001')]
+
+
+def donor_rows(count, invalid_share, rng):
+    groups = list(app.BLOOD_COMPATIBILITY)
+    for i in range(count):
+        city, state, pincode = rng.choice(CITIES)
+        age = rng.randint(12, 17) if rng.random() < invalid_share else rng.randint(18, 65)
+        yield {
+            'name': f'Donor {i}', 'email': f'donor{i}@example.com', 'phone': f'9{i:09d}', 'age': age,
+            'gender': rng.choice('MF'), 'blood_group': rng.choice(groups), 'weight': rng.randint(50, 100),
+            'address': f'{i} Main Road', 'city': city, 'state': state, 'pincode': pincode,
+        }
+
+
+def write_file(path, fmt, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            for row in rows:
+                f.write(json.dumps(row) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark streaming bulk donor import')
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+    parser.add_argument('--invalid', type=float, default=0.01, help='Share of rows that fail validation')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f'donors.{args.format}')
+        write_file(path, args.format, donor_rows(args.rows, args.invalid, random.Random(3)))
+        size_mb = os.path.getsize(path) / 1e6
+
+        # Validation-only pass under tracemalloc: the reader holds one batch, whatever the file size
+        tracemalloc.start()
+        with open(path, 'rb') as f:
+            app.import_records('donors', f, args.format, dry_run=True)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        before = len(app.donors_db)
+        with open(path, 'rb') as f:
+            report = app.import_records('donors', f, args.format)
+
+    assert len(app.donors_db) - before == report.imported
+    print(f"{args.rows} rows ({size_mb:.1f} MB {args.format}): {report.imported} imported, {report.failed} failed "
+          f"in {report.seconds:.2f} s, {report.rows_per_second:,} rows/s")
+    print(f"peak memory while streaming and validating: {peak / 1e6:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+HemaLink - Proximity matching benchmark
+
+Builds a synthetic pincode directory (one centroid per pincode, about the
+size of the full India Post list), registers donors across it through
+app.py's indexes, then times k-nearest and radius queries for compatible
+donors and checks them against a brute-force scan.
+
+    python benchmarks/geo_matching.py --donors 1000000 --pincodes 19000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from geo import PincodeGeocoder, haversine_km  # noqa: E402
+
+
+def synthetic_geocoder(pincodes, rng):
+    """A geocoder over `pincodes` random centroids inside India's bounding box"""
+    geocoder = PincodeGeocoder(path=os.devnull)
+    for i in range(pincodes):
+        pincode = f"{110000 + i * (740000 // pincodes):06d}"
+        geocoder.centroids[pincode] = (round(rng.uniform(8.0, 35.0), 4), round(rng.uniform(68.0, 97.0), 4))
+    return geocoder
+
+
+def add_donors(count, rng):
+    groups = list(app.BLOOD_COMPATIBILITY)
+    pincodes = list(app.pincode_geocoder.centroids)
+    for i in range(count):
+        donor_id = f"DON-G{i:08X}"
+        app.donors_db[donor_id] = {
+            'donor_id': donor_id, 'name': 'Donor', 'age': rng.randint(18, 65), 'blood_group': rng.choice(groups),
+            'city': 'City', 'state': 'State', 'pincode': rng.choice(pincodes),
+            'available': rng.random() < 0.9, 'status': 'active', 'total_donations': 0, 'last_donation': None,
+        }
+        app.index_donor(app.donors_db[donor_id])
+
+
+def brute_force(blood_group, point):
+    """Distances to every compatible, active, placed donor"""
+    groups = set(app.BLOOD_COMPATIBILITY[blood_group])
+    found = []
+    for donor_id in app.active_donor_ids:
+        keys = app.donor_index_keys[donor_id]
+        if keys[0] in groups and keys[3]:
+            found.append((haversine_km(point[0], point[1], *keys[3]), donor_id))
+    return sorted(found)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark k-nearest / radius donor matching')
+    parser.add_argument('--donors', type=int, default=1000000)
+    parser.add_argument('--pincodes', type=int, default=19000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--radius-km', type=float, default=25.0)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    app.pincode_geocoder = synthetic_geocoder(args.pincodes, rng)
+    started = time.perf_counter()
+    add_donors(args.donors, rng)
+    print(f"indexed {args.donors} donors over {args.pincodes} pincodes in {time.perf_counter() - started:.1f} s")
+
+    groups = list(app.BLOOD_COMPATIBILITY)
+    queries = [(rng.choice(groups), (rng.uniform(8.0, 35.0), rng.uniform(68.0, 97.0))) for _ in range(args.queries)]
+
+    for label, kwargs in (('k-nearest', {'k': args.k}), ('radius', {'radius_km': args.radius_km})):
+        timings = []
+        found = 0
+        for blood_group, point in queries:
+            started = time.perf_counter()
+            result = app.find_donors_near(blood_group, point, **kwargs)
+            timings.append(time.perf_counter() - started)
+            found += len(result)
+        timings.sort()
+        print(f"{label:>10}: p50 {timings[len(timings) // 2] * 1000:.2f} ms, "
+              f"p99 {timings[int(len(timings) * 0.99)] * 1000:.2f} ms, {found / len(queries):.0f} donors/query")
+
+    for blood_group, point in queries[:5]:
+        expected = brute_force(blood_group, point)
+        nearest = app.find_donors_near(blood_group, point, k=args.k)
+        assert [round(d, 6) for d in nearest.values()] == [round(d, 6) for d, _ in expected[:args.k]]
+        within = app.find_donors_near(blood_group, point, radius_km=args.radius_km)
+        assert sorted(within) == sorted(donor_id for d, donor_id in expected if d <= args.radius_km)
+    print("k-nearest and radius results match a brute-force scan")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+HemaLink - Inventory ledger contention benchmark
+
+Many threads withdraw from one blood group at once. Each withdrawal either
+goes through the ledger (reserve + commit, occasionally release) or, with
+--naive, through the old check-then-deduct path. Reports throughput and
+whether more units were handed out than were in stock.
+
+    python benchmarks/inventory_contention.py --threads 32 --attempts 20000
+    python benchmarks/inventory_contention.py --backend aws   # aws_app (DynamoDB or the memory backend)
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BLOOD_GROUP = 'O-'
+
+
+def load_backend(name):
+    if name == 'aws':
+        import aws_app as backend
+        get_units = backend.get_inventory_units
+    else:
+        import app as backend
+
+        def get_units(blood_group):
+            return backend.blood_inventory[blood_group]['units']
+    return backend, get_units
+
+
+def run(backend, get_units, threads, attempts, stock, naive):
+    backend.update_inventory(BLOOD_GROUP, get_units(BLOOD_GROUP), 'remove')
+    backend.update_inventory(BLOOD_GROUP, stock, 'add')
+
+    granted = []
+    lock = threading.Lock()
+    per_thread = attempts // threads
+
+    def worker():
+        rng = random.Random()
+        mine = 0
+        for _ in range(per_thread):
+            units = rng.randint(1, 3)
+            if naive:
+                # Old path: check availability, then deduct
+                if get_units(BLOOD_GROUP) >= units:
+                    time.sleep(0)
+                    backend.update_inventory(BLOOD_GROUP, units, 'remove')
+                    mine += units
+                continue
+            reservation = backend.reserve_inventory(BLOOD_GROUP, units)
+            if not reservation:
+                continue
+            if rng.random() < 0.1:
+                backend.release_reservation(reservation)
+            else:
+                backend.commit_reservation(reservation, 'contention benchmark')
+                mine += units
+        with lock:
+            granted.append(mine)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    handed_out = sum(granted)
+    remaining = get_units(BLOOD_GROUP)
+    return {
+        'ops_per_second': per_thread * threads / elapsed,
+        'handed_out': handed_out,
+        'remaining': remaining,
+        'oversold': max(0, handed_out - stock),
+        'consistent': handed_out + remaining == stock,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark concurrent inventory withdrawals')
+    parser.add_argument('--backend', choices=['local', 'aws'], default='local')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--attempts', type=int, default=20000)
+    parser.add_argument('--stock', type=int, default=5000)
+    parser.add_argument('--naive', action='store_true', help='use the old check-then-deduct path for comparison')
+    args = parser.parse_args()
+
+    backend, get_units = load_backend(args.backend)
+    result = run(backend, get_units, args.threads, args.attempts, args.stock, args.naive)
+
+    mode = 'check-then-deduct' if args.naive else 'ledger'
+    print(f"backend={args.backend} mode={mode} threads={args.threads} attempts={args.attempts} stock={args.stock}")
+    print(f"throughput:  {result['ops_per_second']:,.0f} withdrawals/s")
+    print(f"handed out:  {result['handed_out']} units, {result['remaining']} left in stock")
+    print(f"oversold:    {result['oversold']} units")
+    print(f"consistent:  {result['consistent']}")
+
+
+if __name__ == '__main__':
+    main()
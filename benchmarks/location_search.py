@@ -0,0 +1,95 @@
+"""
+HemaLink - Donor location search benchmark
+
+Registers synthetic donors in app.py's indexes, then runs the same location
+queries through the substring index and through the original per-donor
+scan. Checks that both return the same donors and reports query latency.
+
+    python benchmarks/location_search.py --donors 200000
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+CITIES = [
+    'Mumbai', 'Delhi', 'Bengaluru', 'Hyderabad', 'Ahmedabad', 'Chennai', 'Kolkata', 'Surat', 'Pune', 'Jaipur',
+    'Lucknow', 'Kanpur', 'Nagpur', 'Indore', 'Thane', 'Bhopal', 'Visakhapatnam', 'Patna', 'Vadodara', 'Ghaziabad',
+]
+STATES = [
+    'Maharashtra', 'Delhi', 'Karnataka', 'Telangana', 'Gujarat', 'Tamil Nadu', 'West Bengal', 'Rajasthan',
+    'Uttar Pradesh', 'Madhya Pradesh', 'Andhra Pradesh', 'Bihar',
+]
+QUERIES = ['mumbai', 'Pune', 'pur', 'a', 'nadu', '4000', '56', '110001', 'zzz', 'bad', 'Pradesh', ' ']
+
+
+def scan_search(blood_group, location):
+    """The original search_donors() loop"""
+    results = []
+    for donor in app.donors_db.values():
+        if blood_group and donor['blood_group'] != blood_group:
+            continue
+        if location and not (location.lower() in donor['city'].lower() or
+                             location.lower() in donor['state'].lower() or
+                             location.lower() in donor['pincode']):
+            continue
+        if donor['available'] and donor['status'] == 'active':
+            results.append(donor['donor_id'])
+    return results
+
+
+def index_search(blood_group, location):
+    """The indexed search_donors() lookup"""
+    donor_ids = app.active_donor_ids
+    if blood_group:
+        donor_ids = donor_ids & app.donors_by_group.get(blood_group, set())
+    if location:
+        donor_ids = app.find_donor_ids_by_location(location, include_pincode=True, within=donor_ids)
+    return app.in_registration_order(donor_ids)
+
+
+def add_donors(count):
+    rng = random.Random(42)
+    groups = list(app.BLOOD_COMPATIBILITY)
+    for _ in range(count):
+        donor_id = f"DON-{''.join(rng.choices(string.hexdigits.upper(), k=10))}"
+        app.donors_db[donor_id] = {
+            'donor_id': donor_id, 'name': 'Donor', 'age': rng.randint(18, 65), 'blood_group': rng.choice(groups),
+            'city': rng.choice(CITIES), 'state': rng.choice(STATES), 'pincode': f"{rng.randint(110000, 859999)}",
+            'available': rng.random() < 0.9, 'status': 'active', 'total_donations': 0, 'last_donation': None,
+        }
+        app.index_donor(app.donors_db[donor_id])
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark indexed vs scanned donor location search')
+    parser.add_argument('--donors', type=int, default=200000)
+    args = parser.parse_args()
+
+    add_donors(args.donors)
+    print(f"donors: {len(app.donors_db)}")
+    print(f"{'query':>12} {'group':>5} {'matches':>8} {'scan ms':>9} {'index ms':>9}")
+    for location in QUERIES:
+        for blood_group in ('', 'AB-'):
+            expected, scan_seconds = timed(scan_search, blood_group, location)
+            actual, index_seconds = timed(index_search, blood_group, location)
+            assert actual == expected, (location, blood_group)
+            print(f"{location!r:>12} {blood_group or '-':>5} {len(actual):>8} "
+                  f"{scan_seconds * 1000:>9.1f} {index_seconds * 1000:>9.1f}")
+    print("indexed results identical to the scan for every query")
+
+
+if __name__ == '__main__':
+    main()
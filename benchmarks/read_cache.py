@@ -0,0 +1,157 @@
+"""
+HemaLink - Read-through cache benchmark for aws_app.py
+
+Runs a mix of hot reads (donor profiles, inventory, the home page's
+table scans) and writes (donations, inventory changes) against
+aws_app.py on the memory storage backend, with a simulated DynamoDB
+round trip added to every uncached item read, scan and lookup. Reports
+page-level latency with the cache disabled and enabled, and the cache's
+own hit ratio and p50/p99 lookup latency.
+
+With --redis URL (a Redis-compatible server) or --fake-redis (an
+in-process fakeredis server), the mix is also run through two app
+instances that share a RedisCache tier, alternating between them, and a
+write through one instance is checked to reach the other through the
+shared tier instead of leaving it a stale copy.
+
+    python benchmarks/read_cache.py --operations 3000 --round-trip-ms 4
+    python benchmarks/read_cache.py --fake-redis
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aws_app  # noqa: E402
+from cache import ReadThroughCache, RedisCache, percentile_ms, shared_cache_available  # noqa: E402
+from storage import CachedRepository  # noqa: E402
+
+
+def with_round_trip(function, seconds):
+    def call(*args, **kwargs):
+        time.sleep(seconds)
+        return function(*args, **kwargs)
+    return call
+
+
+def add_donors(count, rng):
+    groups = list(aws_app.BLOOD_COMPATIBILITY)
+    donors = [{
+        'donor_id': f"DON-C{i:07X}", 'name': f'Donor {i}', 'blood_group': rng.choice(groups), 'city': 'Pune',
+        'state': 'Maharashtra', 'pincode': '411001', 'available': True, 'status': 'active', 'total_donations': 0,
+        'last_donation': None
+    } for i in range(count)]
+    aws_app.save_donors(donors)
+    return [d['donor_id'] for d in donors]
+
+
+def run(operations, donor_ids, rng, instances=None):
+    """
+    Time each operation of a read-heavy mix; returns latency samples in seconds
+    With `instances` (repositories), the operations alternate between them like requests across app instances
+    """
+    groups = list(aws_app.BLOOD_COMPATIBILITY)
+    hot = donor_ids[:50]
+    samples = []
+    for i in range(operations):
+        if instances:
+            aws_app.repository = instances[i % len(instances)]
+        roll = rng.random()
+        started = time.perf_counter()
+        if roll < 0.45:
+            # donor dashboard: profile lookup, mostly for recently active donors
+            aws_app.repository.get('donors', rng.choice(hot if rng.random() < 0.8 else donor_ids))
+        elif roll < 0.75:
+            aws_app.get_inventory_units(rng.choice(groups))
+        elif roll < 0.85:
+            aws_app.get_inventory()
+        elif roll < 0.90:
+            aws_app.get_donors_by_blood_group(rng.choice(groups))
+        elif roll < 0.95:
+            aws_app.update_inventory(rng.choice(groups), 1, 'add')
+        else:
+            donor = dict(aws_app.repository.get('donors', rng.choice(hot)))
+            donor['total_donations'] += 1
+            aws_app.save_donor(donor)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def open_shared(args):
+    """The shared tier asked for on the command line, or None"""
+    if not (args.redis or args.fake_redis):
+        return None
+    if not shared_cache_available():
+        sys.exit('--redis and --fake-redis need the redis package (pip install -r requirements-optional.txt)')
+    if args.fake_redis:
+        import fakeredis
+        return RedisCache(client=fakeredis.FakeRedis())
+    return RedisCache(args.redis)
+
+
+def reaches_other_instance(instances, donor_id):
+    """Whether a write through the first instance is read by the second once its local copy expires"""
+    first, second = instances
+    aws_app.repository = second
+    second.get('donors', donor_id)
+    aws_app.repository = first
+    donor = dict(first.get('donors', donor_id))
+    donor['total_donations'] += 1
+    aws_app.save_donor(donor)
+    # the second instance's local copy lives shared_local_ttl seconds; expire it now
+    second.cache.clear()
+    return second.get('donors', donor_id)['total_donations'] == donor['total_donations']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the aws_app read-through cache')
+    parser.add_argument('--operations', type=int, default=3000)
+    parser.add_argument('--donors', type=int, default=2000)
+    parser.add_argument('--round-trip-ms', type=float, default=4, help='Simulated DynamoDB latency per read')
+    parser.add_argument('--redis', help='Also run two instances sharing a cache on this Redis server URL')
+    parser.add_argument('--fake-redis', action='store_true', help='Like --redis, on an in-process fakeredis server')
+    args = parser.parse_args()
+    shared = open_shared(args)
+
+    donor_ids = add_donors(args.donors, random.Random(3))
+    round_trip = args.round_trip_ms / 1000
+    storage = aws_app.repository.inner
+    for method in ('get', 'scan', 'find', 'find_donors'):
+        setattr(storage, method, with_round_trip(getattr(storage, method), round_trip))
+
+    for label, ttl in (('no cache', 0), ('cache', aws_app.CACHE_TTL_SECONDS)):
+        aws_app.repository.cache = ReadThroughCache(max_items=aws_app.CACHE_MAX_ITEMS, ttl=ttl)
+        started = time.perf_counter()
+        samples = run(args.operations, donor_ids, random.Random(5))
+        seconds = time.perf_counter() - started
+        print(f"{label:>8}: {args.operations / seconds:,.0f} ops/s, "
+              f"p50 {percentile_ms(samples, 0.5)} ms, p99 {percentile_ms(samples, 0.99)} ms")
+    metrics = aws_app.repository.cache.metrics()
+    print(f"   cache: hit ratio {metrics['hit_ratio']:.1%}, {metrics['invalidations']} invalidations, "
+          f"hit p50/p99 {metrics['latency_ms']['hit']['p50']}/{metrics['latency_ms']['hit']['p99']} ms, "
+          f"miss p50/p99 {metrics['latency_ms']['miss']['p50']}/{metrics['latency_ms']['miss']['p99']} ms")
+    if shared is None:
+        return
+
+    cached = aws_app.repository
+    instances = [CachedRepository(storage, ReadThroughCache(max_items=aws_app.CACHE_MAX_ITEMS,
+                                                            ttl=aws_app.CACHE_TTL_SECONDS, shared=shared))
+                 for _ in range(2)]
+    started = time.perf_counter()
+    samples = run(args.operations, donor_ids, random.Random(5), instances)
+    seconds = time.perf_counter() - started
+    print(f"  shared: {args.operations / seconds:,.0f} ops/s, "
+          f"p50 {percentile_ms(samples, 0.5)} ms, p99 {percentile_ms(samples, 0.99)} ms (2 instances)")
+    for i, instance in enumerate(instances):
+        metrics = instance.cache.metrics()
+        print(f"   instance {i + 1}: hit ratio {metrics['hit_ratio']:.1%} ({metrics['shared_hits']} from the shared "
+              f"tier), {metrics['shared_errors']} shared errors")
+    print(f"   write through one instance read by the other: {reaches_other_instance(instances, donor_ids[0])}")
+    aws_app.repository = cached
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+HemaLink - Donor recall campaign benchmark
+
+Registers synthetic donors in app.py's indexes, starts a recall campaign
+for a short blood group and reports how long selecting, ranking and
+queueing the eligible donors takes, how long the starting call itself
+blocks, and the notification outbox's delivery rate to the local stub
+backend.
+
+    python benchmarks/recall_campaign.py --donors 100000 --rate 5000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def add_donors(count, rng):
+    groups = list(app.BLOOD_COMPATIBILITY)
+    contact_times = ['Anytime', 'Morning', 'Afternoon', 'Evening']
+    today = date.today()
+    for i in range(count):
+        donor_id = f"DON-R{i:08X}"
+        last = None if rng.random() < 0.3 else (today - timedelta(days=rng.randint(1, 400))).isoformat()
+        donor = {
+            'donor_id': donor_id, 'name': f'Donor {i}', 'phone': f'9{i:09d}', 'age': rng.randint(18, 65),
+            'blood_group': rng.choice(groups), 'city': 'City', 'state': 'State', 'pincode': '400001',
+            'available': rng.random() < 0.9, 'status': 'active', 'total_donations': rng.randint(0, 10),
+            'last_donation': last, 'preferred_contact_time': 'Anytime' if rng.random() < 0.5 else rng.choice(contact_times),
+        }
+        app.set_last_donation(donor, last)
+        app.donors_db[donor_id] = donor
+        app.index_donor(donor)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark donor recall campaign selection and queueing')
+    parser.add_argument('--donors', type=int, default=100000)
+    parser.add_argument('--blood-group', default='AB+', help='Short group; AB+ recipients can take every group')
+    parser.add_argument('--rate', type=float, default=5000, help='Sender rate limit, messages per second')
+    parser.add_argument('--send-seconds', type=float, default=5, help='How long to watch delivery')
+    args = parser.parse_args()
+
+    add_donors(args.donors, random.Random(11))
+    sms = app.notification_outbox.channels['sms']
+    sms.limiter.rate = args.rate
+    sms.limiter.burst = max(args.rate, app.notification_outbox.batch_size)
+    # Count deliveries without the stub backend's per-batch log line
+    sms.backend.send_batch = lambda messages: None
+
+    started = time.perf_counter()
+    campaign = app.start_recall_campaign(args.blood_group)
+    call_seconds = time.perf_counter() - started
+    while campaign['status'] == 'selecting':
+        time.sleep(0.01)
+    queued_seconds = time.perf_counter() - started
+
+    print(f"donors: {args.donors}, eligible and queued: {campaign['queued']}")
+    print(f"start_recall_campaign() returned in {call_seconds * 1000:.2f} ms")
+    print(f"selected, ranked and queued in {queued_seconds:.2f} s (selection {campaign['selection_seconds']} s)")
+
+    sent_before = campaign['sent']
+    time.sleep(args.send_seconds)
+    sent = campaign['sent'] - sent_before
+    print(f"delivered {sent} in {args.send_seconds:.0f} s ({sent / args.send_seconds:,.0f}/s, limit {args.rate:,.0f}/s), "
+          f"{len(app.notification_outbox)} still scheduled (outside contact windows or rate-limited)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+HemaLink - Shared-state scaling benchmark
+
+Starts a shared_state.py store process, loads synthetic donors and blood
+requests through app.py, then runs 1, 2, 4, ... worker processes against
+the shared dataset. Every worker joins the store the way a gunicorn
+worker does (HEMALINK_SHARED_STATE) and drives a read-heavy route mix
+through Flask's test client for `--seconds`: donor dashboards, donor and
+request API pages, critical requests, statistics, donor matching, donor
+search (a read-only POST) and the inventory page, with `--write-percent`
+donor profile updates that go through the write lease.
+
+For each worker count it reports requests/s and the speedup over one
+worker, the CPU time the workers and the store process used, and
+requests per worker CPU-second. The same mix is then run on as many
+independent processes, each with a private copy of the data and no
+store process: the most the hardware allows, since those share nothing.
+Throughput can only scale up to the number of cores, so on a machine
+with fewer cores than workers compare the two rows rather than the
+speedup. Worker counts above os.cpu_count() are marked.
+
+    python benchmarks/shared_state_scaling.py --donors 20000 --workers 1,2,4,8 --seconds 10
+"""
+import argparse
+import contextlib
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+GROUPS = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
+
+
+def start_store(socket_path):
+    store = multiprocessing.get_context('spawn').Process(target=run_store, args=(socket_path,), daemon=True)
+    store.start()
+    while not os.path.exists(socket_path):
+        time.sleep(0.05)
+    return store
+
+
+def run_store(socket_path):
+    from shared_state import StateServer
+    StateServer(socket_path).serve_forever()
+
+
+def load(donors, requests, rng):
+    """Register synthetic donors and requests through app.py; returns their IDs"""
+    import app
+    groups = list(app.BLOOD_COMPATIBILITY)
+    cities = ['Mumbai', 'Delhi', 'Pune', 'Chennai', 'Kolkata']
+    with app.shared_state.lease() if app.shared_state else contextlib.nullcontext():
+        for i in range(donors):
+            donor_id = f"DON-S{i:07X}"
+            app.donors_db[donor_id] = {
+                'donor_id': donor_id, 'name': f'Donor {i}', 'email': f'donor{i}@example.com', 'phone': '9876543210',
+                'age': rng.randint(18, 65), 'gender': 'Female', 'blood_group': rng.choice(groups), 'weight': 60,
+                'address': 'Street', 'city': rng.choice(cities), 'state': 'State', 'pincode': '400001',
+                'available': rng.random() < 0.9, 'status': 'active', 'total_donations': 0, 'last_donation': None,
+                'created_at': '2026-01-01 09:00:00'
+            }
+            app.index_donor(app.donors_db[donor_id])
+        for i in range(requests):
+            app.add_blood_request({
+                'request_id': f"BR-S{i:07X}", 'requestor_id': 'REQ-E5F6G7H8', 'patient_name': 'Patient',
+                'blood_group': rng.choice(groups), 'units_needed': rng.randint(1, 4), 'hospital_name': 'Hospital',
+                'location': rng.choice(cities), 'urgency': rng.choice(['normal', 'high', 'critical']),
+                'required_date': '2026-12-01', 'status': 'pending', 'created_at': f'2026-01-01 {i % 24:02d}:00:00',
+                'matched_donors': [], 'fulfilled_units': 0
+            })
+    return sorted(app.donors_db), sorted(app.blood_requests_db)
+
+
+def store_cpu_seconds():
+    import app
+    return app.shared_state.stats()['cpu_seconds']
+
+
+def worker(shared, sizes, seconds, write_percent, seed, ready, start, results):
+    if not shared:
+        os.environ.pop('HEMALINK_SHARED_STATE', None)
+    import app
+    if shared:
+        donor_ids, request_ids = sorted(app.donors_db), sorted(app.blood_requests_db)
+    else:
+        donor_ids, request_ids = load(*sizes, random.Random(5))
+    client = app.app.test_client()
+    rng = random.Random(seed)
+    routes = [
+        lambda: f"/donor/dashboard/{rng.choice(donor_ids)}",
+        lambda: '/api/donors',
+        lambda: '/api/requests',
+        lambda: '/api/requests/critical',
+        lambda: '/api/statistics',
+        lambda: f"/api/matching-donors/{rng.choice(request_ids)}",
+        lambda: '/blood-inventory',
+        None,
+    ]
+    ready.put(os.getpid())
+    start.wait()
+    count = writes = 0
+    cpu = time.process_time()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        if rng.random() * 100 < write_percent:
+            client.post(f"/donor/update/{rng.choice(donor_ids)}",
+                        data={'available': 'on' if rng.random() < 0.9 else '', 'phone': '9876543210'})
+            writes += 1
+        else:
+            route = rng.choice(routes)
+            if route is None:
+                response = client.post('/search-donors', data={'blood_group': rng.choice(GROUPS), 'location': 'pune'})
+            else:
+                response = client.get(route())
+            assert response.status_code == 200, response.status_code
+        count += 1
+    results.put((count, writes, time.process_time() - cpu))
+
+
+def run(workers, shared, sizes, seconds, write_percent):
+    """Returns (requests/s, writes, worker CPU seconds, store CPU seconds)"""
+    context = multiprocessing.get_context('spawn')
+    ready, results, start = context.Queue(), context.Queue(), context.Event()
+    processes = [context.Process(target=worker, args=(shared, sizes, seconds, write_percent, i,
+                                                      ready, start, results))
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.get()
+    store_started = store_cpu_seconds() if shared else 0
+    start.set()
+    totals = [results.get() for _ in processes]
+    store_seconds = store_cpu_seconds() - store_started if shared else 0
+    for process in processes:
+        process.join()
+    count, writes, cpu = (sum(column) for column in zip(*totals))
+    return count / seconds, writes, cpu, store_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark read-heavy throughput across worker processes')
+    parser.add_argument('--donors', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--workers', default=','.join(str(2 ** i) for i in range(4)))
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-percent', type=float, default=1.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        socket_path = os.path.join(directory, 'hemalink.sock')
+        os.environ['HEMALINK_SHARED_STATE'] = socket_path
+        store = start_store(socket_path)
+        started = time.perf_counter()
+        sizes = (args.donors, args.requests)
+        donor_ids, request_ids = load(*sizes, random.Random(5))
+        print(f"loaded {len(donor_ids):,} donors and {len(request_ids):,} requests "
+              f"in {time.perf_counter() - started:.1f} s; {os.cpu_count()} cores")
+
+        baseline = None
+        for workers in [int(w) for w in args.workers.split(',')]:
+            note = '  (more workers than cores)' if workers > os.cpu_count() else ''
+            for label, shared in (('shared', True), ('independent', False)):
+                rate, writes, cpu, store_seconds = run(workers, shared, sizes, args.seconds, args.write_percent)
+                baseline = baseline or rate
+                print(f"  {workers:>3} workers, {label:<11} {rate:>9,.0f} requests/s, "
+                      f"speedup {rate / baseline:.2f}x, {writes:,} writes, worker CPU {cpu:.1f} s "
+                      f"({rate * args.seconds / cpu:,.0f} requests/CPU-s), store CPU {store_seconds:.2f} s{note}")
+        store.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+HemaLink - Storage backend benchmark
+
+Runs the same workload through every storage backend aws_app.py can
+use, and through app.py's AppRepository: bulk-loads synthetic donors,
+requests and donations with put_many(), then times item reads, the
+matching queries (find_donors, and rank_donors as queries.py runs it),
+donor search by city, indexed lookups, dashboard pages (first and
+deep) and counts, and atomic inventory updates. Each operation runs
+`--operations` times or for `--seconds`, whichever ends first.
+
+Backends are opened the way aws_app.py opens them: `sqlite` in a
+temporary database file, `dynamodb` with the DYNAMODB_* settings (point
+DYNAMODB_ENDPOINT_URL at DynamoDB Local to run it offline); `app` loads
+on top of app.py's sample data. A backend that cannot be reached is
+skipped.
+
+    python benchmarks/storage_backends.py --donors 1000000 --backends memory,sqlite,app
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('HEMALINK_STORAGE', 'memory')
+import aws_app  # noqa: E402
+from blood_rules import today_ordinal  # noqa: E402
+from cache import percentile_ms  # noqa: E402
+from queries import MATCH_LIMIT  # noqa: E402
+
+GROUPS = list(aws_app.BLOOD_COMPATIBILITY)
+CITIES = ['Mumbai', 'Delhi', 'Bengaluru', 'Hyderabad', 'Chennai', 'Kolkata', 'Pune', 'Jaipur']
+STATUSES = ['pending', 'pending', 'partially_fulfilled', 'fulfilled', 'cancelled']
+
+
+def make_data(donors, rng):
+    today = date.today()
+    donor_items = [{
+        'donor_id': f"DON-B{i:07X}", 'name': f'Donor {i}', 'blood_group': rng.choice(GROUPS),
+        'city': rng.choice(CITIES), 'state': 'State', 'pincode': f'{rng.randint(110001, 799999)}',
+        'available': rng.random() < 0.8, 'status': 'active', 'total_donations': rng.randint(0, 10),
+        'last_donation': None, 'created_at': (today - timedelta(days=rng.randint(0, 999))).isoformat()
+    } for i in range(donors)]
+    request_items = [{
+        'request_id': f"BR-B{i:07X}", 'requestor_id': f"REQ-B{rng.randint(0, donors // 50):05X}",
+        'blood_group': rng.choice(GROUPS), 'units_needed': rng.randint(1, 5), 'status': rng.choice(STATUSES),
+        'urgency': rng.choice(['normal', 'high', 'critical']),
+        'created_at': f"{today - timedelta(days=rng.randint(0, 365))} {rng.randint(0, 23):02d}:00:00"
+    } for i in range(donors // 10)]
+    donation_items = [{
+        'donation_id': f"DN-B{i:07X}", 'donor_id': rng.choice(donor_items)['donor_id'],
+        'blood_group': rng.choice(GROUPS), 'units': 1,
+        'donation_date': (today - timedelta(days=rng.randint(0, 365))).isoformat()
+    } for i in range(donors // 5)]
+    return {'donors': donor_items, 'blood_requests': request_items, 'donations': donation_items}
+
+
+def open_backend(name, data_dir):
+    if name == 'app':
+        import app
+        return app.repository
+    aws_app.STORAGE_BACKEND = name
+    aws_app.SQLITE_PATH = os.path.join(data_dir, 'hemalink.db')
+    backend = aws_app.open_storage()
+    return backend if backend.name == name else None
+
+
+def timed(operations, seconds, call):
+    samples = []
+    deadline = time.perf_counter() + seconds
+    while len(samples) < operations and (len(samples) < 3 or time.perf_counter() < deadline):
+        started = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def last_cursor(backend, store, pages):
+    """Cursor of page `pages` + 1 of a store, for timing deep dashboard pages"""
+    cursor = None
+    for _ in range(pages):
+        _, cursor = backend.page(store, cursor, aws_app.DASHBOARD_PAGE_SIZE)
+        if cursor is None:
+            break
+    return cursor
+
+
+def run(backend, data, operations, seconds, rng):
+    results = {}
+    for store, items in data.items():
+        started = time.perf_counter()
+        backend.put_many(store, items)
+        results[f'put_many {store}'] = (len(items) / (time.perf_counter() - started), None, None)
+
+    donor_ids = [d['donor_id'] for d in data['donors']]
+    requestor_ids = sorted({r['requestor_id'] for r in data['blood_requests']})
+    deep_cursor = last_cursor(backend, 'blood_requests', 20)
+    workload = {
+        'get donor': lambda: backend.get('donors', rng.choice(donor_ids)),
+        'find_donors (match)': lambda: backend.find_donors(aws_app.BLOOD_COMPATIBILITY[rng.choice(GROUPS)]),
+        'rank_donors (match, top 10)': lambda: backend.rank_donors({'blood_group': rng.choice(GROUPS)},
+                                                                   today_ordinal(), limit=MATCH_LIMIT),
+        'find donors by city (search)': lambda: backend.find('donors', 'city', rng.choice(CITIES)),
+        'find requests by requestor': lambda: backend.find('blood_requests', 'requestor_id',
+                                                           rng.choice(requestor_ids)),
+        'page requests by status': lambda: backend.page('blood_requests', None, aws_app.DASHBOARD_PAGE_SIZE,
+                                                        'status', 'pending'),
+        'page donations': lambda: backend.page('donations', None, aws_app.DASHBOARD_PAGE_SIZE),
+        'page requests, page 21': lambda: backend.page('blood_requests', deep_cursor, aws_app.DASHBOARD_PAGE_SIZE),
+        'count donors': lambda: backend.count('donors'),
+        'increment inventory': lambda: backend.increment('inventory', rng.choice(GROUPS), 'units', 1),
+    }
+    for label, call in workload.items():
+        samples = timed(operations, seconds, call)
+        results[label] = (len(samples) / sum(samples), percentile_ms(samples, 0.5), percentile_ms(samples, 0.99))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the storage backends on the same workload')
+    parser.add_argument('--donors', type=int, default=20000)
+    parser.add_argument('--operations', type=int, default=200, help='Timed calls per operation')
+    parser.add_argument('--seconds', type=float, default=5, help='Time limit per operation')
+    parser.add_argument('--backends', default='memory,sqlite,dynamodb,app')
+    args = parser.parse_args()
+
+    data = make_data(args.donors, random.Random(11))
+    for name in args.backends.split(','):
+        with tempfile.TemporaryDirectory() as data_dir:
+            backend = open_backend(name, data_dir)
+            if backend is None:
+                print(f"{name}: not available, skipped")
+                continue
+            print(f"{name} ({args.donors:,} donors)")
+            results = run(backend, data, args.operations, args.seconds, random.Random(13))
+            for label, (rate, p50, p99) in results.items():
+                latency = f", p50 {p50} ms, p99 {p99} ms" if p50 is not None else ''
+                print(f"  {label:<30} {rate:>12,.0f}/s{latency}")
+            if hasattr(backend, 'close'):
+                backend.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""
+HemaLink - Blood compatibility and donor eligibility rules
+
+The rules every HemaLink deployment applies, whatever it stores data in:
+which blood groups a recipient can receive, the 56-day gap between
+donations and the donor eligibility score used to rank matches. app.py
+and aws_app.py both import them from here; matching.DonorColumns
+computes the same score for many donors at once.
+
+Blood groups are also numbered 0-7 (GROUP_CODES), so a set of groups
+is an 8-bit mask. For each component (red cells, the default, plasma
+and platelets) the tables are precomputed both ways:
+compatible_donor_mask() gives the donor groups a recipient group can
+receive from, and recipient_mask() gives the recipient groups a donor
+group can serve. A compatibility check is then one bit test.
+
+Days are date ordinals (date.toordinal()). A donor's last donation is
+kept as the ISO date string plus its pre-parsed day number
+('last_donation_day'); records written before that field existed are
+parsed on the fly.
+"""
+from datetime import date, datetime
+
+from flask import g, has_request_context
+
+# Who can receive from whom
+BLOOD_COMPATIBILITY = {
+    'A+': ['A+', 'A-', 'O+', 'O-'],
+    'A-': ['A-', 'O-'],
+    'B+': ['B+', 'B-', 'O+', 'O-'],
+    'B-': ['B-', 'O-'],
+    'AB+': ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-'],  # Universal recipient
+    'AB-': ['A-', 'B-', 'AB-', 'O-'],
+    'O+': ['O+', 'O-'],
+    'O-': ['O-']  # Universal donor
+}
+
+# Plasma: ABO only (the donor's plasma must not carry antibodies to the recipient's antigens), Rh does not matter
+PLASMA_COMPATIBILITY = {
+    'A+': ['A+', 'A-', 'AB+', 'AB-'],
+    'A-': ['A+', 'A-', 'AB+', 'AB-'],
+    'B+': ['B+', 'B-', 'AB+', 'AB-'],
+    'B-': ['B+', 'B-', 'AB+', 'AB-'],
+    'AB+': ['AB+', 'AB-'],
+    'AB-': ['AB+', 'AB-'],
+    'O+': ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-'],
+    'O-': ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']  # AB is the universal plasma donor
+}
+
+# Platelets: ABO-compatible plasma as above, and Rh-negative recipients only from Rh-negative donors
+PLATELET_COMPATIBILITY = {
+    'A+': ['A+', 'A-', 'AB+', 'AB-'],
+    'A-': ['A-', 'AB-'],
+    'B+': ['B+', 'B-', 'AB+', 'AB-'],
+    'B-': ['B-', 'AB-'],
+    'AB+': ['AB+', 'AB-'],
+    'AB-': ['AB-'],
+    'O+': ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-'],
+    'O-': ['A-', 'B-', 'AB-', 'O-']
+}
+
+# Who can receive from whom, per blood component; red cells (whole blood) is the default
+COMPONENT_COMPATIBILITY = {
+    'red_cells': BLOOD_COMPATIBILITY,
+    'plasma': PLASMA_COMPATIBILITY,
+    'platelets': PLATELET_COMPATIBILITY
+}
+DEFAULT_COMPONENT = 'red_cells'
+
+# Blood groups as small ints: bit positions in group masks
+BLOOD_GROUPS = ('A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-')
+GROUP_CODES = {bg: code for code, bg in enumerate(BLOOD_GROUPS)}
+UNKNOWN_GROUP = -1
+
+
+def groups_mask(blood_groups):
+    """8-bit mask of a collection of blood group names (unknown names are ignored)"""
+    mask = 0
+    for bg in blood_groups:
+        if bg in GROUP_CODES:
+            mask |= 1 << GROUP_CODES[bg]
+    return mask
+
+
+# {component: [mask of donor groups, indexed by recipient group code]}
+DONOR_MASKS = {component: [groups_mask(table[bg]) for bg in BLOOD_GROUPS]
+               for component, table in COMPONENT_COMPATIBILITY.items()}
+
+# Reverse map, {component: [mask of recipient groups, indexed by donor group code]}
+RECIPIENT_MASKS = {component: [groups_mask(r for r in BLOOD_GROUPS if bg in table[r]) for bg in BLOOD_GROUPS]
+                   for component, table in COMPONENT_COMPATIBILITY.items()}
+
+# Group codes in each possible mask, so iterating a mask needs no bit loop: {mask: (codes)}
+_MASK_CODES = [tuple(code for code in range(len(BLOOD_GROUPS)) if mask >> code & 1)
+               for mask in range(1 << len(BLOOD_GROUPS))]
+
+
+def group_code(blood_group):
+    """Small-int code of a blood group, UNKNOWN_GROUP if it is not one"""
+    return GROUP_CODES.get(blood_group, UNKNOWN_GROUP)
+
+
+def codes_in(mask):
+    """Group codes set in a mask, in code order"""
+    return _MASK_CODES[mask]
+
+
+def groups_in(mask):
+    """Blood group names set in a mask, in code order"""
+    return [BLOOD_GROUPS[code] for code in _MASK_CODES[mask]]
+
+
+def compatible_donor_mask(recipient_group, component=DEFAULT_COMPONENT):
+    """Mask of the donor groups a recipient group can receive `component` from (0 if unknown)"""
+    code = GROUP_CODES.get(recipient_group)
+    return 0 if code is None else DONOR_MASKS[component][code]
+
+
+def recipient_mask(donor_group, component=DEFAULT_COMPONENT):
+    """Mask of the recipient groups a donor group can give `component` to (0 if unknown)"""
+    code = GROUP_CODES.get(donor_group)
+    return 0 if code is None else RECIPIENT_MASKS[component][code]
+
+
+def is_compatible(recipient_group, donor_group, component=DEFAULT_COMPONENT):
+    """Whether a donor group can give `component` to a recipient group"""
+    code = GROUP_CODES.get(donor_group)
+    return code is not None and bool(compatible_donor_mask(recipient_group, component) >> code & 1)
+
+# Days a donor must wait between donations
+DONATION_INTERVAL_DAYS = 56
+
+
+def today_ordinal():
+    """Get today's date as a day number, computed once per HTTP request"""
+    if not has_request_context():
+        return date.today().toordinal()
+    if 'today' not in g:
+        g.today = date.today().toordinal()
+    return g.today
+
+
+def donation_day(last_donation):
+    """Convert a 'YYYY-MM-DD' last donation date to a day number (None if unset)"""
+    if not last_donation:
+        return None
+    return datetime.strptime(last_donation, '%Y-%m-%d').toordinal()
+
+
+def set_last_donation(donor, donation_date):
+    """Record a donor's last donation as the ISO date string and its pre-parsed day number"""
+    donor['last_donation'] = donation_date
+    donor['last_donation_day'] = donation_day(donation_date)
+
+
+def last_donation_day(donor):
+    """Day number of the donor's last donation (None if unset or unparseable)"""
+    day = donor.get('last_donation_day')
+    if day is not None:
+        return int(day)
+    try:
+        return donation_day(donor.get('last_donation'))
+    except (TypeError, ValueError):
+        return None
+
+
+def can_donate(donor, today=None):
+    """Check if donor can donate (56 days gap required)"""
+    day = last_donation_day(donor)
+    if day is None:
+        return True
+    if today is None:
+        today = today_ordinal()
+    return today - day >= DONATION_INTERVAL_DAYS
+
+
+def calculate_donor_eligibility(donor, today=None):
+    """Calculate donor eligibility score"""
+    score = 100
+
+    # Age factor
+    age = donor.get('age', 0)
+    if 25 <= age <= 45:
+        score += 10
+    elif age < 18 or age > 65:
+        score -= 50
+
+    # Availability
+    if not donor.get('available', True):
+        score -= 100
+
+    # Last donation recency
+    day = last_donation_day(donor)
+    if day is not None:
+        if today is None:
+            today = today_ordinal()
+        if today - day > 90:
+            score += 5
+    elif not donor.get('last_donation'):
+        score += 10  # New donor bonus
+
+    # Donation history
+    total_donations = donor.get('total_donations', 0)
+    score += min(total_donations * 2, 20)
+
+    return max(0, min(score, 150))
@@ -0,0 +1,146 @@
+"""
+HemaLink - Streaming bulk import of donors and blood requests
+
+Reads CSV (with a header row) or JSON Lines from a binary stream one row
+at a time, validates each row with the same rules as the registration
+forms, and hands valid records to the backend in batches. Only one batch
+and at most MAX_REPORTED_ERRORS row errors are held in memory, so files
+of any size can be loaded.
+
+The backends (app.py and aws_app.py) supply a `build` function that
+turns a row into a record (raising ValueError with a message for invalid
+rows) and a `write_batch` function that stores a list of records.
+"""
+import csv
+import io
+import json
+import time
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+FORMATS = ('csv', 'jsonl')
+
+# Text fields a record is useless without; whitespace alone does not count as a value
+REQUIRED_FIELDS = {
+    'donors': ('name', 'blood_group', 'phone', 'city'),
+    'requests': ('patient_name', 'blood_group', 'hospital_name', 'contact_phone')
+}
+
+
+def detect_format(filename=None, content_type=None, default='csv'):
+    """Guess the format from a filename or content type"""
+    name = (filename or '').lower()
+    if name.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    if name.endswith('.csv'):
+        return 'csv'
+    content_type = (content_type or '').lower()
+    if 'ndjson' in content_type or 'jsonl' in content_type or 'json' in content_type:
+        return 'jsonl'
+    if 'csv' in content_type:
+        return 'csv'
+    return default
+
+
+def blank_required_error(kind, record):
+    """Error message naming the REQUIRED_FIELDS of `kind` that are blank in a record, or None"""
+    blank = [field for field in REQUIRED_FIELDS[kind] if not str(record.get(field) or '').strip()]
+    if blank:
+        return f"Required field{'s' if len(blank) > 1 else ''} left blank: {', '.join(blank)}!"
+    return None
+
+
+def iter_rows(stream, fmt):
+    """
+    Yield (line_number, row, error) for each record in a binary stream
+    `row` is a dict of string field values, or None when `error` says why the line is unreadable
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            if None in row:
+                yield reader.line_num, None, 'too many values'
+            else:
+                yield reader.line_num, row, None
+        return
+
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f'invalid JSON: {e}'
+            continue
+        if isinstance(row, dict):
+            # Rows look like submitted forms, whichever format they came from
+            yield line_number, {k: '' if v is None else str(v) for k, v in row.items()}, None
+        else:
+            yield line_number, None, 'expected a JSON object'
+
+
+class ImportReport:
+    """Counts, the first row errors, and throughput of one import"""
+
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+        return self
+
+    @property
+    def rows_per_second(self):
+        rows = self.imported + self.failed
+        return round(rows / self.seconds) if self.seconds else rows
+
+    def as_dict(self):
+        return {
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': self.rows_per_second
+        }
+
+
+def run_import(rows, build, write_batch, batch_size=BATCH_SIZE, dry_run=False):
+    """
+    Validate rows from iter_rows() with `build` and store them with `write_batch`
+    With dry_run, rows are only validated. Returns an ImportReport
+    """
+    report = ImportReport()
+    batch = []
+
+    def flush():
+        if batch and not dry_run:
+            write_batch(batch)
+        report.imported += len(batch)
+        batch.clear()
+
+    for line, row, error in rows:
+        if error is None:
+            try:
+                batch.append(build(row))
+            except KeyError as e:
+                error = f'missing field: {e.args[0]}'
+            except (TypeError, ValueError) as e:
+                error = str(e) or 'invalid value'
+        if error is not None:
+            report.add_error(line, error)
+            continue
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return report.finish()
@@ -0,0 +1,252 @@
+"""
+HemaLink - Read-through cache for storage backend lookups
+
+ReadThroughCache.get(key, loader) returns a cached value or calls
+`loader()` on a miss and keeps the result. Entries live in an in-process
+LRU of at most `max_items` entries, each for `ttl` seconds. With a
+`shared` backing (RedisCache: Redis or any server speaking its protocol),
+misses in the local LRU are looked up there before loading, and loaded
+values are stored in both, so several app instances share one warm
+cache. The local copies then only live `shared_local_ttl` seconds, since
+another instance's writes can only invalidate the shared copy.
+
+Writers invalidate what they change (write-through invalidation).
+Results derived from many items, such as a table scan, are registered
+under a group (the table name) and dropped together by
+invalidate(group=...). A load that overlaps an invalidation is returned
+but not cached, so a slow read never puts back a value a write has just
+replaced. None is never cached. Across instances the same guard uses a
+version counter in the shared tier: every invalidation bumps it, and a
+loaded value is only written to the shared tier (under WATCH/MULTI) if
+the counter has not moved since before the load.
+
+Hit, miss and invalidation counters and p50/p99 latency of hits and of
+misses (including the load) are reported by metrics().
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from decimal import Decimal
+
+import msgpack
+
+try:
+    import redis
+    from redis.exceptions import WatchError
+except ImportError:
+    redis = None
+    WatchError = None
+
+# msgpack extension type carrying DynamoDB's Decimal numbers as text
+DECIMAL_EXT = 1
+
+
+def shared_cache_available():
+    """Whether the redis client is installed"""
+    return redis is not None
+
+
+def _encode(value):
+    if isinstance(value, Decimal):
+        return msgpack.ExtType(DECIMAL_EXT, str(value).encode())
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Cannot cache {type(value).__name__}")
+
+
+def _decode(code, data):
+    if code == DECIMAL_EXT:
+        return Decimal(data.decode())
+    return msgpack.ExtType(code, data)
+
+
+def pack(value):
+    return msgpack.packb(value, default=_encode, use_bin_type=True)
+
+
+def unpack(data):
+    return msgpack.unpackb(data, ext_hook=_decode, raw=False, strict_map_key=False)
+
+
+def percentile_ms(samples, fraction):
+    """Nearest-rank percentile of latency samples (seconds), in milliseconds"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 3)
+
+
+class RedisCache:
+    """
+    Shared cache backing on a Redis-compatible server; values are msgpack-encoded
+    Connects to `url`, or uses an existing redis-py compatible `client` (e.g. fakeredis in benchmarks)
+    """
+
+    def __init__(self, url=None, prefix='hemalink:cache:', client=None):
+        self.client = client if client is not None else redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.version_key = prefix + 'version'
+
+    def get(self, key):
+        """(value or None, version) of `key`; pass the version to set() when caching a value loaded after this"""
+        data, version = self.client.mget(self.prefix + key, self.version_key)
+        return None if data is None else unpack(data), version
+
+    def set(self, key, value, ttl, group=None, version=None):
+        """Store `value` unless an invalidation has moved the version on from `version` (see get); True if stored"""
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(self.version_key)
+                if pipe.get(self.version_key) != version:
+                    return False
+                pipe.multi()
+                pipe.set(self.prefix + key, pack(value), px=int(ttl * 1000))
+                if group is not None:
+                    pipe.sadd(self.prefix + 'group:' + group, key)
+                    pipe.pexpire(self.prefix + 'group:' + group, int(ttl * 1000))
+                pipe.execute()
+            except WatchError:
+                return False
+        return True
+
+    def delete(self, keys=(), group=None):
+        """Drop `keys` and the members of `group`, bumping the version first so in-flight loads aren't stored"""
+        keys = [self.prefix + key for key in keys]
+        pipe = self.client.pipeline()
+        pipe.incr(self.version_key)
+        if group is not None:
+            group_key = self.prefix + 'group:' + group
+            pipe.smembers(group_key)
+            keys.extend(self.prefix + member.decode() for member in pipe.execute()[1])
+            keys.append(group_key)
+        else:
+            pipe.execute()
+        if keys:
+            self.client.delete(*keys)
+
+
+class ReadThroughCache:
+    """TTL + LRU read-through cache with an optional shared tier and write-through invalidation"""
+
+    def __init__(self, max_items=10000, ttl=30.0, shared=None, shared_local_ttl=2.0, latency_samples=10000):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.shared = shared
+        self.local_ttl = min(ttl, shared_local_ttl) if shared else ttl
+        self.entries = OrderedDict()
+        self.groups = {}
+        self.epoch = 0
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'shared_hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0,
+                      'shared_errors': 0}
+        self.hit_latency = deque(maxlen=latency_samples)
+        self.miss_latency = deque(maxlen=latency_samples)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, loader, group=None):
+        """Cached value of `key`, loading (and caching) it with `loader()` on a miss"""
+        started = time.perf_counter()
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                self.hit_latency.append(time.perf_counter() - started)
+                return entry[1]
+            epoch = self.epoch
+
+        value = shared_version = None
+        if self.shared is not None:
+            try:
+                value, shared_version = self.shared.get(key)
+            except Exception as e:
+                self._shared_error(e)
+        if value is not None:
+            self._store(key, value, group, epoch)
+            with self.lock:
+                self.stats['shared_hits'] += 1
+                self.hit_latency.append(time.perf_counter() - started)
+            return value
+
+        value = loader()
+        if value is not None and self._store(key, value, group, epoch) and self.shared is not None:
+            try:
+                self.shared.set(key, value, self.ttl, group, shared_version)
+            except Exception as e:
+                self._shared_error(e)
+        with self.lock:
+            self.stats['misses'] += 1
+            self.miss_latency.append(time.perf_counter() - started)
+        return value
+
+    def _store(self, key, value, group, epoch):
+        """Keep a value locally unless something was invalidated since `epoch`; True if kept"""
+        with self.lock:
+            if self.epoch != epoch:
+                return False
+            self.entries[key] = (time.monotonic() + self.local_ttl, value, group)
+            self.entries.move_to_end(key)
+            if group is not None:
+                self.groups.setdefault(group, set()).add(key)
+            while len(self.entries) > self.max_items:
+                old_key, (_, _, old_group) = self.entries.popitem(last=False)
+                self._forget_group_key(old_key, old_group)
+                self.stats['evictions'] += 1
+            return True
+
+    def _forget_group_key(self, key, group):
+        if group is not None and group in self.groups:
+            self.groups[group].discard(key)
+
+    def invalidate(self, *keys, group=None):
+        """Drop `keys` and every entry registered under `group`, locally and in the shared tier"""
+        with self.lock:
+            self.epoch += 1
+            for key in keys:
+                entry = self.entries.pop(key, None)
+                if entry is not None:
+                    self._forget_group_key(key, entry[2])
+            if group is not None:
+                for key in self.groups.pop(group, ()):
+                    self.entries.pop(key, None)
+            self.stats['invalidations'] += 1
+        if self.shared is not None:
+            try:
+                self.shared.delete(keys, group)
+            except Exception as e:
+                self._shared_error(e)
+
+    def clear(self):
+        with self.lock:
+            self.epoch += 1
+            self.entries.clear()
+            self.groups.clear()
+
+    def _shared_error(self, error):
+        # The shared tier is an optimization: fall back to loading from the source
+        with self.lock:
+            self.stats['shared_errors'] += 1
+            if self.stats['shared_errors'] in (1, 100) or self.stats['shared_errors'] % 10000 == 0:
+                print(f"[cache] Shared cache error ({self.stats['shared_errors']} so far): {error}")
+
+    def metrics(self):
+        """Hit/miss counters, hit ratio and p50/p99 latency of hits and misses"""
+        with self.lock:
+            hits = self.stats['hits'] + self.stats['shared_hits']
+            lookups = hits + self.stats['misses']
+            hit_latency, miss_latency = list(self.hit_latency), list(self.miss_latency)
+            return {
+                **self.stats,
+                'hit_ratio': round(hits / lookups, 4) if lookups else None,
+                'entries': len(self.entries),
+                'max_items': self.max_items,
+                'ttl_seconds': self.ttl,
+                'shared': self.shared is not None,
+                'latency_ms': {
+                    'hit': {'p50': percentile_ms(hit_latency, 0.5), 'p99': percentile_ms(hit_latency, 0.99)},
+                    'miss': {'p50': percentile_ms(miss_latency, 0.5), 'p99': percentile_ms(miss_latency, 0.99)}
+                }
+            }
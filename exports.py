@@ -0,0 +1,116 @@
+"""
+HemaLink - Streaming exports of donations and inventory transactions
+
+Serializes an iterable of records as CSV, JSON Lines or Parquet one chunk
+at a time. The output is a generator, so a Flask response (or a file
+write loop) sends each chunk as soon as it is ready and an export of
+millions of rows never holds more than CHUNK_ROWS of them in memory.
+
+Columns are described by an export schema, a list of (field, type) pairs
+with type int, float or str. CSV and JSON Lines only use the field names;
+Parquet uses the types for its column schema. Parquet needs pyarrow,
+which is optional: parquet_available() says whether it can be used.
+"""
+import csv
+import io
+import json
+from itertools import islice
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+EXPORT_FORMATS = ('csv', 'jsonl', 'parquet')
+MIMETYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+# Records serialized per chunk (and per Parquet row group)
+CHUNK_ROWS = 10000
+
+
+def parquet_available():
+    """Whether pyarrow is installed"""
+    return pq is not None
+
+
+def chunks(records, size=CHUNK_ROWS):
+    """Split an iterable into lists of up to `size` records"""
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_csv(records, schema):
+    """Yield CSV text (header first) for the schema's fields"""
+    fields = [name for name, _ in schema]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for chunk in chunks(records):
+        writer.writerows([['' if record.get(f) is None else record.get(f) for f in fields] for record in chunk])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_jsonl(records, schema):
+    """Yield JSON Lines text, one object per record"""
+    fields = [name for name, _ in schema]
+    for chunk in chunks(records):
+        yield ''.join(json.dumps({f: record.get(f) for f in fields}) + '\n' for record in chunk)
+
+
+class _ByteSink(io.RawIOBase):
+    """Write-only file that collects what the Parquet writer produces until it is drained"""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def iter_parquet(records, schema):
+    """Yield a Parquet file in pieces, one row group per chunk"""
+    types = {int: pa.int64(), float: pa.float64(), str: pa.string()}
+    arrow_schema = pa.schema([(name, types[kind]) for name, kind in schema])
+    sink = _ByteSink()
+    writer = pq.ParquetWriter(sink, arrow_schema)
+    for chunk in chunks(records):
+        columns = {name: [record.get(name) for record in chunk] for name, _ in schema}
+        writer.write_table(pa.Table.from_pydict(columns, schema=arrow_schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+WRITERS = {'csv': iter_csv, 'jsonl': iter_jsonl, 'parquet': iter_parquet}
+
+
+def stream_export(records, schema, fmt):
+    """Serialize records in an export format; check parquet_available() before asking for Parquet"""
+    return WRITERS[fmt](records, schema)
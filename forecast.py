@@ -0,0 +1,112 @@
+"""
+HemaLink - Inventory forecasting and stock-out early warning
+
+Fits a per-blood-group model of daily demand (units withdrawn or removed)
+and supply (units donated or added) from the transaction log's daily
+rollups, and projects how many days each group's current stock lasts.
+
+The model is an exponentially weighted moving average with a
+`half_life_days` half-life, plus an exponentially weighted variance of
+the daily net outflow (demand - supply), computed for all blood groups at
+once as NumPy vectors. It is updated incrementally: each completed day is
+folded in once, so keeping the forecast current costs O(groups) per new
+day and a page view only divides current stock by the fitted rates.
+Today's partial totals are left out until the day is over.
+
+    days_until_stockout = units / mean net outflow              (None if stock is not falling)
+    pessimistic         = units / (mean + z * std of net outflow)
+"""
+import threading
+
+import numpy as np
+
+# Transaction types that take units out of / put units into stock
+DEMAND_TYPES = ('withdrawn', 'remove')
+SUPPLY_TYPES = ('donated', 'add')
+
+# Rollup field holding units (see transaction_log.COUNT / UNITS)
+UNITS = 1
+
+
+class InventoryForecaster:
+    """Incrementally fitted demand/supply model over a TransactionLog's daily rollups"""
+
+    def __init__(self, log, half_life_days=14.0, z=1.64):
+        self.log = log
+        self.alpha = 1 - 0.5 ** (1 / half_life_days)
+        self.z = z
+        self.demand_types = [log.type_code[t] for t in DEMAND_TYPES if t in log.type_code]
+        self.supply_types = [log.type_code[t] for t in SUPPLY_TYPES if t in log.type_code]
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget the fit; the next update() refits from the start of the log"""
+        groups = len(self.log.blood_groups)
+        self.demand = np.zeros(groups)
+        self.supply = np.zeros(groups)
+        self.net_mean = np.zeros(groups)
+        self.net_var = np.zeros(groups)
+        self.days_fitted = 0
+        self.next_day = None
+
+    def _flows(self, day):
+        """(demand, supply) unit vectors for one day"""
+        rollup = self.log.daily.get(day)
+        if rollup is None:
+            return 0.0, 0.0
+        units = rollup[:, :, UNITS]
+        return units[:, self.demand_types].sum(axis=1), units[:, self.supply_types].sum(axis=1)
+
+    def update(self, today):
+        """Fold in every completed day before `today` (a date ordinal) not seen yet"""
+        with self.lock:
+            if self.next_day is None:
+                if not self.log.days:
+                    return
+                self.next_day = self.log.days[0]
+            alpha = self.alpha
+            for day in range(self.next_day, today):
+                demand, supply = self._flows(day)
+                net = demand - supply
+                deviation = net - self.net_mean
+                self.demand += alpha * (demand - self.demand)
+                self.supply += alpha * (supply - self.supply)
+                self.net_mean += alpha * deviation
+                self.net_var = (1 - alpha) * (self.net_var + alpha * deviation ** 2)
+                self.days_fitted += 1
+            self.next_day = max(self.next_day, today)
+
+    def forecast(self, units, today):
+        """
+        Project days until stock-out for each blood group from current `units` (in log.blood_groups order)
+        Returns {blood_group: {...}} with the fitted daily rates
+        """
+        self.update(today)
+        with self.lock:
+            # The averages start from zero; dividing by the weight seen so far removes that bias
+            weight = 1 - (1 - self.alpha) ** self.days_fitted
+            if weight == 0:
+                weight = 1.0
+            demand, supply, net = self.demand / weight, self.supply / weight, self.net_mean / weight
+            pessimistic_net = net + self.z * np.sqrt(self.net_var / weight)
+
+        units = np.asarray(units, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            days = np.where(net > 0, units / net, np.inf)
+            pessimistic = np.where(pessimistic_net > 0, units / pessimistic_net, np.inf)
+
+        def finite(value):
+            return round(float(value), 1) if np.isfinite(value) else None
+
+        return {
+            bg: {
+                'units': int(units[i]),
+                'daily_demand': round(float(demand[i]), 2),
+                'daily_supply': round(float(supply[i]), 2),
+                'net_daily_use': round(float(net[i]), 2),
+                'days_until_stockout': finite(days[i]),
+                'days_until_stockout_pessimistic': finite(pessimistic[i])
+            }
+            for i, bg in enumerate(self.log.blood_groups)
+        }
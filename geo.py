@@ -0,0 +1,196 @@
+"""
+HemaLink - Pincode geocoding and spatial index for proximity matching
+
+Donors and hospitals are placed at the centroid of their pincode, looked
+up in an offline CSV table (data/pincode_centroids.csv, columns
+pincode,latitude,longitude). The table may list full 6-digit pincodes or
+shorter prefixes; a pincode resolves to its longest listed prefix, so a
+3-digit sorting-district row covers every pincode in that district. Point
+HEMALINK_PINCODE_CENTROIDS at a full pincode directory export in the same
+format for post-office precision.
+
+GeoGrid is a geohash-style grid: each cell holds the distinct points that
+fall in it, and each point holds the IDs placed there. Radius queries only
+visit the cells overlapping the search circle; nearest-neighbour queries
+walk outwards ring by ring and stop once no unvisited cell can hold a
+closer point. Since many donors share a pincode, the work depends on the
+number of distinct points near the query, not on the number of donors.
+"""
+import csv
+import functools
+import heapq
+import math
+import os
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+DEFAULT_CENTROIDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'pincode_centroids.csv')
+
+# Shortest prefix a pincode may fall back to
+MIN_PREFIX_LENGTH = 3
+
+# Resolved pincodes kept per geocoder (least recently used evicted); India has about 19,000 pincodes
+LOCATE_CACHE_SIZE = 32768
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in kilometres"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class PincodeGeocoder:
+    """
+    Resolves pincodes to (latitude, longitude) from an offline centroid table
+    Results are kept in a bounded LRU, so arbitrary input can't grow it without limit
+    """
+
+    def __init__(self, path=None, cache_size=LOCATE_CACHE_SIZE):
+        self.path = path or os.getenv('HEMALINK_PINCODE_CENTROIDS', DEFAULT_CENTROIDS_PATH)
+        self.centroids = {}
+        self._resolve = functools.lru_cache(maxsize=cache_size)(self._longest_prefix_point)
+        if os.path.exists(self.path):
+            with open(self.path, newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    self.centroids[row['pincode'].strip()] = (float(row['latitude']), float(row['longitude']))
+
+    def locate(self, pincode):
+        """Get the (latitude, longitude) of a pincode, or None if it is not covered"""
+        return self._resolve(str(pincode or '').strip())
+
+    def _longest_prefix_point(self, pincode):
+        if pincode.isdigit():
+            for length in range(len(pincode), MIN_PREFIX_LENGTH - 1, -1):
+                point = self.centroids.get(pincode[:length])
+                if point:
+                    return point
+        return None
+
+
+class GeoGrid:
+    """Grid index of points, each holding a set of IDs"""
+
+    def __init__(self, cell_degrees=0.25):
+        self.cell_degrees = cell_degrees
+        self.cells = {}
+        self.point_of = {}
+        self.point_count = 0
+
+    def __len__(self):
+        return len(self.point_of)
+
+    def _cell(self, point):
+        return (math.floor(point[0] / self.cell_degrees), math.floor(point[1] / self.cell_degrees))
+
+    def add(self, item_id, point):
+        """Place an ID at a point, moving it if it was elsewhere"""
+        old = self.point_of.get(item_id)
+        if old == point:
+            return
+        if old is not None:
+            self.remove(item_id)
+        cell = self.cells.setdefault(self._cell(point), {})
+        if point not in cell:
+            cell[point] = set()
+            self.point_count += 1
+        cell[point].add(item_id)
+        self.point_of[item_id] = point
+
+    def remove(self, item_id):
+        """Drop an ID from the index"""
+        point = self.point_of.pop(item_id, None)
+        if point is None:
+            return
+        cell_key = self._cell(point)
+        cell = self.cells[cell_key]
+        cell[point].discard(item_id)
+        if not cell[point]:
+            del cell[point]
+            self.point_count -= 1
+            if not cell:
+                del self.cells[cell_key]
+
+    def within(self, lat, lon, radius_km):
+        """Yield (distance_km, ids) for every point within `radius_km`, unordered"""
+        lat_span = radius_km / KM_PER_DEGREE
+        widest = math.cos(math.radians(min(89.9, abs(lat) + lat_span)))
+        lon_span = min(180.0, radius_km / (KM_PER_DEGREE * widest))
+        row_lo, col_lo = self._cell((lat - lat_span, lon - lon_span))
+        row_hi, col_hi = self._cell((lat + lat_span, lon + lon_span))
+
+        if (row_hi - row_lo + 1) * (col_hi - col_lo + 1) > len(self.cells):
+            cells = self.cells.values()
+        else:
+            cells = (self.cells.get((row, col)) for row in range(row_lo, row_hi + 1)
+                     for col in range(col_lo, col_hi + 1))
+        for cell in cells:
+            if not cell:
+                continue
+            for point, ids in cell.items():
+                distance = haversine_km(lat, lon, point[0], point[1])
+                if distance <= radius_km:
+                    yield distance, ids
+
+    def _visited_bound_km(self, lat, lon, center, ring):
+        """
+        Distance from the query to the edge of the block of cells in rings < `ring`
+        Any point outside the block is at least this far away: the north/south edges
+        are parallels (exact along the meridian), and the east/west edges lie on
+        meridians, whose great-circle distance is a lower bound for the segment
+        """
+        if ring == 0:
+            return 0.0
+        d = self.cell_degrees
+        row, col = center
+        north = ((row + ring) * d - lat) * KM_PER_DEGREE
+        south = (lat - (row - ring + 1) * d) * KM_PER_DEGREE
+        east = (col + ring) * d - lon
+        west = lon - (col - ring + 1) * d
+        cos_lat = math.cos(math.radians(lat))
+        meridian = [
+            EARTH_RADIUS_KM * math.asin(min(1.0, math.sin(math.radians(min(90.0, dlon))) * cos_lat))
+            for dlon in (east, west)
+        ]
+        return max(0.0, min(north, south, *meridian))
+
+    def _ring(self, center, ring):
+        row, col = center
+        if ring == 0:
+            yield center
+            return
+        for c in range(col - ring, col + ring + 1):
+            yield (row - ring, c)
+            yield (row + ring, c)
+        for r in range(row - ring + 1, row + ring):
+            yield (r, col - ring)
+            yield (r, col + ring)
+
+    def nearest(self, lat, lon, max_km=None):
+        """
+        Yield (distance_km, ids) for points in order of increasing distance
+        Lazily expands ring by ring, so stopping early only pays for the points visited
+        """
+        center = self._cell((lat, lon))
+        max_ring = int(360 / self.cell_degrees)
+        remaining = self.point_count
+        heap = []
+        ring = 0
+        while remaining or heap:
+            bound = self._visited_bound_km(lat, lon, center, ring) if remaining and ring <= max_ring else math.inf
+            while heap and heap[0][0] <= bound:
+                distance, _, ids = heapq.heappop(heap)
+                if max_km is not None and distance > max_km:
+                    return
+                yield distance, ids
+            if bound == math.inf or (max_km is not None and bound > max_km):
+                return
+            for cell_key in self._ring(center, ring):
+                cell = self.cells.get(cell_key)
+                if not cell:
+                    continue
+                for point, ids in cell.items():
+                    heapq.heappush(heap, (haversine_km(lat, lon, point[0], point[1]), point, ids))
+                    remaining -= 1
+            ring += 1
@@ -0,0 +1,86 @@
+"""
+HemaLink - Substring index for donor location search
+
+Answers "which donors have a location containing this text" without
+looking at every donor. Each distinct location value is stored once, and
+all of its suffixes are kept in one sorted list (a flattened suffix trie).
+A substring query is then a prefix query over the suffixes: one bisection
+plus a walk over the matching entries, so the cost depends on the number
+of matches rather than on the number of donors. Pincodes are handled the
+same way, which makes pincode prefixes ("4000") a special case of the
+same lookup.
+
+Values are matched exactly as given; callers lowercase both sides where
+the search is case-insensitive.
+"""
+from sortedcontainers import SortedList
+
+
+class SubstringIndex:
+    """Maps IDs to one text value each and finds IDs whose value contains a query"""
+
+    def __init__(self):
+        self.ids_by_value = {}
+        self.value_of = {}
+        self.suffixes = SortedList()
+
+    def __len__(self):
+        return len(self.value_of)
+
+    def add(self, item_id, value):
+        """Index an ID under a value, replacing its previous value"""
+        value = value or ''
+        old = self.value_of.get(item_id)
+        if old == value:
+            return
+        if old is not None:
+            self.remove(item_id)
+
+        ids = self.ids_by_value.get(value)
+        if ids is None:
+            ids = self.ids_by_value[value] = set()
+            self.suffixes.update((value[i:], value) for i in range(len(value)))
+        ids.add(item_id)
+        self.value_of[item_id] = value
+
+    def remove(self, item_id):
+        """Drop an ID from the index"""
+        value = self.value_of.pop(item_id, None)
+        if value is None:
+            return
+        ids = self.ids_by_value[value]
+        ids.discard(item_id)
+        if not ids:
+            del self.ids_by_value[value]
+            for i in range(len(value)):
+                self.suffixes.remove((value[i:], value))
+
+    def matching_values(self, query):
+        """Get the distinct indexed values that contain `query`"""
+        if not query:
+            return set(self.ids_by_value)
+        values = set()
+        for suffix, value in self.suffixes.irange((query,)):
+            if not suffix.startswith(query):
+                break
+            values.add(value)
+        return values
+
+    def count(self, values):
+        """Number of IDs indexed under any of the given values"""
+        return sum(len(self.ids_by_value[value]) for value in values)
+
+    def ids_without(self, values):
+        """Get the IDs indexed under none of the given values"""
+        return self.ids_for(self.ids_by_value.keys() - values)
+
+    def ids_for(self, values):
+        """Get the IDs indexed under any of the given values"""
+        ids = set()
+        for value in values:
+            ids |= self.ids_by_value[value]
+        return ids
+
+    def search(self, query):
+        """Get the IDs whose value contains `query`"""
+        return self.ids_for(self.matching_values(query))
@@ -0,0 +1,180 @@
+"""
+HemaLink - Vectorized donor matching engine
+
+Keeps donor attributes in columnar NumPy arrays so eligibility scores for
+every compatible donor are computed in one pass, with a partial top-k
+selection instead of a full sort. Scores and ordering are identical to
+blood_rules.calculate_donor_eligibility() / match_blood_request() in app.py.
+"""
+from datetime import datetime
+
+import numpy as np
+
+from blood_rules import BLOOD_GROUPS, UNKNOWN_GROUP, codes_in, donation_day, group_code
+
+# Preferred contact times, stored as small ints
+CONTACT_TIME_CODES = {'Anytime': 0, 'Morning': 1, 'Afternoon': 2, 'Evening': 3}
+
+# Day number stored for donors who have never donated
+NO_DONATION = -1
+
+# Donors without a last donation sort as if they last donated on this day
+NO_DONATION_SORT_DAY = datetime(1900, 1, 1).toordinal()
+
+# Sort keys pack the score above the day number (ordinals fit in 20 bits)
+_DAY_BITS = 20
+
+
+class DonorColumns:
+    """Columnar store of the donor attributes used for matching, one row per donor"""
+
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.donor_ids = []
+        self.row_of = {}
+        self.free_rows = []
+        self.in_use = np.zeros(capacity, dtype=bool)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.available = np.zeros(capacity, dtype=bool)
+        self.group = np.full(capacity, UNKNOWN_GROUP, dtype=np.int8)
+        self.age = np.zeros(capacity, dtype=np.float64)
+        self.last_day = np.full(capacity, NO_DONATION, dtype=np.int32)
+        self.total_donations = np.zeros(capacity, dtype=np.int64)
+        self.contact_time = np.zeros(capacity, dtype=np.int8)
+
+    def _grow(self):
+        capacity = len(self.in_use) * 2
+        for name in ('in_use', 'active', 'available', 'group', 'age', 'last_day', 'total_donations', 'contact_time'):
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+
+    def upsert(self, donor):
+        """Add or refresh a donor's row"""
+        donor_id = donor['donor_id']
+        row = self.row_of.get(donor_id)
+        if row is None:
+            if self.free_rows:
+                row = self.free_rows.pop()
+                self.donor_ids[row] = donor_id
+            else:
+                if self.size == len(self.in_use):
+                    self._grow()
+                row = self.size
+                self.size += 1
+                self.donor_ids.append(donor_id)
+            self.row_of[donor_id] = row
+
+        available = bool(donor.get('available', True))
+        self.in_use[row] = True
+        self.available[row] = available
+        self.active[row] = available and donor.get('status') == 'active'
+        self.group[row] = group_code(donor.get('blood_group'))
+        self.age[row] = donor.get('age', 0)
+        last_day = donor.get('last_donation_day')
+        if last_day is None and donor.get('last_donation'):
+            last_day = donation_day(donor['last_donation'])
+        self.last_day[row] = NO_DONATION if last_day is None else last_day
+        self.total_donations[row] = donor.get('total_donations', 0)
+        self.contact_time[row] = CONTACT_TIME_CODES.get(donor.get('preferred_contact_time'), 0)
+
+    def remove(self, donor_id):
+        """Drop a donor's row"""
+        row = self.row_of.pop(donor_id, None)
+        if row is None:
+            return
+        self.in_use[row] = False
+        self.active[row] = False
+        self.group[row] = UNKNOWN_GROUP
+        self.free_rows.append(row)
+
+    def rows_for(self, donor_ids):
+        """Get the rows of a collection of donor IDs"""
+        return np.fromiter((self.row_of[d] for d in donor_ids if d in self.row_of), dtype=np.int64)
+
+    def group_mask(self, groups_mask):
+        """Boolean mask over all rows of active donors whose group is set in an 8-bit group mask"""
+        # One lookup per row: entry `code` says whether the group is in the mask, the last entry
+        # (what UNKNOWN_GROUP indexes) is always False
+        in_mask = np.zeros(len(BLOOD_GROUPS) + 1, dtype=bool)
+        in_mask[list(codes_in(groups_mask))] = True
+        n = self.size
+        return in_mask[self.group[:n]] & self.active[:n]
+
+    def eligibility(self, rows, today):
+        """
+        Compute eligibility scores and can-donate flags for the given rows
+        `today` is a day number (date.toordinal())
+        """
+        age = self.age[rows]
+        score = np.full(len(rows), 100, dtype=np.int64)
+        score += np.where((age >= 25) & (age <= 45), 10, np.where((age < 18) | (age > 65), -50, 0))
+        score -= np.where(self.available[rows], 0, 100)
+
+        last_day = self.last_day[rows]
+        has_donated = last_day != NO_DONATION
+        days_since = today - last_day
+        score += np.where(has_donated, np.where(days_since > 90, 5, 0), 10)
+        score += np.minimum(self.total_donations[rows] * 2, 20)
+        np.clip(score, 0, 150, out=score)
+
+        can_donate_now = ~has_donated | (days_since >= 56)
+        return score, can_donate_now
+
+    def _sort_keys(self, rows, score):
+        last_day = self.last_day[rows].astype(np.int64)
+        last_day[last_day == NO_DONATION] = NO_DONATION_SORT_DAY
+        return (score << _DAY_BITS) | last_day
+
+    def _top_k(self, rows, score, can_donate_now, limit):
+        """Best `limit` rows by score, then most recent donation, then donor ID"""
+        if not len(rows) or limit <= 0:
+            return []
+        keys = self._sort_keys(rows, score)
+        if len(rows) > limit:
+            kth = np.partition(keys, len(keys) - limit)[len(keys) - limit]
+            candidates = np.flatnonzero(keys >= kth)
+        else:
+            candidates = np.arange(len(rows))
+
+        ordered = sorted(candidates.tolist(), key=lambda i: (-int(keys[i]), self.donor_ids[rows[i]]))[:limit]
+        return [(self.donor_ids[rows[i]], int(score[i]), bool(can_donate_now[i])) for i in ordered]
+
+    def rank(self, rows, today, limit=10):
+        """
+        Score the given rows and return the best `limit` as
+        [(donor_id, match_score, can_donate_now), ...]
+        """
+        score, can_donate_now = self.eligibility(rows, today)
+        return self._top_k(rows, score, can_donate_now, limit)
+
+    def rank_many(self, row_sets, today, limit=10):
+        """
+        Rank several candidate row sets (e.g. one per pending request)
+        Scores every donor once and reuses them for each set
+        """
+        all_rows = np.arange(self.size)
+        score, can_donate_now = self.eligibility(all_rows, today)
+        return [self._top_k(rows, score[rows], can_donate_now[rows], limit) for rows in row_sets]
+
+    def recall_candidates(self, groups_mask, preferred_group, today, limit=None):
+        """
+        Rows of active donors in the groups of `groups_mask` who can donate today (56-day rule), best first:
+        donors of `preferred_group` first, then by eligibility score, then longest since last donation
+        Returns (rows, scores)
+        """
+        n = self.size
+        rows = np.arange(n)
+        score, can_donate_now = self.eligibility(rows, today)
+        mask = self.group_mask(groups_mask) & can_donate_now
+        rows = np.flatnonzero(mask)
+
+        last_day = self.last_day[rows].astype(np.int64)
+        last_day[last_day == NO_DONATION] = NO_DONATION_SORT_DAY
+        other_group = self.group[rows] != group_code(preferred_group)
+        # lexsort orders by the last key first
+        order = np.lexsort((last_day, -score[rows], other_group))
+        if limit is not None:
+            order = order[:limit]
+        return rows[order], score[rows[order]]
@@ -0,0 +1,437 @@
+"""
+HemaLink - Durable notification outbox with background delivery
+
+Request handlers hand notifications to Outbox.enqueue() and return at
+once; a pool of worker threads delivers them through one pluggable
+backend per channel (SMS, email, admin alerts, ...). Each channel has its
+own token-bucket rate limit, and due messages go out in batches of up to
+`batch_size`. A message is never sent before its `send_after` time
+(epoch seconds).
+
+A failed delivery is retried with exponential backoff and jitter
+(`retry_base_seconds`, doubling up to `retry_max_seconds`) until
+`max_attempts`, after which it is dropped as dead. A message enqueued
+with a `dedup_key` is ignored while another with the same key is pending
+or was delivered in the last `dedup_seconds`, so a retried request
+handler does not notify twice.
+
+With a `path`, every enqueue, retry and final outcome is appended to a
+msgpack journal there, fsynced in batches by a background thread; on
+startup the journal is replayed and pending messages are delivered.
+The journal is rewritten with only the live entries once it holds
+`compact_every` finished ones; the flusher thread writes the new file
+outside the lock and only swaps it in under it, so enqueues never wait
+for that rewrite. Without a path the outbox is memory-only.
+
+A backend is any object with a `name` and a `send_batch(messages)`
+method that returns one True/False delivery result per message (or None
+when all were delivered); raising counts as every message failing.
+LogBackend is the local stand-in for an SMS or email provider.
+"""
+import heapq
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+
+import msgpack
+
+
+class LogBackend:
+    """Local stand-in for an SMS / email provider: keeps recent messages and logs one line per batch"""
+
+    def __init__(self, name='log', keep=1000):
+        self.name = name
+        self.sent = deque(maxlen=keep)
+        self.count = 0
+
+    def send_batch(self, messages):
+        self.sent.extend(messages)
+        self.count += len(messages)
+        print(f"[notify] {self.name}: delivered {len(messages)} messages ({self.count} total)")
+        return None
+
+
+class RateLimiter:
+    """Token bucket: `rate` tokens a second, holding at most `burst`"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def wait_time(self, count):
+        """Seconds until `count` tokens are available (0 if they are now)"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return max(0.0, (count - self.tokens) / self.rate)
+
+    def take(self, count):
+        self.tokens -= count
+
+
+class Channel:
+    """One delivery channel: its backend, rate limit and schedule of (next_attempt, id) entries"""
+
+    def __init__(self, backend, rate, batch_size):
+        self.backend = backend
+        self.limiter = RateLimiter(rate, burst=max(rate, batch_size))
+        self.schedule = []
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty sorted list"""
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Outbox:
+    """Durable notification queue drained by a pool of rate-limited, batching workers"""
+
+    def __init__(self, backends, path=None, rates=None, default_rate=20.0, workers=2, batch_size=100,
+                 max_attempts=5, retry_base_seconds=2.0, retry_max_seconds=600.0, dedup_seconds=86400,
+                 on_result=None, fsync_interval=0.05, compact_every=100000):
+        rates = rates or {}
+        self.channels = {name: Channel(backend, rates.get(name, default_rate), batch_size)
+                         for name, backend in backends.items()}
+        self.path = path
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.dedup_seconds = dedup_seconds
+        self.on_result = on_result
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+
+        self.pending = {}
+        self.pending_keys = {}
+        self.recent_keys = OrderedDict()
+        self.next_id = 1
+        self.in_flight = 0
+        self.lags = deque(maxlen=10000)
+        self.stats = {'enqueued': 0, 'duplicates': 0, 'delivered': 0, 'retried': 0, 'dead': 0}
+        self.condition = threading.Condition()
+        self.threads = []
+        self.file = None
+        self.dirty = False
+        self.finished_in_journal = 0
+        self.compact_due = False
+        # Frames logged while a compaction writes the new journal, carried over into it
+        self.compact_tail = None
+        if path:
+            self._recover()
+            self.file = open(path, 'ab')
+            threading.Thread(target=self._flush_loop, name='outbox-flusher', daemon=True).start()
+            if self.pending:
+                with self.condition:
+                    self._start_workers()
+
+    def __len__(self):
+        """Messages waiting to be delivered (including retries)"""
+        return len(self.pending)
+
+    # ---------- Enqueueing ----------
+
+    def enqueue(self, channel, message, dedup_key=None, send_after=None):
+        """Queue one message; returns its outbox ID, or None if it duplicates a recent message"""
+        return self.enqueue_many([dict(message, channel=channel, dedup_key=dedup_key, send_after=send_after)])[0]
+
+    def enqueue_many(self, messages):
+        """
+        Queue message dicts carrying 'channel' and optionally 'dedup_key' and 'send_after'; never blocks on delivery
+        Returns one outbox ID per message, None for duplicates
+        """
+        now = time.time()
+        ids = []
+        with self.condition:
+            self._expire_keys(now)
+            for message in messages:
+                channel = self.channels.get(message['channel'])
+                if channel is None:
+                    raise ValueError(f"Unknown notification channel: {message['channel']}")
+                key = message.get('dedup_key')
+                if key is not None and (key in self.pending_keys or key in self.recent_keys):
+                    self.stats['duplicates'] += 1
+                    ids.append(None)
+                    continue
+                record = dict(message, id=self.next_id, created_at=now, attempts=0)
+                record['send_after'] = record.get('send_after') or now
+                record['next_attempt'] = record['send_after']
+                self.next_id += 1
+                self._add(record)
+                self._log('enqueue', record)
+                ids.append(record['id'])
+            accepted = len(ids) - ids.count(None)
+            self.stats['enqueued'] += accepted
+            if accepted:
+                self._start_workers()
+                self.condition.notify(min(accepted, self.workers))
+        return ids
+
+    def _add(self, record):
+        self.pending[record['id']] = record
+        if record.get('dedup_key') is not None:
+            self.pending_keys[record['dedup_key']] = record['id']
+        heapq.heappush(self.channels[record['channel']].schedule, (record['next_attempt'], record['id']))
+
+    def _remember_key(self, key, when):
+        if key is not None:
+            self.recent_keys[key] = when
+            self.recent_keys.move_to_end(key)
+
+    def _expire_keys(self, now):
+        while self.recent_keys:
+            key, when = next(iter(self.recent_keys.items()))
+            if now - when < self.dedup_seconds:
+                break
+            del self.recent_keys[key]
+
+    # ---------- Delivery ----------
+
+    def _start_workers(self):
+        while len(self.threads) < self.workers:
+            worker = threading.Thread(target=self._run, name=f'outbox-worker-{len(self.threads)}', daemon=True)
+            self.threads.append(worker)
+            worker.start()
+
+    def _next_batch(self):
+        """Block until some channel has due messages and rate-limit tokens, then pop a batch from it"""
+        with self.condition:
+            while True:
+                now = time.time()
+                wait = None
+                for channel in self.channels.values():
+                    schedule = channel.schedule
+                    if not schedule:
+                        continue
+                    delay = schedule[0][0] - now
+                    if delay <= 0:
+                        # Wait for a full batch worth of tokens, so sustained load still goes out in batches
+                        wanted = min(self.batch_size, len(schedule))
+                        delay = channel.limiter.wait_time(wanted)
+                        if delay <= 0:
+                            batch = []
+                            while schedule and len(batch) < wanted and schedule[0][0] <= now:
+                                batch.append(self.pending[heapq.heappop(schedule)[1]])
+                            channel.limiter.take(len(batch))
+                            self.in_flight += len(batch)
+                            return channel, batch
+                    wait = delay if wait is None else min(wait, delay)
+                self.condition.wait(wait)
+
+    def _run(self):
+        while True:
+            channel, batch = self._next_batch()
+            try:
+                results = channel.backend.send_batch(batch)
+            except Exception as e:
+                print(f"[notify] {channel.backend.name}: batch of {len(batch)} failed: {e}")
+                results = [False] * len(batch)
+            if results is None:
+                results = [True] * len(batch)
+            finished = self._settle(channel, batch, results)
+            if self.on_result:
+                for record, delivered in finished:
+                    self.on_result(record, delivered)
+            with self.condition:
+                self.in_flight -= len(batch)
+                self.condition.notify_all()
+
+    def _retry_delay(self, attempts):
+        delay = min(self.retry_max_seconds, self.retry_base_seconds * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _settle(self, channel, batch, results):
+        """Record a batch's results: finish delivered and dead messages, reschedule the rest"""
+        now = time.time()
+        finished = []
+        with self.condition:
+            for record, delivered in zip(batch, results):
+                record['attempts'] += 1
+                if delivered or record['attempts'] >= self.max_attempts:
+                    self._finish(record, now, delivered)
+                    finished.append((record, delivered))
+                    continue
+                record['next_attempt'] = now + self._retry_delay(record['attempts'])
+                heapq.heappush(channel.schedule, (record['next_attempt'], record['id']))
+                self.stats['retried'] += 1
+                self._log('retry', record['id'], record['attempts'], record['next_attempt'])
+        return finished
+
+    def _finish(self, record, now, delivered):
+        del self.pending[record['id']]
+        key = record.get('dedup_key')
+        if key is not None:
+            self.pending_keys.pop(key, None)
+            if delivered:
+                self._remember_key(key, now)
+        if delivered:
+            self.stats['delivered'] += 1
+            self.lags.append(now - record['send_after'])
+        else:
+            self.stats['dead'] += 1
+            print(f"[notify] {record['channel']}: giving up on message {record['id']} "
+                  f"after {record['attempts']} attempts")
+        self._log('done', record['id'], key, now, delivered)
+        self.finished_in_journal += 1
+
+    def wait_idle(self, timeout=None):
+        """Block until nothing is pending or in flight (for scripts and benchmarks); True if idle"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while self.pending or self.in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return True
+
+    # ---------- Metrics ----------
+
+    def metrics(self):
+        """Queue depth per channel, delivery lag percentiles and lifetime counters"""
+        now = time.time()
+        with self.condition:
+            channels = {}
+            oldest_due = None
+            for name, channel in self.channels.items():
+                due = sum(1 for when, _ in channel.schedule if when <= now)
+                channels[name] = {
+                    'queued': len(channel.schedule),
+                    'due': due,
+                    'rate_per_second': channel.limiter.rate
+                }
+                if channel.schedule and channel.schedule[0][0] <= now:
+                    oldest_due = min(oldest_due or now, channel.schedule[0][0])
+            lags = sorted(self.lags)
+            return {
+                'queue_depth': len(self.pending),
+                'in_flight': self.in_flight,
+                'channels': channels,
+                'oldest_due_seconds': round(now - oldest_due, 3) if oldest_due else 0.0,
+                'delivery_lag_seconds': {
+                    'samples': len(lags),
+                    'p50': round(percentile(lags, 0.5), 3) if lags else None,
+                    'p99': round(percentile(lags, 0.99), 3) if lags else None,
+                    'max': round(lags[-1], 3) if lags else None
+                },
+                **self.stats,
+                'durable': self.path is not None
+            }
+
+    # ---------- Journal ----------
+
+    def _log(self, *op):
+        """Append one journal operation; called with the condition held"""
+        if self.file is None:
+            return
+        frame = msgpack.packb(op, use_bin_type=True)
+        self.file.write(frame)
+        self.dirty = True
+        if self.compact_tail is not None:
+            self.compact_tail.append(frame)
+        elif self.finished_in_journal >= self.compact_every and self.finished_in_journal > len(self.pending):
+            self.compact_due = True
+
+    def _recover(self):
+        """Rebuild pending messages and recent dedup keys from the journal, truncating a torn final frame"""
+        if not os.path.exists(self.path):
+            return
+        good_offset = 0
+        with open(self.path, 'rb') as f:
+            unpacker = msgpack.Unpacker(f, raw=False, strict_map_key=False)
+            try:
+                for op in unpacker:
+                    self._replay(op)
+                    good_offset = unpacker.tell()
+            except (msgpack.OutOfData, ValueError, msgpack.ExtraData):
+                pass
+        if good_offset < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(good_offset)
+        for record in self.pending.values():
+            self._add(record)
+        self._expire_keys(time.time())
+        if self.pending:
+            print(f"[notify] Outbox recovered {len(self.pending)} pending messages from {self.path}")
+
+    def _replay(self, op):
+        kind = op[0]
+        if kind == 'enqueue':
+            record = op[1]
+            if record['channel'] in self.channels:
+                self.pending[record['id']] = record
+            self.next_id = max(self.next_id, record['id'] + 1)
+        elif kind == 'retry':
+            record = self.pending.get(op[1])
+            if record is not None:
+                record['attempts'], record['next_attempt'] = op[2], op[3]
+        elif kind == 'done':
+            _, message_id, key, when, delivered = op
+            self.pending.pop(message_id, None)
+            if delivered:
+                self._remember_key(key, when)
+        elif kind == 'seen':
+            self._remember_key(op[1], op[2])
+
+    def _compact(self):
+        """
+        Rewrite the journal with only pending messages and recent dedup keys (on the flusher thread)
+        The live entries are copied under the lock, then written and fsynced outside it; frames logged
+        meanwhile are appended to the new file when it is swapped in, the only step that holds the lock
+        """
+        temp_path = self.path + '.tmp'
+        with self.condition:
+            self.compact_due = False
+            recent_keys = list(self.recent_keys.items())
+            pending = [dict(record) for record in self.pending.values()]
+            compacted = self.finished_in_journal
+            self.compact_tail = []
+        try:
+            with open(temp_path, 'wb') as f:
+                for key, when in recent_keys:
+                    f.write(msgpack.packb(('seen', key, when), use_bin_type=True))
+                for record in pending:
+                    f.write(msgpack.packb(('enqueue', record), use_bin_type=True))
+                f.flush()
+                os.fsync(f.fileno())
+                with self.condition:
+                    f.write(b''.join(self.compact_tail))
+                    f.close()
+                    os.replace(temp_path, self.path)
+                    self.file.close()
+                    self.file = open(self.path, 'ab')
+                    self.finished_in_journal -= compacted
+                    # the carried-over frames were only flushed; the next sync() fsyncs them
+                    self.dirty = True
+        except OSError as e:
+            print(f"[notify] Outbox journal compaction failed, keeping the old journal: {e}")
+        finally:
+            with self.condition:
+                self.compact_tail = None
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.fsync_interval)
+            self.sync()
+            if self.compact_due:
+                self._compact()
+                self.sync()
+
+    def sync(self):
+        """Flush buffered journal frames and fsync them"""
+        with self.condition:
+            if not self.dirty or self.file is None:
+                return
+            self.file.flush()
+            fd = self.file.fileno()
+            self.dirty = False
+        try:
+            os.fsync(fd)
+        except OSError:
+            # Compaction swapped the file in the meantime and fsynced the new one itself
+            pass
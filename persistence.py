@@ -0,0 +1,305 @@
+"""
+HemaLink - Write-ahead log and snapshots for the in-memory stores
+
+Every mutation is appended to a write-ahead log as a msgpack frame and
+fsynced in batches by a background thread (group commit). Every
+`snapshot_every` operations the log is rotated and a background thread
+writes the stores to a compact msgpack snapshot. Startup loads the
+latest snapshot and replays the log tail.
+
+Log operations (all idempotent, so replaying an op already captured by a
+snapshot is harmless, and a snapshot may include writes made after its
+rotation):
+    ('put', store, key, record)            store[key] = record
+    ('append', store, index, record)       list store; set position `index`
+    ('inventory_units', blood_group, units)
+    ('inventory_donor', blood_group, index, donor_id)
+    ('transaction', sequence, timestamp, blood_group, type, units, details)
+
+Snapshot-only stores (the transaction log) are objects with to_state();
+their snapshot copy is recovered as is, and 'transaction' ops from the
+log tail are collected into the 'inventory_transactions' list for the
+application to append on top, skipping sequence numbers the snapshot
+already covers. Older logs wrote transactions as 'append' ops of dicts
+to that same list.
+"""
+import glob
+import os
+import threading
+import time
+
+import msgpack
+
+SNAPSHOT_FILE = 'snapshot.msgpack'
+WAL_PATTERN = 'wal-%08d.log'
+
+# Stores held in dicts keyed by ID, and stores held in lists
+DICT_STORES = ['donors', 'requestors', 'blood_requests', 'donations', 'donation_fulfillments', 'inventory']
+LIST_STORES = ['inventory_transactions']
+# Stores snapshotted through their to_state() method, and never written by log operations
+STATE_STORES = ['transaction_log']
+
+
+def empty_state():
+    """Get an empty set of stores"""
+    state = {name: {} for name in DICT_STORES}
+    state.update({name: [] for name in LIST_STORES})
+    state.update({name: None for name in STATE_STORES})
+    return state
+
+
+def collect_stores(stores):
+    """Copy live stores into their snapshot form"""
+    collected = {}
+    for name, store in stores.items():
+        if name in STATE_STORES:
+            collected[name] = store.to_state()
+        else:
+            collected[name] = list(store) if name in LIST_STORES else dict(store)
+    return collected
+
+
+def pack_stores(collected):
+    """
+    msgpack.packb() of collect_stores() output, packed one record at a time
+    Slower than one packb() call, but lets other threads take the GIL between records
+    """
+    packer = msgpack.Packer(use_bin_type=True)
+    parts = [packer.pack_map_header(len(collected))]
+    for name, store in collected.items():
+        parts.append(packer.pack(name))
+        if isinstance(store, dict) and name not in STATE_STORES:
+            parts.append(packer.pack_map_header(len(store)))
+            for key, record in store.items():
+                parts.append(packer.pack(key))
+                parts.append(packer.pack(record))
+        elif isinstance(store, list):
+            parts.append(packer.pack_array_header(len(store)))
+            parts.extend(packer.pack(record) for record in store)
+        else:
+            parts.append(packer.pack(store))
+    return b''.join(parts)
+
+
+def apply_op(state, op):
+    """Apply one log operation to a set of stores"""
+    kind = op[0]
+    if kind == 'put':
+        _, store, key, record = op
+        state[store][key] = record
+    elif kind == 'append':
+        _, store, index, record = op
+        records = state[store]
+        if index == len(records):
+            records.append(record)
+        elif index < len(records):
+            records[index] = record
+    elif kind == 'inventory_units':
+        _, blood_group, units = op
+        state['inventory'].setdefault(blood_group, {'units': 0, 'donors': []})['units'] = units
+    elif kind == 'inventory_donor':
+        _, blood_group, index, donor_id = op
+        donors = state['inventory'].setdefault(blood_group, {'units': 0, 'donors': []})['donors']
+        if index == len(donors):
+            donors.append(donor_id)
+    elif kind == 'transaction':
+        state['inventory_transactions'].append(list(op[1:]))
+
+
+class WriteAheadLog:
+    """Append-only mutation log with batched fsync and periodic snapshots"""
+
+    def __init__(self, data_dir, fsync_interval=0.05, snapshot_every=100000):
+        self.data_dir = data_dir
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+        self.stores = None
+        self.generation = 0
+        self.ops_since_snapshot = 0
+        self.file = None
+        self.dirty = False
+        self.lock = threading.Lock()
+        # Serializes snapshot writes; a snapshot older than the one on disk is dropped
+        self.snapshot_lock = threading.Lock()
+        self.snapshot_generation = 0
+        self.snapshot_thread = None
+        self.closed = threading.Event()
+        os.makedirs(data_dir, exist_ok=True)
+
+    def _wal_path(self, generation):
+        return os.path.join(self.data_dir, WAL_PATTERN % generation)
+
+    def _wal_generations(self):
+        paths = glob.glob(os.path.join(self.data_dir, 'wal-*.log'))
+        return sorted(int(os.path.basename(p)[4:-4]) for p in paths)
+
+    # ---------- Recovery ----------
+
+    def recover(self):
+        """
+        Load the latest snapshot and replay the log tail
+        Returns (state, report), or (None, report) if there is nothing to recover
+        """
+        started = time.perf_counter()
+        snapshot_path = os.path.join(self.data_dir, SNAPSHOT_FILE)
+        generations = self._wal_generations()
+        report = {'snapshot_records': 0, 'replayed_ops': 0, 'torn_bytes': 0}
+
+        if not os.path.exists(snapshot_path) and not generations:
+            return None, report
+
+        state = empty_state()
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, 'rb') as f:
+                snapshot = msgpack.unpackb(f.read(), raw=False, strict_map_key=False)
+            state.update(snapshot['stores'])
+            self.generation = self.snapshot_generation = snapshot['wal_generation']
+            report['snapshot_records'] = sum(len(v) for name, v in snapshot['stores'].items()
+                                             if name not in STATE_STORES)
+        snapshot_loaded = time.perf_counter()
+
+        for generation in generations:
+            if generation < self.generation:
+                continue
+            replayed, torn_bytes = self._replay(self._wal_path(generation), state)
+            report['replayed_ops'] += replayed
+            report['torn_bytes'] += torn_bytes
+            self.generation = generation
+
+        report['snapshot_seconds'] = round(snapshot_loaded - started, 3)
+        report['replay_seconds'] = round(time.perf_counter() - snapshot_loaded, 3)
+        report['total_seconds'] = round(time.perf_counter() - started, 3)
+        self.ops_since_snapshot = report['replayed_ops']
+        return state, report
+
+    def _replay(self, path, state):
+        """Replay one log file, truncating a torn final frame left by a crash"""
+        replayed = 0
+        good_offset = 0
+        with open(path, 'rb') as f:
+            unpacker = msgpack.Unpacker(f, raw=False, strict_map_key=False, use_list=True)
+            try:
+                for op in unpacker:
+                    apply_op(state, op)
+                    replayed += 1
+                    good_offset = unpacker.tell()
+            except (msgpack.OutOfData, ValueError, msgpack.ExtraData):
+                pass
+        size = os.path.getsize(path)
+        if good_offset < size:
+            with open(path, 'r+b') as f:
+                f.truncate(good_offset)
+        return replayed, size - good_offset
+
+    # ---------- Logging ----------
+
+    def open(self, stores):
+        """Attach the live stores and start appending to the log"""
+        self.stores = stores
+        self.file = open(self._wal_path(self.generation), 'ab')
+        threading.Thread(target=self._flush_loop, name='wal-flusher', daemon=True).start()
+
+    def append(self, *op):
+        """Append one operation; a no-op until open() is called"""
+        if self.file is None:
+            return
+        frame = msgpack.packb(op, use_bin_type=True)
+        with self.lock:
+            self.file.write(frame)
+            self.dirty = True
+            self.ops_since_snapshot += 1
+            snapshot_due = self.stores is not None and self.ops_since_snapshot >= self.snapshot_every
+            if snapshot_due:
+                generation = self._rotate()
+        if snapshot_due:
+            # Collecting and packing the stores takes long enough to stall every writer; do it off the lock
+            self.snapshot_thread = threading.Thread(target=self._snapshot_stores, args=(generation,),
+                                                    name='wal-snapshot', daemon=True)
+            self.snapshot_thread.start()
+
+    def append_frames(self, frames):
+        """Append operations already packed as msgpack frames; a no-op until open() is called"""
+        if self.file is None or not frames:
+            return
+        with self.lock:
+            self.file.write(b''.join(frames))
+            self.dirty = True
+            self.ops_since_snapshot += len(frames)
+
+    def _flush_loop(self):
+        while not self.closed.wait(self.fsync_interval):
+            self.sync()
+
+    def sync(self):
+        """Flush buffered frames and fsync the log"""
+        with self.lock:
+            if not self.dirty or self.file is None:
+                return
+            self.file.flush()
+            fd = self.file.fileno()
+            self.dirty = False
+        os.fsync(fd)
+
+    # ---------- Snapshots ----------
+
+    def rotate(self):
+        """
+        Start the next log generation and return it
+        A snapshot of the stores as of this moment covers every log file before it
+        """
+        with self.lock:
+            return self._rotate()
+
+    def _rotate(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        self.generation += 1
+        self.file = open(self._wal_path(self.generation), 'ab')
+        self.dirty = False
+        self.ops_since_snapshot = 0
+        return self.generation
+
+    def snapshot(self):
+        """Write all stores to a new snapshot and rotate the log"""
+        with self.lock:
+            if self.stores is None:
+                return
+            generation = self._rotate()
+            stores = msgpack.packb(collect_stores(self.stores), use_bin_type=True)
+        self.write_snapshot(stores, generation)
+
+    def _snapshot_stores(self, generation):
+        """Snapshot the live stores for a rotation to `generation`, without holding the log lock"""
+        self.write_snapshot(pack_stores(collect_stores(self.stores)), generation)
+
+    def write_snapshot(self, stores, generation):
+        """
+        Write msgpack-packed stores (see collect_stores) as the snapshot taken when `generation`
+        started (see rotate), then delete the log files it covers
+        """
+        # {'wal_generation': generation, 'stores': ...} with the packed stores spliced in as is
+        data = b'\x82' + b''.join(msgpack.packb(value, use_bin_type=True)
+                                  for value in ('wal_generation', generation, 'stores')) + stores
+        path = os.path.join(self.data_dir, SNAPSHOT_FILE)
+        with self.snapshot_lock:
+            if generation <= self.snapshot_generation:
+                return
+            with open(path + '.tmp', 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + '.tmp', path)
+            self.snapshot_generation = generation
+
+            for old in self._wal_generations():
+                if old < generation:
+                    os.remove(self._wal_path(old))
+
+    def close(self):
+        """Stop the flusher, fsync anything outstanding and wait for a snapshot in progress"""
+        self.closed.set()
+        self.sync()
+        if self.snapshot_thread is not None:
+            self.snapshot_thread.join()
+
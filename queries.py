@@ -0,0 +1,69 @@
+"""
+HemaLink - Matching and dashboard queries shared by both apps
+
+Blood request matching and the admin dashboard's paged sections are
+written once here against storage.Repository: aws_app.py passes its
+configured backend, app.py the AppRepository over its in-process
+stores. The work underneath is done by Repository hot paths each
+backend may override (rank_donors() and dashboard_page()), so app.py
+still ranks donors with its vectorized columns and geo grids and pages
+off its pre-sorted indexes, while the other backends use the defaults.
+"""
+from blood_rules import BLOOD_COMPATIBILITY, today_ordinal
+
+# Donors returned by a match, best first
+MATCH_LIMIT = 10
+
+# Admin dashboard sections: (template name, store, page parameter, filter field, filter parameter)
+DASHBOARD_SECTIONS = [
+    ('donors', 'donors', 'donors_page', 'blood_group', 'donors_blood_group'),
+    ('requests', 'blood_requests', 'requests_page', 'status', 'requests_status'),
+    ('donations', 'donations', 'donations_page', 'blood_group', 'donations_blood_group')
+]
+
+# Request statuses the dashboard filters by
+DASHBOARD_REQUEST_STATUSES = ['pending', 'partial', 'fulfilled']
+
+
+def match_result(repository, request_data, donors, total_compatible):
+    """Match result for ranked donors: units in stock, the donors, and whether the request can be met"""
+    inventory = repository.get('inventory', request_data['blood_group'])
+    units = int(inventory.get('units', 0)) if inventory else 0
+    return {
+        'exact_match_inventory': units,
+        'compatible_donors': donors,
+        'total_compatible': total_compatible,
+        'fulfillable': units >= int(request_data.get('units_needed', 1)) or total_compatible > 0
+    }
+
+
+def match_blood_request(repository, request_data, point=None, radius_km=None, k=None, default_radius_km=None,
+                        locate=None):
+    """
+    Score compatible donors for a request and keep the best MATCH_LIMIT
+    Requests placed at `point` search within `radius_km` (default `default_radius_km`); with `k`, the
+    k nearest placed donors come back, nearest first. `locate(pincode)` places donors for backends
+    without a spatial index of their own
+    """
+    if point is not None and k is None:
+        radius_km = radius_km or default_radius_km
+    donors, total_compatible = repository.rank_donors(request_data, today_ordinal(), point, radius_km, k,
+                                                      MATCH_LIMIT, locate)
+    return match_result(repository, request_data, donors, total_compatible)
+
+
+def dashboard_pages(repository, args, page_size):
+    """Template context of the admin dashboard's paged sections, filtered and paged as the query `args` ask"""
+    context = {
+        'filters': {},
+        'blood_groups': list(BLOOD_COMPATIBILITY),
+        'request_statuses': DASHBOARD_REQUEST_STATUSES
+    }
+    for name, store, page_param, field, filter_param in DASHBOARD_SECTIONS:
+        value = args.get(filter_param, '')
+        items, page_info = repository.dashboard_page(store, args.get(page_param) or None, page_size,
+                                                     field if value else None, value or None)
+        context[name] = items
+        context[page_param] = page_info
+        context['filters'][filter_param] = value
+    return context
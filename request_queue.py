@@ -0,0 +1,151 @@
+"""
+HemaLink - Priority queue of open blood requests
+
+A binary heap (heapq) of (priority key, sequence, item id) entries.
+Changing an item's priority pushes a fresh entry and marks the old one stale instead
+of searching the heap for it, so updates, removals and "most critical
+item" are all O(log n). Stale entries are dropped as they surface at the
+top, and the heap is rebuilt when they outnumber the live ones.
+
+top(k) reads the k best items without popping them by walking the heap
+in priority order from the root (each step only looks at two children),
+which costs O(k log k) however large the queue is.
+
+RequestFeed keeps one such queue per bucket (e.g. blood group, or blood
+group and city) and files each item under several buckets at once, so
+a reader merges the heads of a fixed set of queues instead of scanning
+every item.
+"""
+import heapq
+import itertools
+import threading
+
+
+class PriorityQueue:
+    """Min-heap of item IDs by priority key, with in-place priority updates"""
+
+    def __init__(self):
+        self.heap = []
+        self.entry_of = {}
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entry_of)
+
+    def __contains__(self, item_id):
+        return item_id in self.entry_of
+
+    def key(self, item_id):
+        """Get an item's current priority key, or None if absent"""
+        entry = self.entry_of.get(item_id)
+        return entry[0] if entry else None
+
+    def update(self, item_id, key):
+        """Add an item, or change its priority key"""
+        with self.lock:
+            entry = self.entry_of.get(item_id)
+            if entry is not None and entry[0] == key:
+                return
+            entry = (key, next(self.counter), item_id)
+            self.entry_of[item_id] = entry
+            heapq.heappush(self.heap, entry)
+            self._compact()
+
+    def remove(self, item_id):
+        """Drop an item (no-op if absent)"""
+        with self.lock:
+            if self.entry_of.pop(item_id, None) is not None:
+                self._compact()
+
+    def _is_live(self, entry):
+        return self.entry_of.get(entry[2]) is entry
+
+    def _compact(self):
+        """Drop stale entries from the top, and rebuild once most entries are stale"""
+        while self.heap and not self._is_live(self.heap[0]):
+            heapq.heappop(self.heap)
+        if len(self.heap) > 2 * len(self.entry_of) + 64:
+            self.heap = list(self.entry_of.values())
+            heapq.heapify(self.heap)
+
+    def peek(self):
+        """Get the (key, item_id) with the smallest key, or None if empty"""
+        with self.lock:
+            if not self.heap:
+                return None
+            key, _, item_id = self.heap[0]
+            return key, item_id
+
+    def pop(self):
+        """Remove and return the (key, item_id) with the smallest key, or None if empty"""
+        with self.lock:
+            if not self.heap:
+                return None
+            key, _, item_id = heapq.heappop(self.heap)
+            del self.entry_of[item_id]
+            self._compact()
+            return key, item_id
+
+    def top(self, k):
+        """Get the k (key, item_id) entries with the smallest keys, in order, without removing them"""
+        with self.lock:
+            heap = self.heap
+            result = []
+            frontier = [(heap[0], 0)] if heap else []
+            while frontier and len(result) < k:
+                entry, index = heapq.heappop(frontier)
+                if self._is_live(entry):
+                    result.append((entry[0], entry[2]))
+                for child in (2 * index + 1, 2 * index + 2):
+                    if child < len(heap):
+                        heapq.heappush(frontier, (heap[child], child))
+            return result
+
+
+class RequestFeed:
+    """Items filed under several buckets at once, each bucket a PriorityQueue"""
+
+    def __init__(self):
+        self.queues = {}
+        self.buckets_of = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.buckets_of)
+
+    def __contains__(self, item_id):
+        return item_id in self.buckets_of
+
+    def update(self, item_id, key, buckets):
+        """Add an item, or change its key and buckets"""
+        buckets = tuple(dict.fromkeys(buckets))
+        with self.lock:
+            old = self.buckets_of.get(item_id, ())
+            for bucket in old:
+                if bucket not in buckets:
+                    self._remove_from(bucket, item_id)
+            for bucket in buckets:
+                queue = self.queues.get(bucket)
+                if queue is None:
+                    queue = self.queues[bucket] = PriorityQueue()
+                queue.update(item_id, key)
+            self.buckets_of[item_id] = buckets
+
+    def remove(self, item_id):
+        """Drop an item from every bucket (no-op if absent)"""
+        with self.lock:
+            for bucket in self.buckets_of.pop(item_id, ()):
+                self._remove_from(bucket, item_id)
+
+    def _remove_from(self, bucket, item_id):
+        queue = self.queues.get(bucket)
+        if queue is not None:
+            queue.remove(item_id)
+            if not len(queue):
+                del self.queues[bucket]
+
+    def top(self, bucket, k):
+        """Get the k (key, item_id) entries of one bucket with the smallest keys, in order"""
+        queue = self.queues.get(bucket)
+        return queue.top(k) if queue is not None else []
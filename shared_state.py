@@ -0,0 +1,508 @@
+"""
+HemaLink - Shared state for running several worker processes
+
+Without it every process keeps its own copy of the stores in app.py, so
+gunicorn workers would each serve their own diverging data. With
+HEMALINK_SHARED_STATE set to a socket path, workers share one dataset
+through a small store process listening on that Unix socket:
+
+    python shared_state.py --socket /tmp/hemalink.sock --data-dir data
+    HEMALINK_SHARED_STATE=/tmp/hemalink.sock gunicorn -w 8 app:app
+
+The store process keeps the ordered log of mutations (the same operations
+the write-ahead log records, see persistence.py) and the latest snapshot
+of the stores. Each worker holds a full replica with all of its indexes,
+so reads never leave the process and read-heavy routes scale with the
+number of cores. Writes are serialized: a route that writes takes the
+write lease (see app.writes_shared_state), catches up with the log, runs,
+then commits the operations it recorded and hands the lease on in one
+message. Every worker applies every write in the same order.
+
+The store process never blocks on a worker: replies are queued per
+connection and sent as each worker reads them, and snapshots are packed
+by a worker after it has handed the lease on and written to disk on a
+thread of their own.
+
+The log length is published in a memory-mapped file next to the socket
+(`<socket>.seq`), so checking for other workers' writes before a read is
+a memory load, not a round trip. A follower thread in each worker also
+catches up every `follow_interval` seconds, so idle workers and open
+statistics streams stay current.
+
+Wire protocol: every message is a 4-byte big-endian length followed by a
+msgpack body. Requests are [command, args...] and replies are maps;
+operations travel as concatenated msgpack frames, byte for byte as they
+are written to the log.
+    ['join']                          wait for the lease; base snapshot and the log after it
+    ['lease', since]                  wait for the lease; the log after `since`
+    ['poll', since]                   the log after `since`
+    ['commit', frames, release]       append frames (lease holder only), optionally releasing the lease;
+                                      the reply can ask for a snapshot as of the new position
+    ['snapshot', sequence, stores]    the requested snapshot, sent on a connection of its own
+    ['stats']                         counters
+Log replies are {'sequence': end, 'start': since, 'ops': frames}.
+
+With --data-dir the store process also writes the log through
+persistence.WriteAheadLog, so the dataset survives a restart of the
+store process; workers then run without HEMALINK_DATA_DIR. Workers must
+be restarted along with the store process, and must not be forked from
+a preloaded app (gunicorn --preload), since each joins on import.
+"""
+import mmap
+import os
+import selectors
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import msgpack
+
+from persistence import WriteAheadLog, empty_state
+
+HEADER = struct.Struct('>I')
+SEQUENCE = struct.Struct('<Q')
+
+
+def send_message(sock, message):
+    """Send one length-prefixed msgpack message"""
+    body = msgpack.packb(message, use_bin_type=True)
+    sock.sendall(HEADER.pack(len(body)) + body)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError('shared-state store closed the connection')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_message(sock):
+    """Receive one length-prefixed msgpack message"""
+    size, = HEADER.unpack(_recv_exactly(sock, HEADER.size))
+    return msgpack.unpackb(_recv_exactly(sock, size), raw=False, strict_map_key=False)
+
+
+# ---------- Store process ----------
+
+class _Peer:
+    """One worker connection on the store process"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = b''
+        self.outgoing = bytearray()
+        self.sent = 0
+        self.events = selectors.EVENT_READ
+        self.sequence = None
+
+
+class StateServer:
+    """Store process: the ordered operation log, the base snapshot and the write lease"""
+
+    def __init__(self, path, data_dir=None, snapshot_every=100000, fsync_interval=0.05):
+        self.path = path
+        self.snapshot_every = snapshot_every
+        self.frames = []
+        self.log_start = 0
+        self.base = None
+        self.base_sequence = 0
+        self.snapshot_sequence = None
+        self.snapshot_generation = None
+        self.holder = None
+        self.waiting = deque()
+        self.peers = {}
+        self.counters = {'commits': 0, 'ops': 0, 'polls': 0, 'leases': 0, 'snapshots': 0}
+        self.selector = selectors.DefaultSelector()
+
+        self.wal = WriteAheadLog(data_dir, fsync_interval=fsync_interval) if data_dir else None
+        if self.wal:
+            state, report = self.wal.recover()
+            if state is not None:
+                self.base = msgpack.packb(state, use_bin_type=True)
+                print(f"[shared-state] Recovered {report['snapshot_records']} snapshot records and "
+                      f"replayed {report['replayed_ops']} log ops in {report['total_seconds']} s")
+            self.wal.open(None)
+
+        with open(path + '.seq', 'w+b') as f:
+            f.truncate(SEQUENCE.size)
+            self.published = mmap.mmap(f.fileno(), SEQUENCE.size)
+        self._publish()
+
+    @property
+    def sequence(self):
+        return self.log_start + len(self.frames)
+
+    def _publish(self):
+        SEQUENCE.pack_into(self.published, 0, self.sequence)
+
+    def _ops_after(self, since):
+        return {'sequence': self.sequence, 'start': since, 'ops': b''.join(self.frames[since - self.log_start:])}
+
+    # ---------- Event loop ----------
+
+    def serve_forever(self):
+        """Accept workers and answer their messages until interrupted"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        listener.listen(128)
+        self.selector.register(listener, selectors.EVENT_READ)
+        print(f"[shared-state] Listening on {self.path}")
+        try:
+            while True:
+                for key, events in self.selector.select():
+                    if key.fileobj is listener:
+                        sock, _ = listener.accept()
+                        sock.setblocking(False)
+                        self.peers[sock] = _Peer(sock)
+                        self.selector.register(sock, selectors.EVENT_READ)
+                        continue
+                    peer = self.peers.get(key.fileobj)
+                    if peer is not None and events & selectors.EVENT_WRITE:
+                        self._flush(peer)
+                    if peer is not None and events & selectors.EVENT_READ:
+                        self._read(peer)
+        finally:
+            listener.close()
+            os.remove(self.path)
+            if self.wal:
+                self.wal.close()
+
+    def _read(self, peer):
+        try:
+            data = peer.sock.recv(1 << 20)
+        except BlockingIOError:
+            return
+        except ConnectionError:
+            data = b''
+        if not data:
+            self._disconnect(peer)
+            return
+        peer.buffer += data
+        while len(peer.buffer) >= HEADER.size and peer.sock in self.peers:
+            size, = HEADER.unpack_from(peer.buffer)
+            if len(peer.buffer) < HEADER.size + size:
+                break
+            body = peer.buffer[HEADER.size:HEADER.size + size]
+            peer.buffer = peer.buffer[HEADER.size + size:]
+            self._handle(peer, msgpack.unpackb(body, raw=False, strict_map_key=False))
+
+    def _disconnect(self, peer):
+        if peer.sock not in self.peers:
+            return
+        self.selector.unregister(peer.sock)
+        peer.sock.close()
+        del self.peers[peer.sock]
+        self.waiting = deque(entry for entry in self.waiting if entry[0] is not peer)
+        if self.holder is peer:
+            # The worker died mid-request; its uncommitted ops died with it
+            self._release()
+
+    def _reply(self, peer, message):
+        """Queue a reply; it is sent as the worker reads it, so a slow worker never stalls the others"""
+        body = msgpack.packb(message, use_bin_type=True)
+        peer.outgoing += HEADER.pack(len(body))
+        peer.outgoing += body
+        self._flush(peer)
+
+    def _flush(self, peer):
+        if peer.sock not in self.peers:
+            return
+        try:
+            with memoryview(peer.outgoing) as pending:
+                peer.sent += peer.sock.send(pending[peer.sent:])
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._disconnect(peer)
+            return
+        if peer.sent == len(peer.outgoing):
+            peer.outgoing.clear()
+            peer.sent = 0
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if peer.outgoing else 0)
+        if events != peer.events:
+            self.selector.modify(peer.sock, events)
+            peer.events = events
+
+    # ---------- Commands ----------
+
+    def _handle(self, peer, message):
+        command, args = message[0], message[1:]
+        if command == 'poll':
+            self.counters['polls'] += 1
+            peer.sequence = args[0]
+            self._reply(peer, self._ops_after(args[0]))
+        elif command in ('join', 'lease'):
+            self.waiting.append((peer, command, args))
+            if self.holder is None:
+                self._grant()
+        elif command == 'commit':
+            self._commit(peer, *args)
+        elif command == 'snapshot':
+            self._snapshot(*args)
+            self._reply(peer, {'sequence': self.sequence})
+        elif command == 'stats':
+            self._reply(peer, dict(self.counters, sequence=self.sequence, workers=len(self.peers),
+                                   log_ops=len(self.frames), waiting=len(self.waiting),
+                                   cpu_seconds=time.process_time()))
+        else:
+            self._reply(peer, {'error': f"Unknown command: {command}"})
+
+    def _grant(self):
+        """Hand the write lease to the next waiting worker"""
+        while self.waiting and self.holder is None:
+            peer, command, args = self.waiting.popleft()
+            self.holder = peer
+            self.counters['leases'] += 1
+            if command == 'join':
+                reply = self._ops_after(self.base_sequence)
+                reply['stores'] = self.base
+            else:
+                reply = self._ops_after(args[0])
+            peer.sequence = reply['sequence']
+            self._reply(peer, reply)
+
+    def _release(self):
+        self.holder = None
+        self._grant()
+
+    def _commit(self, peer, frames, release):
+        if self.holder is not peer:
+            self._reply(peer, {'error': 'commit without holding the write lease'})
+            return
+        if frames:
+            self.frames.extend(frames)
+            self.counters['commits'] += 1
+            self.counters['ops'] += len(frames)
+            if self.wal:
+                self.wal.append_frames(frames)
+            self._publish()
+        peer.sequence = self.sequence
+        # Ask the committing worker for a snapshot as of this exact position, and start a new log
+        # file here so the snapshot covers every file before it. The worker builds and sends it
+        # after handing the lease on; a request that never arrives is re-issued later
+        snapshot_due = self.sequence - (self.snapshot_sequence or self.base_sequence) >= self.snapshot_every
+        if snapshot_due:
+            self.snapshot_sequence = self.sequence
+            self.snapshot_generation = self.wal.rotate() if self.wal else None
+        self._reply(peer, {'sequence': self.sequence, 'snapshot_due': snapshot_due})
+        if release:
+            self._release()
+
+    def _snapshot(self, sequence, stores):
+        """Replace the base snapshot and drop log entries no worker still needs"""
+        if sequence != self.snapshot_sequence:
+            return
+        self.counters['snapshots'] += 1
+        self.snapshot_sequence = None
+        self.base = stores
+        self.base_sequence = sequence
+        if self.wal:
+            threading.Thread(target=self.wal.write_snapshot, args=(stores, self.snapshot_generation),
+                             name='snapshot-writer', daemon=True).start()
+        needed = min([self.base_sequence] + [p.sequence for p in self.peers.values() if p.sequence is not None])
+        if needed > self.log_start:
+            del self.frames[:needed - self.log_start]
+            self.log_start = needed
+
+
+# ---------- Worker side ----------
+
+class SharedStateClient:
+    """A worker's connection to the store process; keeps the worker's stores a replica of the shared log"""
+
+    def __init__(self, path, follow_interval=0.05):
+        self.path = path
+        self.follow_interval = follow_interval
+        self.sequence = 0
+        self.pending = []
+        self.depth = 0
+        self.owner = None
+        self.apply_op = None
+        self.collect = None
+        self.published = None
+        self.writer = None
+        self.reader = None
+        self.lease_lock = threading.RLock()
+        self.apply_lock = threading.Lock()
+        self.reader_lock = threading.Lock()
+        self.local = threading.local()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        return sock
+
+    def _call(self, sock, *message):
+        send_message(sock, list(message))
+        reply = recv_message(sock)
+        if 'error' in reply:
+            raise RuntimeError(f"shared-state store: {reply['error']}")
+        return reply
+
+    @property
+    def replaying(self):
+        """True while this thread applies operations from the log"""
+        return getattr(self.local, 'replaying', False)
+
+    def _apply(self, reply):
+        """Apply a log reply's operations this replica has not seen yet; caller holds apply_lock"""
+        skip = self.sequence - reply['start']
+        unpacker = msgpack.Unpacker(raw=False, strict_map_key=False, use_list=True)
+        unpacker.feed(reply['ops'])
+        self.local.replaying = True
+        try:
+            for index, op in enumerate(unpacker):
+                if index >= skip:
+                    self.apply_op(op)
+        finally:
+            self.local.replaying = False
+        self.sequence = max(self.sequence, reply['sequence'])
+
+    # ---------- Joining ----------
+
+    def join(self, restore, apply_op, collect, seed):
+        """
+        Connect, load the shared dataset and start following the log
+        restore(state) loads a base snapshot, apply_op(op) applies one logged operation,
+        collect() returns the stores in snapshot form, and seed() fills an empty dataset
+        """
+        self.apply_op = apply_op
+        self.collect = collect
+        self.writer = self._connect()
+        self.reader = self._connect()
+        with open(self.path + '.seq', 'rb') as f:
+            self.published = mmap.mmap(f.fileno(), SEQUENCE.size, access=mmap.ACCESS_READ)
+
+        self.lease_lock.acquire()
+        self.depth, self.owner = 1, threading.get_ident()
+        try:
+            reply = self._call(self.writer, 'join')
+            with self.apply_lock:
+                if reply['stores'] is not None:
+                    state = empty_state()
+                    state.update(msgpack.unpackb(reply['stores'], raw=False, strict_map_key=False))
+                    self.local.replaying = True
+                    try:
+                        restore(state)
+                    finally:
+                        self.local.replaying = False
+                self.sequence = reply['start']
+                self._apply(reply)
+            if reply['stores'] is None and reply['sequence'] == 0:
+                seed()
+        finally:
+            self.release()
+
+        threading.Thread(target=self._follow_loop, name='shared-state-follower', daemon=True).start()
+
+    def _follow_loop(self):
+        while True:
+            time.sleep(self.follow_interval)
+            self.catch_up()
+
+    # ---------- Reads ----------
+
+    def published_sequence(self):
+        """Length of the shared log, read from shared memory"""
+        return SEQUENCE.unpack_from(self.published)[0]
+
+    def catch_up(self):
+        """Apply other workers' writes, if there are any; a memory read when there are none"""
+        if self.published_sequence() <= self.sequence:
+            return
+        with self.apply_lock:
+            if self.published_sequence() <= self.sequence:
+                return
+            with self.reader_lock:
+                reply = self._call(self.reader, 'poll', self.sequence)
+            self._apply(reply)
+
+    # ---------- Writes ----------
+
+    def acquire(self):
+        """Take the write lease (re-entrant within a thread) and catch up with the log"""
+        self.lease_lock.acquire()
+        self.depth += 1
+        if self.depth > 1:
+            return
+        self.owner = threading.get_ident()
+        reply = self._call(self.writer, 'lease', self.sequence)
+        with self.apply_lock:
+            self._apply(reply)
+
+    def release(self):
+        """Commit the operations recorded under the lease and hand the lease on"""
+        try:
+            self.depth -= 1
+            if self.depth:
+                return
+            self.owner = None
+            frames, self.pending = self.pending, []
+            with self.apply_lock:
+                reply = self._call(self.writer, 'commit', frames, True)
+                self.sequence = reply['sequence']
+                # Copy the stores before any later write can be applied; packing and sending
+                # the copy happens off the lease, on a thread of its own
+                stores = self.collect() if reply['snapshot_due'] else None
+        finally:
+            self.lease_lock.release()
+        if stores is not None:
+            threading.Thread(target=self._send_snapshot, args=(reply['sequence'], stores),
+                             name='shared-state-snapshot', daemon=True).start()
+
+    def _send_snapshot(self, sequence, stores):
+        sock = self._connect()
+        try:
+            self._call(sock, 'snapshot', sequence, msgpack.packb(stores, use_bin_type=True))
+        finally:
+            sock.close()
+
+    @contextmanager
+    def lease(self):
+        """Hold the write lease for a block of mutations"""
+        self.acquire()
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def record(self, op):
+        """Record one mutation; commits at once when the calling thread does not hold the lease"""
+        if self.replaying:
+            return
+        frame = msgpack.packb(op, use_bin_type=True)
+        if self.owner == threading.get_ident():
+            self.pending.append(frame)
+        else:
+            with self.lease():
+                self.pending.append(frame)
+
+    def stats(self):
+        """Counters from the store process"""
+        with self.reader_lock:
+            return self._call(self.reader, 'stats')
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run the shared-state store process for multi-worker deployments')
+    parser.add_argument('--socket', default=os.getenv('HEMALINK_SHARED_STATE', '/tmp/hemalink.sock'))
+    parser.add_argument('--data-dir', default=os.getenv('HEMALINK_DATA_DIR'),
+                        help='Keep the dataset in a write-ahead log here')
+    parser.add_argument('--snapshot-every', type=int, default=int(os.getenv('HEMALINK_SNAPSHOT_EVERY', '100000')),
+                        help='Operations between snapshots')
+    args = parser.parse_args()
+    try:
+        StateServer(args.socket, args.data_dir, args.snapshot_every).serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -217,9 +217,46 @@ function updateStatisticsDisplay(stats) {
     }
 }
 
-// Refresh statistics every 30 seconds if on dashboard
+// Update inventory units on page
+function updateInventoryDisplay(inventory) {
+    for (var bloodGroup in inventory) {
+        var element = document.getElementById('inventory-units-' + bloodGroup);
+        if (element) {
+            var units = inventory[bloodGroup];
+            element.textContent = units + ' units';
+            element.className = units < 20 ? 'text-danger fw-bold' : (units < 40 ? 'text-warning' : 'text-success');
+        }
+    }
+}
+
+// Live statistics stream (Server-Sent Events)
+function subscribeStatistics() {
+    var stats = {};
+    var source = new EventSource('/api/statistics/stream');
+
+    var applyStatistics = function(event) {
+        var data = JSON.parse(event.data);
+        for (var key in data) {
+            stats[key] = data[key];
+        }
+        updateStatisticsDisplay(stats);
+        if (data.inventory) {
+            updateInventoryDisplay(data.inventory);
+        }
+    };
+
+    source.addEventListener('snapshot', applyStatistics);
+    source.addEventListener('delta', applyStatistics);
+    return source;
+}
+
+// Live statistics on dashboard (fall back to polling every 30 seconds)
 if (window.location.pathname === '/dashboard') {
-    setInterval(fetchStatistics, 30000);
+    if (window.EventSource) {
+        subscribeStatistics();
+    } else {
+        setInterval(fetchStatistics, 30000);
+    }
 }
 
 // Confirm before critical actions
@@ -0,0 +1,843 @@
+"""
+HemaLink - Pluggable storage backends
+
+Repository is the storage interface both apps are written against.
+Items are dicts held in named stores (STORES), each keyed by one
+attribute. Implementations:
+
+    MemoryRepository    process-local dicts with hash indexes (development, demos, benchmarks)
+    SQLiteRepository    one SQLite file in WAL mode, indexed columns (single-node deployments)
+    DynamoDBRepository  one DynamoDB table per store, global secondary indexes as indexes
+    app.AppRepository   app.py's in-process stores, written through its indexes and write-ahead log
+
+aws_app.py picks one of the first three at startup with open_repository();
+CachedRepository wraps any of them in a read-through cache.
+
+Each backend declares the lookups it serves from an index in `indexes`
+({store: set of fields}); find() and page() use them when they can and
+filter a scan otherwise, so a query is written once and every backend
+answers it as cheaply as it can. Hot paths with a better plan than
+composing find() calls (find_donors() and rank_donors() for matching,
+count() and dashboard_page() for dashboards) are methods of their own
+that a backend may override; queries.py builds the matching and
+dashboard results of both apps on top of them.
+Counters and lists inside an item are changed with increment() and
+append(), which are atomic in every backend.
+
+Items are returned as stored: callers copy an item before changing it
+and write it back with put().
+"""
+import base64
+import json
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+
+import msgpack
+from sortedcontainers import SortedList
+
+from blood_rules import DEFAULT_COMPONENT, calculate_donor_eligibility, can_donate, compatible_donor_mask, groups_in
+from geo import haversine_km
+
+try:
+    import boto3
+    from boto3.dynamodb.conditions import Attr, Key
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+# Primary key attribute of each store
+STORES = {
+    'donors': 'donor_id',
+    'requestors': 'requestor_id',
+    'blood_requests': 'request_id',
+    'donations': 'donation_id',
+    'inventory': 'blood_group',
+    'inventory_transactions': 'transaction_id'
+}
+
+# Secondary lookups the application makes: {store: {field: sort key of newest-first pages, or None}}
+QUERIES = {
+    'donors': {'blood_group': None, 'city': None},
+    'blood_requests': {'requestor_id': None, 'status': 'created_at'},
+    'donations': {'donor_id': None, 'blood_group': 'donation_date'},
+    'inventory_transactions': {'blood_group': 'created_at'}
+}
+
+# Sort key of unfiltered newest-first pages
+PAGE_ORDER = {'blood_requests': 'created_at', 'donations': 'donation_date', 'inventory_transactions': 'created_at'}
+
+# Partition key of the sparse GSIs DynamoDB reads unfiltered pages from: every item of a PAGE_ORDER store
+# carries the same value, so one descending query returns the store in sort-key order
+PAGE_PARTITION_KEY = 'page_partition'
+PAGE_PARTITION = 'all'
+
+# Every attribute pages are ordered by
+SORT_KEYS = set(PAGE_ORDER.values()) | {key for fields in QUERIES.values() for key in fields.values() if key}
+
+# SQLite indexes per store, as column tuples; every column named here is also kept outside the encoded item
+SQLITE_INDEXES = {
+    'donors': [('blood_group', 'status', 'available'), ('status',), ('available',), ('city',), ('created_at',)],
+    'requestors': [('created_at',)],
+    'blood_requests': [('requestor_id',), ('status', 'created_at'), ('blood_group',), ('created_at',)],
+    'donations': [('donor_id',), ('blood_group', 'donation_date'), ('donation_date',)],
+    'inventory': [],
+    'inventory_transactions': [('blood_group', 'created_at'), ('created_at',)]
+}
+
+
+def encode_cursor(last_key):
+    """Encode a page position as an opaque URL-safe token"""
+    if last_key is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(last_key, default=str).encode()).decode()
+
+
+def decode_cursor(token):
+    return json.loads(base64.urlsafe_b64decode(token.encode()))
+
+
+def page_sort_key(store, field=None):
+    """Attribute a page of `store` (optionally narrowed to one `field` value) is ordered by, newest first"""
+    if field is not None:
+        return QUERIES.get(store, {}).get(field)
+    return PAGE_ORDER.get(store)
+
+
+class Repository:
+    """Storage interface; the defaults build every query from get/put/scan"""
+
+    name = None
+
+    def __init__(self):
+        self.indexes = {store: set() for store in STORES}
+
+    def has_index(self, store, field):
+        """Whether find(store, field, ...) is served from an index rather than a scan"""
+        return field in self.indexes.get(store, ())
+
+    # ---------- Items ----------
+
+    def get(self, store, key):
+        """One item by primary key, or None"""
+        raise NotImplementedError
+
+    def get_many(self, store, keys):
+        """Items for `keys` that exist, in the order of `keys`"""
+        items = (self.get(store, key) for key in keys)
+        return [item for item in items if item is not None]
+
+    def put(self, store, item):
+        """Insert or replace an item; returns False if the write failed"""
+        raise NotImplementedError
+
+    def put_many(self, store, items):
+        """Insert or replace many items, batched where the backend can"""
+        return all([self.put(store, item) for item in items])
+
+    def increment(self, store, key, field, delta, minimum=None):
+        """
+        Atomically add `delta` to a numeric field, creating the item if needed
+        With `minimum`, only applies if the field is >= minimum beforehand; returns False when it is not
+        """
+        raise NotImplementedError
+
+    def append(self, store, key, field, values):
+        """Atomically extend a list field, creating the item if needed"""
+        raise NotImplementedError
+
+    # ---------- Queries ----------
+
+    def scan(self, store):
+        """Every item of a store"""
+        raise NotImplementedError
+
+    def find(self, store, field, value):
+        """Items whose `field` equals `value`"""
+        return [item for item in self.scan(store) if item.get(field) == value]
+
+    def find_donors(self, blood_groups, active_only=True):
+        """Donors of any of `blood_groups`, only available, active ones by default (the matching query)"""
+        donors = []
+        for blood_group in blood_groups:
+            for donor in self.find('donors', 'blood_group', blood_group):
+                if not active_only or (donor.get('available') and donor.get('status') == 'active'):
+                    donors.append(donor)
+        return donors
+
+    def count(self, store):
+        """Number of items in a store"""
+        return len(self.scan(store))
+
+    def page(self, store, cursor=None, limit=50, field=None, value=None):
+        """
+        One page of items, newest first where the store has a page order, and the cursor of the next
+        With `field`/`value`, only items whose field equals value
+        """
+        items = self.find(store, field, value) if field else self.scan(store)
+        sort_key = page_sort_key(store, field)
+        if sort_key:
+            items = sorted(items, key=lambda item: item.get(sort_key) or '', reverse=True)
+        start = int(cursor or 0)
+        next_cursor = str(start + limit) if start + limit < len(items) else None
+        return items[start:start + limit], next_cursor
+
+    def dashboard_page(self, store, cursor=None, limit=50, field=None, value=None):
+        """
+        page() plus the admin dashboard's pager info: {'page', 'pages', 'total', 'prev', 'next'}
+        Cursors only go forward, so 'prev' returns to the first page and page numbers are unknown
+        """
+        items, next_cursor = self.page(store, cursor, limit, field, value)
+        return items, {'page': None, 'pages': None, 'total': None, 'prev': '' if cursor else None, 'next': next_cursor}
+
+    def rank_donors(self, request_data, today, point=None, radius_km=None, k=None, limit=10, locate=None):
+        """
+        Score the available, active donors who can give to a request (the matching query)
+        Returns (donors with match_score and can_donate_now, number of compatible donors): the `limit`
+        best scores, or with `point` and `k` the k nearest placed donors, nearest first. With `point`,
+        donors that `locate(pincode)` places within `radius_km` (any distance if None) get a distance_km,
+        and donors it can't place fall back to the request's location text
+        """
+        location = (request_data.get('location') or '').lower()
+        blood_groups = groups_in(compatible_donor_mask(request_data['blood_group'],
+                                                       request_data.get('component', DEFAULT_COMPONENT)))
+        compatible = []
+        for donor in self.find_donors(blood_groups):
+            donor_point = locate(donor.get('pincode')) if point and locate else None
+            if donor_point:
+                distance = haversine_km(point[0], point[1], donor_point[0], donor_point[1])
+                if radius_km is None or distance <= radius_km:
+                    compatible.append({**donor, 'distance_km': round(distance, 1)})
+            elif location:
+                if location in (donor.get('city', '').lower() + donor.get('state', '').lower()):
+                    compatible.append(donor)
+            elif not point:
+                compatible.append(donor)
+
+        # Best score first, most recent donation first among equal scores
+        compatible.sort(key=lambda donor: donor.get('last_donation') or '1900-01-01', reverse=True)
+        scored = [{**donor, 'match_score': calculate_donor_eligibility(donor, today),
+                   'can_donate_now': can_donate(donor, today)} for donor in compatible]
+        if point and k is not None:
+            ranked = sorted((donor for donor in scored if 'distance_km' in donor),
+                            key=lambda donor: donor['distance_km'])[:k]
+        else:
+            ranked = sorted(scored, key=lambda donor: donor['match_score'], reverse=True)[:limit]
+        return ranked, len(scored)
+
+
+class MemoryRepository(Repository):
+    """
+    Process-local stores with a hash index for every lookup in QUERIES, and a sorted index for every
+    newest-first page order, so a page is a slice rather than a sort of the store
+    """
+
+    name = 'memory'
+
+    def __init__(self):
+        super().__init__()
+        self.stores = {store: {} for store in STORES}
+        self.indexes = {store: set(QUERIES.get(store, ())) for store in STORES}
+        # {store: {field: {value: {key: None}}}}, dicts kept in insertion order
+        self.hash_indexes = {store: {field: {} for field in fields} for store, fields in self.indexes.items()}
+        # {store: {field: {value: SortedList((sort value, key))}}}; field None holds the whole store under None
+        self.sorted_indexes = {store: {field: {} for field in (None, *QUERIES.get(store, ()))
+                                       if page_sort_key(store, field)}
+                               for store in STORES}
+        self.lock = threading.RLock()
+
+    def get(self, store, key):
+        return self.stores[store].get(key)
+
+    def put(self, store, item):
+        key = item[STORES[store]]
+        with self.lock:
+            old = self.stores[store].get(key)
+            for field, index in self.hash_indexes[store].items():
+                if old is not None and old.get(field) != item.get(field):
+                    index.get(old.get(field), {}).pop(key, None)
+                index.setdefault(item.get(field), {})[key] = None
+            for field, index in self.sorted_indexes[store].items():
+                sort_key = page_sort_key(store, field)
+                if old is not None:
+                    entries = index.get(field and old.get(field))
+                    if entries is not None:
+                        entries.discard((old.get(sort_key) or '', key))
+                index.setdefault(field and item.get(field), SortedList()).add((item.get(sort_key) or '', key))
+            self.stores[store][key] = item
+        return True
+
+    def increment(self, store, key, field, delta, minimum=None):
+        with self.lock:
+            item = self.stores[store].get(key)
+            if item is None:
+                item = {STORES[store]: key}
+                self.put(store, item)
+            if minimum is not None and item.get(field, 0) < minimum:
+                return False
+            item[field] = item.get(field, 0) + delta
+            return True
+
+    def append(self, store, key, field, values):
+        with self.lock:
+            item = self.stores[store].get(key)
+            if item is None:
+                item = {STORES[store]: key}
+                self.put(store, item)
+            item.setdefault(field, []).extend(values)
+
+    def scan(self, store):
+        return list(self.stores[store].values())
+
+    def find(self, store, field, value):
+        index = self.hash_indexes[store].get(field)
+        if index is None:
+            return super().find(store, field, value)
+        items = self.stores[store]
+        return [items[key] for key in list(index.get(value, ()))]
+
+    def count(self, store):
+        return len(self.stores[store])
+
+    def page(self, store, cursor=None, limit=50, field=None, value=None):
+        """Newest-first pages sliced off a sorted index; the cursor holds the last item's sort value and key"""
+        index = self.sorted_indexes[store].get(field)
+        if index is None:
+            return super().page(store, cursor, limit, field, value)
+        with self.lock:
+            entries = index.get(field and value)
+            if not entries:
+                return [], None
+            if cursor:
+                position = decode_cursor(cursor)
+                end = entries.bisect_left((position['sort'], position['key']))
+            else:
+                end = len(entries)
+            start = max(0, end - limit)
+            page = list(reversed(entries[start:end]))
+            items = [self.stores[store][key] for _, key in page]
+        next_cursor = encode_cursor({'sort': page[-1][0], 'key': page[-1][1]}) if start > 0 and page else None
+        return items, next_cursor
+
+
+class SQLiteRepository(Repository):
+    """
+    One SQLite database file in WAL mode, one table per store
+    Rows hold the msgpack-encoded item plus a copy of every column in SQLITE_INDEXES, which find(),
+    find_donors() and page() query through those indexes. WAL lets a pool of up to `readers` connections
+    read while one writer connection (serialized by a lock, and across processes by SQLite's own write
+    lock) commits. SQL text is fixed per store, so sqlite3's per-connection statement cache keeps every
+    query, the matching query included, prepared.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path='hemalink.db', readers=8, busy_timeout=30.0, cache_mb=64):
+        super().__init__()
+        self.path = path
+        self.readers = readers
+        self.busy_timeout = busy_timeout
+        self.cache_mb = cache_mb
+        self.columns = {store: list(dict.fromkeys(field for index in SQLITE_INDEXES[store] for field in index))
+                        for store in STORES}
+        self.indexes = {store: set(columns) for store, columns in self.columns.items()}
+        self.sql = {store: self._statements(store) for store in STORES}
+        self.match_sql = {}
+        self.pool = queue.LifoQueue()
+        self.opened = 0
+        self.pool_lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.writer = self._connect()
+        self.writer.execute('PRAGMA journal_mode=WAL')
+        with self._write() as conn:
+            for store in STORES:
+                self._create(conn, store)
+
+    def _statements(self, store):
+        columns = self.columns[store]
+        names = ', '.join(['key', 'data'] + columns)
+        updates = ', '.join(f'{column} = excluded.{column}' for column in ['data'] + columns)
+        return {
+            'get': f'SELECT data FROM {store} WHERE key = ?',
+            'upsert': f'INSERT INTO {store} ({names}) VALUES ({", ".join("?" * (len(columns) + 2))}) '
+                      f'ON CONFLICT(key) DO UPDATE SET {updates}',
+            'scan': f'SELECT data FROM {store} ORDER BY rowid',
+            'count': f'SELECT COUNT(*) FROM {store}',
+            'find': {column: f'SELECT data FROM {store} WHERE {column} IS ? ORDER BY rowid' for column in columns}
+        }
+
+    def _create(self, conn, store):
+        columns = ''.join(f', {column}' for column in self.columns[store])
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {store} (key TEXT PRIMARY KEY, data BLOB NOT NULL{columns})')
+        for index in SQLITE_INDEXES[store]:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {store}_{"_".join(index)} ON {store} ({", ".join(index)})')
+
+    def _connect(self, read_only=False):
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                               check_same_thread=False, cached_statements=256)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{self.cache_mb * 1024}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        if read_only:
+            conn.execute('PRAGMA query_only=1')
+        return conn
+
+    @contextmanager
+    def _read(self):
+        """Borrow a reader connection, opening one while fewer than `readers` exist"""
+        try:
+            conn = self.pool.get_nowait()
+        except queue.Empty:
+            with self.pool_lock:
+                open_one = self.opened < self.readers
+                if open_one:
+                    self.opened += 1
+            conn = self._connect(read_only=True) if open_one else self.pool.get()
+        try:
+            yield conn
+        finally:
+            self.pool.put(conn)
+
+    @contextmanager
+    def _write(self):
+        """The writer connection inside one IMMEDIATE transaction, committed on success"""
+        with self.write_lock:
+            self.writer.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.writer
+            except BaseException:
+                self.writer.execute('ROLLBACK')
+                raise
+            self.writer.execute('COMMIT')
+
+    def close(self):
+        with self.write_lock:
+            self.writer.close()
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    @staticmethod
+    def _encode(item):
+        return msgpack.packb(item, use_bin_type=True, default=str)
+
+    @staticmethod
+    def _decode(data):
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+    @staticmethod
+    def _column_value(value):
+        return value if value is None or isinstance(value, (str, int, float)) else str(value)
+
+    def _row(self, store, item):
+        # Sort columns hold '' rather than NULL, so keyset comparisons see every row (as page() in memory does)
+        return ([item[STORES[store]], self._encode(item)] +
+                [self._column_value(item.get(column) or '' if column in SORT_KEYS else item.get(column))
+                 for column in self.columns[store]])
+
+    def _query(self, sql, params=()):
+        with self._read() as conn:
+            return [self._decode(row[0]) for row in conn.execute(sql, params)]
+
+    # ---------- Items ----------
+
+    def get(self, store, key):
+        with self._read() as conn:
+            row = conn.execute(self.sql[store]['get'], (key,)).fetchone()
+        return self._decode(row[0]) if row else None
+
+    def get_many(self, store, keys):
+        keys = list(keys)
+        found = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            with self._read() as conn:
+                rows = conn.execute(f'SELECT key, data FROM {store} WHERE key IN ({", ".join("?" * len(chunk))})',
+                                    chunk).fetchall()
+            found.update((key, self._decode(data)) for key, data in rows)
+        return [found[key] for key in keys if key in found]
+
+    def put(self, store, item):
+        with self._write() as conn:
+            conn.execute(self.sql[store]['upsert'], self._row(store, item))
+        return True
+
+    def put_many(self, store, items):
+        """All items in one transaction"""
+        with self._write() as conn:
+            conn.executemany(self.sql[store]['upsert'], (self._row(store, item) for item in items))
+        return True
+
+    def increment(self, store, key, field, delta, minimum=None):
+        """Read-modify-write inside the writer's IMMEDIATE transaction"""
+        with self._write() as conn:
+            row = conn.execute(self.sql[store]['get'], (key,)).fetchone()
+            item = self._decode(row[0]) if row else {STORES[store]: key}
+            if minimum is not None and item.get(field, 0) < minimum:
+                return False
+            item[field] = item.get(field, 0) + delta
+            conn.execute(self.sql[store]['upsert'], self._row(store, item))
+        return True
+
+    def append(self, store, key, field, values):
+        with self._write() as conn:
+            row = conn.execute(self.sql[store]['get'], (key,)).fetchone()
+            item = self._decode(row[0]) if row else {STORES[store]: key}
+            item.setdefault(field, []).extend(values)
+            conn.execute(self.sql[store]['upsert'], self._row(store, item))
+
+    # ---------- Queries ----------
+
+    def scan(self, store):
+        return self._query(self.sql[store]['scan'])
+
+    def find(self, store, field, value):
+        sql = self.sql[store]['find'].get(field)
+        if sql is None:
+            return super().find(store, field, value)
+        return self._query(sql, (self._column_value(value),))
+
+    def find_donors(self, blood_groups, active_only=True):
+        """One query on the (blood_group, status, available) index, one statement per number of groups"""
+        blood_groups = list(blood_groups)
+        sql_key = (len(blood_groups), active_only)
+        sql = self.match_sql.get(sql_key)
+        if sql is None:
+            sql = f'SELECT data FROM donors WHERE blood_group IN ({", ".join("?" * len(blood_groups))})'
+            if active_only:
+                sql += " AND status = 'active' AND available = 1"
+            self.match_sql[sql_key] = sql
+        return self._query(sql, blood_groups)
+
+    def count(self, store):
+        with self._read() as conn:
+            return conn.execute(self.sql[store]['count']).fetchone()[0]
+
+    def page(self, store, cursor=None, limit=50, field=None, value=None):
+        """
+        Keyset pages: the cursor holds the last row's sort value and rowid, so every page is an index range
+        scan however deep it is
+        """
+        if field and field not in self.indexes[store]:
+            return super().page(store, cursor, limit, field, value)
+        sort_key = page_sort_key(store, field)
+        where, params = [], []
+        if field:
+            where.append(f'{field} IS ?')
+            params.append(self._column_value(value))
+        if cursor:
+            position = decode_cursor(cursor)
+            if sort_key:
+                where.append(f'({sort_key}, rowid) < (?, ?)')
+                params += [position['sort'], position['rowid']]
+            else:
+                where.append('rowid > ?')
+                params.append(position['rowid'])
+        order = f'{sort_key} DESC, rowid DESC' if sort_key else 'rowid'
+        sql = (f'SELECT rowid, data, {sort_key or "NULL"} FROM {store}'
+               f'{" WHERE " + " AND ".join(where) if where else ""} ORDER BY {order} LIMIT ?')
+        with self._read() as conn:
+            rows = conn.execute(sql, params + [limit + 1]).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor({'sort': rows[-1][2], 'rowid': rows[-1][0]})
+        return [self._decode(row[1]) for row in rows], next_cursor
+
+
+class DynamoDBRepository(Repository):
+    """
+    One DynamoDB table per store
+    `index_names` maps {store: {field: GSI name}}; those lookups are queries, others filtered scans.
+    `page_index_names` maps {store: GSI name} for the sparse indexes that order unfiltered pages
+    (partition key PAGE_PARTITION_KEY, sort key PAGE_ORDER[store]); items of those stores are written
+    with the partition key and read back without it. All of a store's items share one index partition,
+    which is plenty for dashboard paging but caps that index at one partition's write throughput.
+    """
+
+    name = 'dynamodb'
+
+    def __init__(self, table_names, index_names=None, page_index_names=None, region=None, endpoint_url=None,
+                 scan_segments=4):
+        super().__init__()
+        session = boto3.Session(region_name=region)
+        self.dynamodb = session.resource('dynamodb', endpoint_url=endpoint_url)
+        self.client = session.client('dynamodb', endpoint_url=endpoint_url)
+        self.tables = {store: self.dynamodb.Table(name) for store, name in table_names.items()}
+        self.index_names = index_names or {}
+        self.indexes = {store: set(self.index_names.get(store, ())) for store in STORES}
+        self.page_index_names = page_index_names or {}
+        self.scan_segments = scan_segments
+
+    def check(self):
+        """Raise if DynamoDB can't be reached with the configured credentials"""
+        self.client.list_tables(Limit=1)
+
+    def _stored(self, store, item):
+        """The item as written: with the page partition key when the store has a page index"""
+        return {**item, PAGE_PARTITION_KEY: PAGE_PARTITION} if store in self.page_index_names else item
+
+    @staticmethod
+    def _loaded(item):
+        """The item as returned to callers, without the page partition key"""
+        if item is not None:
+            item.pop(PAGE_PARTITION_KEY, None)
+        return item
+
+    # ---------- Items ----------
+
+    def get(self, store, key):
+        try:
+            return self._loaded(self.tables[store].get_item(Key={STORES[store]: key}).get('Item'))
+        except ClientError as e:
+            print(f"DynamoDB get_item error: {e}")
+            return None
+
+    def get_many(self, store, keys):
+        """Fetch items by primary key, 100 keys per BatchGetItem call"""
+        keys = list(keys)
+        table = self.tables[store]
+        key_name = STORES[store]
+        found = {}
+        for start in range(0, len(keys), 100):
+            request_items = {table.name: {'Keys': [{key_name: key} for key in keys[start:start + 100]]}}
+            try:
+                while request_items:
+                    resp = self.dynamodb.batch_get_item(RequestItems=request_items)
+                    for item in resp.get('Responses', {}).get(table.name, []):
+                        found[item[key_name]] = self._loaded(item)
+                    request_items = resp.get('UnprocessedKeys')
+            except ClientError as e:
+                print(f"DynamoDB batch_get_item error: {e}")
+        return [found[key] for key in keys if key in found]
+
+    def put(self, store, item):
+        try:
+            self.tables[store].put_item(Item=self._stored(store, item))
+            return True
+        except ClientError as e:
+            print(f"DynamoDB put_item error: {e}")
+            return False
+
+    def put_many(self, store, items):
+        """Write through a batch writer (25 items per request)"""
+        try:
+            with self.tables[store].batch_writer() as batch:
+                for item in items:
+                    batch.put_item(Item=self._stored(store, item))
+            return True
+        except ClientError as e:
+            print(f"DynamoDB batch_write_item error: {e}")
+            return False
+
+    def increment(self, store, key, field, delta, minimum=None):
+        """UpdateItem ADD, conditional on the current value with `minimum`"""
+        kwargs = {
+            'Key': {STORES[store]: key},
+            'UpdateExpression': 'ADD #field :delta',
+            'ExpressionAttributeNames': {'#field': field},
+            'ExpressionAttributeValues': {':delta': delta},
+        }
+        if minimum is not None:
+            kwargs['ConditionExpression'] = '#field >= :minimum'
+            kwargs['ExpressionAttributeValues'][':minimum'] = minimum
+        try:
+            self.tables[store].update_item(**kwargs)
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                print(f"DynamoDB update_item error: {e}")
+            return False
+
+    def append(self, store, key, field, values):
+        """UpdateItem list_append, so the rest of the item is not rewritten"""
+        try:
+            self.tables[store].update_item(
+                Key={STORES[store]: key},
+                UpdateExpression='SET #field = list_append(if_not_exists(#field, :empty), :values)',
+                ExpressionAttributeNames={'#field': field},
+                ExpressionAttributeValues={':empty': [], ':values': list(values)},
+            )
+        except ClientError as e:
+            print(f"DynamoDB update_item error: {e}")
+
+    # ---------- Queries ----------
+
+    def _iter_pages(self, operation, **kwargs):
+        """Yield items of a scan or query, fetching pages lazily via LastEvaluatedKey"""
+        while True:
+            resp = operation(**kwargs)
+            yield from map(self._loaded, resp.get('Items', []))
+            last_key = resp.get('LastEvaluatedKey')
+            if not last_key:
+                return
+            kwargs['ExclusiveStartKey'] = last_key
+
+    def _scan(self, store, filter_expression=None):
+        """Scan all segments of a table concurrently"""
+        table = self.tables[store]
+        kwargs = {} if filter_expression is None else {'FilterExpression': filter_expression}
+        if self.scan_segments <= 1:
+            return list(self._iter_pages(table.scan, **kwargs))
+        items = []
+        with ThreadPoolExecutor(max_workers=self.scan_segments) as pool:
+            futures = [
+                pool.submit(lambda segment: list(self._iter_pages(table.scan, Segment=segment,
+                                                                  TotalSegments=self.scan_segments, **kwargs)),
+                            segment)
+                for segment in range(self.scan_segments)
+            ]
+            for future in as_completed(futures):
+                items.extend(future.result())
+        return items
+
+    def scan(self, store):
+        try:
+            return self._scan(store)
+        except ClientError as e:
+            print(f"DynamoDB scan error: {e}")
+            return []
+
+    def find(self, store, field, value):
+        """GSI query when the lookup has an index (falling back to a scan if it is missing), else a filtered scan"""
+        index_name = self.index_names.get(store, {}).get(field)
+        try:
+            if index_name:
+                try:
+                    return list(self._iter_pages(self.tables[store].query, IndexName=index_name,
+                                                 KeyConditionExpression=Key(field).eq(value)))
+                except ClientError as e:
+                    print(f"DynamoDB query error on {index_name} (falling back to scan): {e}")
+            return self._scan(store, Attr(field).eq(value))
+        except ClientError as e:
+            print(f"DynamoDB scan error: {e}")
+            return []
+
+    def count(self, store):
+        """Count with a Select=COUNT scan, which reads every item but returns none of them"""
+        kwargs = {'Select': 'COUNT'}
+        total = 0
+        try:
+            while True:
+                resp = self.tables[store].scan(**kwargs)
+                total += resp['Count']
+                if not resp.get('LastEvaluatedKey'):
+                    return total
+                kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+        except ClientError as e:
+            print(f"DynamoDB scan error: {e}")
+            return 0
+
+    def page(self, store, cursor=None, limit=50, field=None, value=None):
+        """
+        A GSI query page in descending sort-key order (newest first): the field's index when narrowed to one
+        value, the store's page index otherwise. Without an index, stores with a page order are sorted from
+        a scan and the rest page through a scan in table order.
+        """
+        if field:
+            index_name = self.index_names.get(store, {}).get(field)
+            key_condition = Key(field).eq(value)
+        else:
+            index_name = self.page_index_names.get(store)
+            key_condition = Key(PAGE_PARTITION_KEY).eq(PAGE_PARTITION)
+        if not index_name and (field or page_sort_key(store)):
+            return super().page(store, cursor, limit, field, value)
+        kwargs = {'Limit': limit}
+        if cursor:
+            kwargs['ExclusiveStartKey'] = decode_cursor(cursor)
+        try:
+            table = self.tables[store]
+            if index_name:
+                resp = table.query(IndexName=index_name, KeyConditionExpression=key_condition,
+                                   ScanIndexForward=False, **kwargs)
+            else:
+                resp = table.scan(**kwargs)
+        except ClientError as e:
+            print(f"DynamoDB page fetch error: {e}")
+            return [], None
+        return [self._loaded(item) for item in resp.get('Items', [])], encode_cursor(resp.get('LastEvaluatedKey'))
+
+
+class CachedRepository(Repository):
+    """
+    Any repository behind a cache.ReadThroughCache: items, scans and lookups are read through it,
+    and every write drops the item's cached copy and all cached scans and lookups of its store
+    """
+
+    def __init__(self, inner, cache):
+        super().__init__()
+        self.inner = inner
+        self.cache = cache
+        self.name = inner.name
+        self.indexes = inner.indexes
+
+    def _item_key(self, store, key):
+        return f"{store}:item:{json.dumps(key, default=str)}"
+
+    def _invalidate(self, store, keys=()):
+        self.cache.invalidate(*[self._item_key(store, key) for key in keys], group=store)
+
+    def get(self, store, key):
+        return self.cache.get(self._item_key(store, key), lambda: self.inner.get(store, key))
+
+    def get_many(self, store, keys):
+        return self.inner.get_many(store, keys)
+
+    def put(self, store, item):
+        try:
+            return self.inner.put(store, item)
+        finally:
+            self._invalidate(store, [item[STORES[store]]])
+
+    def put_many(self, store, items):
+        try:
+            return self.inner.put_many(store, items)
+        finally:
+            self._invalidate(store, [item[STORES[store]] for item in items])
+
+    def increment(self, store, key, field, delta, minimum=None):
+        try:
+            return self.inner.increment(store, key, field, delta, minimum)
+        finally:
+            # Also after a failed condition: the cached value was evidently stale
+            self._invalidate(store, [key])
+
+    def append(self, store, key, field, values):
+        try:
+            return self.inner.append(store, key, field, values)
+        finally:
+            self._invalidate(store, [key])
+
+    def scan(self, store):
+        return self.cache.get(f"{store}:scan", lambda: self.inner.scan(store), group=store)
+
+    def find(self, store, field, value):
+        return self.cache.get(f"{store}:find:{field}={value}", lambda: self.inner.find(store, field, value),
+                              group=store)
+
+    def find_donors(self, blood_groups, active_only=True):
+        return self.cache.get(f"donors:find_donors:{','.join(blood_groups)}:{active_only}",
+                              lambda: self.inner.find_donors(blood_groups, active_only), group='donors')
+
+    def count(self, store):
+        return self.cache.get(f"{store}:count", lambda: self.inner.count(store), group=store)
+
+    def page(self, store, cursor=None, limit=50, field=None, value=None):
+        return self.inner.page(store, cursor, limit, field, value)
+
+
+def open_repository(kind, **options):
+    """Create the storage backend named `kind` ('memory', 'sqlite' or 'dynamodb')"""
+    if kind == 'memory':
+        return MemoryRepository()
+    if kind == 'sqlite':
+        return SQLiteRepository(**options)
+    if kind == 'dynamodb':
+        if boto3 is None:
+            raise RuntimeError('the dynamodb storage backend needs boto3')
+        return DynamoDBRepository(**options)
+    raise ValueError(f"Unknown storage backend: {kind}")
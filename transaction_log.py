@@ -0,0 +1,238 @@
+"""
+HemaLink - Compact inventory transaction log with daily and hourly rollups
+
+Transactions are stored column by column in one partition per day:
+epoch seconds, blood group and transaction type as small ints, units,
+and the free-text details. Every append also updates that day's rollups,
+the transaction count and units per blood group and type, kept as a
+daily (groups x types x 2) and an hourly (24 x groups x types x 2)
+NumPy array.
+
+Retention: raw partitions older than `raw_days` and hourly rollups older
+than `hourly_days` are dropped as new days start, counted back from the
+newest day in the log. Daily rollups are kept for good (a few hundred
+bytes a day). Totals over a date range add up one small array per day,
+so "units of O- withdrawn in the last 7 days" costs O(days) however many
+transactions there were.
+
+Days are date ordinals (date.toordinal()) in server local time.
+"""
+import threading
+from array import array
+from datetime import datetime
+
+import numpy as np
+from sortedcontainers import SortedList
+
+# Rollup fields, along the last axis of the rollup arrays
+COUNT, UNITS = 0, 1
+
+
+class DayPartition:
+    """One day of raw transactions, as parallel columns"""
+
+    __slots__ = ('timestamps', 'groups', 'types', 'units', 'details')
+
+    def __init__(self):
+        self.timestamps = array('q')
+        self.groups = array('b')
+        self.types = array('b')
+        self.units = array('q')
+        self.details = []
+
+    def __len__(self):
+        return len(self.timestamps)
+
+
+class TransactionLog:
+    """Append-only, day-partitioned transaction store with rollups and retention"""
+
+    def __init__(self, blood_groups, transaction_types, raw_days=90, hourly_days=400):
+        self.blood_groups = list(blood_groups)
+        self.group_code = {bg: i for i, bg in enumerate(self.blood_groups)}
+        self.transaction_types = list(transaction_types)
+        self.type_code = {t: i for i, t in enumerate(self.transaction_types)}
+        self.raw_days = raw_days
+        self.hourly_days = hourly_days
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.partitions = {}
+        self.daily = {}
+        self.hourly = {}
+        self.days = SortedList()
+        self.row_count = 0
+        # Sequence number of the next append, so replaying an already-applied transaction can be detected
+        self.sequence = 0
+
+    def __len__(self):
+        """Number of raw transactions still retained"""
+        return self.row_count
+
+    def _shape(self):
+        return (len(self.blood_groups), len(self.transaction_types), 2)
+
+    # ---------- Writes ----------
+
+    def append(self, timestamp, blood_group, transaction_type, units, details='', sequence=None):
+        """
+        Record a transaction at `timestamp` (epoch seconds) and return its sequence number
+        Pass the `sequence` a logged transaction had when replaying it; already-applied ones are skipped
+        """
+        group = self.group_code[blood_group]
+        kind = self.type_code[transaction_type]
+        moment = datetime.fromtimestamp(timestamp)
+        day = moment.toordinal()
+        with self.lock:
+            if sequence is None:
+                sequence = self.sequence
+            elif sequence < self.sequence:
+                return sequence
+            self.sequence = sequence + 1
+            if day not in self.daily:
+                self._start_day(day)
+            partition = self.partitions.get(day)
+            if partition is not None:
+                partition.timestamps.append(int(timestamp))
+                partition.groups.append(group)
+                partition.types.append(kind)
+                partition.units.append(units)
+                partition.details.append(details)
+                self.row_count += 1
+            daily = self.daily[day]
+            daily[group, kind, COUNT] += 1
+            daily[group, kind, UNITS] += units
+            hourly = self.hourly.get(day)
+            if hourly is not None:
+                hourly[moment.hour, group, kind, COUNT] += 1
+                hourly[moment.hour, group, kind, UNITS] += units
+            return sequence
+
+    def _start_day(self, day):
+        """Add a day's partition and rollups, then apply retention"""
+        newest = max(day, self.days[-1]) if self.days else day
+        self.days.add(day)
+        self.daily[day] = np.zeros(self._shape(), dtype=np.int64)
+        if day > newest - self.hourly_days:
+            self.hourly[day] = np.zeros((24,) + self._shape(), dtype=np.int64)
+        if day > newest - self.raw_days:
+            self.partitions[day] = DayPartition()
+        self._expire(newest)
+
+    def _expire(self, newest):
+        for old_day in [d for d in self.partitions if d <= newest - self.raw_days]:
+            self.row_count -= len(self.partitions.pop(old_day))
+        for old_day in [d for d in self.hourly if d <= newest - self.hourly_days]:
+            del self.hourly[old_day]
+
+    # ---------- Reads ----------
+
+    def records(self, start=None, end=None, blood_group=None):
+        """Yield retained transactions as dicts for days `start` to `end` (inclusive), oldest first"""
+        group = self.group_code.get(blood_group) if blood_group else None
+        if blood_group and group is None:
+            return
+        with self.lock:
+            days = list(self.days.irange(start, end))
+        for day in days:
+            partition = self.partitions.get(day)
+            if partition is None:
+                continue
+            for i in range(len(partition)):
+                if group is not None and partition.groups[i] != group:
+                    continue
+                yield {
+                    'timestamp': datetime.fromtimestamp(partition.timestamps[i]).strftime('%Y-%m-%d %H:%M:%S'),
+                    'blood_group': self.blood_groups[partition.groups[i]],
+                    'units': partition.units[i],
+                    'type': self.transaction_types[partition.types[i]],
+                    'details': partition.details[i]
+                }
+
+    def _select(self, rollup, blood_group, transaction_type):
+        """Narrow a rollup array to one blood group and/or type, summing the rest"""
+        if blood_group:
+            rollup = rollup[..., self.group_code[blood_group], :, :]
+        else:
+            rollup = rollup.sum(axis=-3)
+        if transaction_type:
+            return rollup[..., self.type_code[transaction_type], :]
+        return rollup.sum(axis=-2)
+
+    def _sum_days(self, start, end):
+        total = np.zeros(self._shape(), dtype=np.int64)
+        with self.lock:
+            for day in self.days.irange(start, end):
+                total += self.daily[day]
+        return total
+
+    def totals(self, start=None, end=None, blood_group=None, transaction_type=None):
+        """(count, units) over days `start` to `end` (inclusive), from the daily rollups"""
+        count, units = self._select(self._sum_days(start, end), blood_group, transaction_type)
+        return int(count), int(units)
+
+    def totals_by_group(self, start=None, end=None, transaction_type=None):
+        """{blood_group: (count, units)} over days `start` to `end` (inclusive)"""
+        total = self._sum_days(start, end)
+        return {bg: tuple(int(v) for v in self._select(total, bg, transaction_type)) for bg in self.blood_groups}
+
+    def daily_series(self, start, end, blood_group=None, transaction_type=None):
+        """[(day, count, units)] for every day from `start` to `end`, zeros where nothing happened"""
+        series = []
+        for day in range(start, end + 1):
+            rollup = self.daily.get(day)
+            count, units = self._select(rollup, blood_group, transaction_type) if rollup is not None else (0, 0)
+            series.append((day, int(count), int(units)))
+        return series
+
+    def hourly_series(self, start, end, blood_group=None, transaction_type=None):
+        """[(day, hour, count, units)] for days still covered by hourly rollups"""
+        series = []
+        for day in range(start, end + 1):
+            rollup = self.hourly.get(day)
+            if rollup is None and day in self.daily:
+                continue
+            hours = self._select(rollup, blood_group, transaction_type) if rollup is not None else np.zeros((24, 2))
+            series.extend((day, hour, int(count), int(units)) for hour, (count, units) in enumerate(hours))
+        return series
+
+    # ---------- Snapshots ----------
+
+    def to_state(self):
+        """Plain, msgpack-able copy of the log"""
+        with self.lock:
+            return {
+                'blood_groups': self.blood_groups,
+                'transaction_types': self.transaction_types,
+                'sequence': self.sequence,
+                'partitions': {
+                    day: [p.timestamps.tobytes(), p.groups.tobytes(), p.types.tobytes(), p.units.tobytes(),
+                          list(p.details)]
+                    for day, p in self.partitions.items()
+                },
+                'daily': {day: rollup.tobytes() for day, rollup in self.daily.items()},
+                'hourly': {day: rollup.tobytes() for day, rollup in self.hourly.items()}
+            }
+
+    def load_state(self, state):
+        """Replace the contents with a to_state() copy, then apply this log's retention"""
+        with self.lock:
+            self.clear()
+            if state['blood_groups'] != self.blood_groups or state['transaction_types'] != self.transaction_types:
+                raise ValueError('transaction log snapshot has different blood groups or types')
+            for day, columns in state['partitions'].items():
+                partition = DayPartition()
+                for column, data in zip(('timestamps', 'groups', 'types', 'units'), columns):
+                    getattr(partition, column).frombytes(data)
+                partition.details = columns[4]
+                self.partitions[day] = partition
+                self.row_count += len(partition)
+            for day, data in state['daily'].items():
+                self.daily[day] = np.frombuffer(data, dtype=np.int64).reshape(self._shape()).copy()
+            for day, data in state['hourly'].items():
+                self.hourly[day] = np.frombuffer(data, dtype=np.int64).reshape((24,) + self._shape()).copy()
+            self.days.update(self.daily)
+            self.sequence = state['sequence']
+            if self.days:
+                self._expire(self.days[-1])